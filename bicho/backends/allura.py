@@ -22,7 +22,8 @@
 from bicho.config import Config
 
 from bicho.backends import Backend
-from bicho.utils import create_dir, printdbg, printout, printerr
+from bicho.utils import create_dir, printdbg, printout, printerr, \
+    urlopen, wait_delay
 from bicho.db.database import DBIssue, DBBackend, get_database
 from bicho.common import Tracker, Issue, People, Change
 
@@ -35,7 +36,6 @@ import os
 import pprint
 import random
 import sys
-import time
 import traceback
 import urllib
 import feedparser
@@ -131,7 +131,54 @@ class DBAlluraIssueExtMySQL(DBAlluraIssueExt):
                     REFERENCES issues (id) \
                     ON DELETE CASCADE \
                     ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBAlluraIssueExtSQLite(DBAlluraIssueExt):
+    """
+    SQLite subclass of L{DBAlluraIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_allura ( \
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                    labels TEXT, \
+                    private BOOLEAN, \
+                    ticket_num INTEGER NOT NULL, \
+                    discussion_thread_url TEXT, \
+                    related_artifacts TEXT, \
+                    custom_fields TEXT, \
+                    mod_date DATETIME, \
+                    issue_id INTEGER NOT NULL, \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
+
+
+class DBAlluraIssueExtPostgreSQL(DBAlluraIssueExt):
+    """
+    PostgreSQL subclass of L{DBAlluraIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_allura ( \
+                    id SERIAL, \
+                    labels TEXT, \
+                    private BOOLEAN, \
+                    ticket_num INTEGER NOT NULL, \
+                    discussion_thread_url TEXT, \
+                    related_artifacts TEXT, \
+                    custom_fields TEXT, \
+                    mod_date TIMESTAMP, \
+                    issue_id INTEGER NOT NULL, \
+                    PRIMARY KEY(id), \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
 
 
 class DBAlluraBackend(DBBackend):
@@ -140,6 +187,8 @@ class DBAlluraBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBAlluraIssueExtMySQL]
+        self.SQLITE_EXT = [DBAlluraIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBAlluraIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
         """
@@ -243,7 +292,7 @@ class Allura():
         bug_number = bug_url.split('/')[-1]
 
         try:
-            f = urllib.urlopen(bug_url)
+            f = urlopen(bug_url)
 
             # f = urllib.urlopen(bug_url)
             json_ticket = f.read()
@@ -301,7 +350,7 @@ class Allura():
 
         printdbg("Analyzing issue changes" + changes_url)
 
-        d = feedparser.parse(changes_url)
+        d = feedparser.parse(urlopen(changes_url).read())
         changes = self.parse_changes(d)
 
         return changes
@@ -380,7 +429,7 @@ class Allura():
         self.url_issues += urllib.quote("mod_date_dt:[" + time_window + "]")
         printdbg("URL for getting metadata " + self.url_issues)
 
-        f = urllib.urlopen(self.url_issues)
+        f = urlopen(self.url_issues)
         ticketTotal = json.loads(f.read())
 
         total_issues = int(ticketTotal['count'])
@@ -404,7 +453,7 @@ class Allura():
 
             printdbg("URL for next issues " + self.url_issues)
 
-            f = urllib.urlopen(self.url_issues)
+            f = urlopen(self.url_issues)
 
             ticketList = json.loads(f.read())
 
@@ -421,7 +470,7 @@ class Allura():
                     bugsdb.insert_issue(issue_data, dbtrk.id)
                     remaining -= 1
                     print "Remaining time: ", (remaining) * Config.delay / 60, "m"
-                    time.sleep(self.delay)
+                    wait_delay()
                 except Exception, e:
                     printerr("Error in function analyze_bug " + issue_url)
                     traceback.print_exc(file=sys.stdout)
@@ -21,11 +21,13 @@
 #          Santiago Dueñas <sduenas@libresoft.es>
 #          Alvaro del Castillo <acs@bitergia.com>
 
+import collections
 import datetime
 import urllib
-import time
 import sys
 
+from multiprocessing.pool import ThreadPool
+
 from storm.locals import Int, DateTime, Unicode, Reference, Desc
 
 from dateutil.parser import parse
@@ -33,12 +35,30 @@ from bicho.common import Issue, People, Tracker, Comment, Change, Attachment
 from bicho.backends import Backend
 from bicho.db.database import DBIssue, DBBackend, DBTracker, get_database
 from bicho.config import Config
-from bicho.utils import printout, printerr, printdbg
+from bicho.utils import printout, printerr, printdbg, wait_delay
 
 from jira.client import JIRA
 
 import feedparser
 
+# number of issue keys of each range retrieved by a worker in
+# parallel mode
+KEYS_PER_RANGE = 500
+
+# checkpoints of a parallel import of a project: its ranges of keys
+# and the last update of the project when it started
+RANGE_CHECKPOINT = u'jira %s range '
+START_CHECKPOINT = u'jira %s start'
+RANGE_DONE = u'done'
+
+# fields of the issues read by BugsHandler.getIssue. Only these are
+# requested, so the custom fields of the instance are not downloaded.
+# The changelog is requested apart, expanding it.
+ISSUE_FIELDS = ['issuetype', 'summary', 'description', 'status',
+                'resolution', 'assignee', 'reporter', 'created', 'updated',
+                'environment', 'versions', 'components', 'votes', 'project',
+                'comment', 'attachment']
+
 
 
 class DBJiraIssueExt(object):
@@ -99,7 +119,68 @@ class DBJiraIssueExtMySQL(DBJiraIssueExt):
                        REFERENCES issues (id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBJiraIssueExtSQLite(DBJiraIssueExt):
+    """
+    SQLite subclass of L{DBJiraIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_jira ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_key VARCHAR(32) NOT NULL, \
+                     link VARCHAR(100) NOT NULL, \
+                     title VARCHAR(100) NOT NULL, \
+                     environment VARCHAR(35) NOT NULL, \
+                     security VARCHAR(35) NOT NULL, \
+                     updated DATETIME NOT NULL, \
+                     version VARCHAR(35) NOT NULL, \
+                     component VARCHAR(35) NOT NULL, \
+                     votes INTEGER, \
+                     project VARCHAR(35) NOT NULL, \
+                     project_id INTEGER, \
+                     project_key VARCHAR(35) NOT NULL, \
+                     status  VARCHAR(35) NOT NULL, \
+                     resolution VARCHAR(35) NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues (id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBJiraIssueExtPostgreSQL(DBJiraIssueExt):
+    """
+    PostgreSQL subclass of L{DBJiraIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_jira ( \
+                     id SERIAL, \
+                     issue_key TEXT NOT NULL, \
+                     link TEXT NOT NULL, \
+                     title TEXT NOT NULL, \
+                     environment TEXT NOT NULL, \
+                     security TEXT NOT NULL, \
+                     updated TIMESTAMP NOT NULL, \
+                     version TEXT NOT NULL, \
+                     component TEXT NOT NULL, \
+                     votes INTEGER, \
+                     project TEXT NOT NULL, \
+                     project_id INTEGER, \
+                     project_key TEXT NOT NULL, \
+                     status  TEXT NOT NULL, \
+                     resolution TEXT NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues (id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
 
 
 class DBJiraBackend(DBBackend):
@@ -108,6 +189,8 @@ class DBJiraBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBJiraIssueExtMySQL]
+        self.SQLITE_EXT = [DBJiraIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBJiraIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
         """
@@ -734,10 +817,31 @@ Jira Backend
 
     def __init__(self):
         self.delay = Config.delay
+        self.workers = max(1, getattr(Config, 'workers', 1) or 1)
+        self.parallel = getattr(Config, 'jira_parallel', False)
+        self.fields = self.get_fields(getattr(Config, 'jira_fields', None))
         self.url = Config.url
         self.serverUrl = Config.url.split("/browse/")[0]
         self.projectName = Config.url.split("/browse/")[1]
 
+    def get_fields(self, extra_fields=None):
+        """
+        Return the list of fields to request for each issue: those read
+        by the backend plus the given extra ones.
+
+        @param extra_fields: comma separated list of extra fields
+        @type extra_fields: C{str}
+
+        @rtype: C{str}
+        """
+        fields = list(ISSUE_FIELDS)
+        if extra_fields:
+            for field in extra_fields.split(','):
+                field = field.strip()
+                if field and field not in fields:
+                    fields.append(field)
+        return ','.join(fields)
+
     def basic_jira_url(self):
         serverUrl = self.url.split("/browse/")[0]
         product = self.url.split("/browse/")[1]
@@ -749,12 +853,172 @@ Jira Backend
         return url_issues
 
 
-    def bugsNumber(self, jira):
+    def bugsNumber(self, jira, since=None):
         printdbg("Getting number of issues: " + self.url)
-        issue = jira.search_issues('project=' + self.projectName,startAt=0,maxResults=1)
+        issue = jira.search_issues(self.get_jql(since),startAt=0,maxResults=1,fields='key')
         bugs = issue.total
         return int(bugs)
 
+    def get_jql(self, since=None):
+        """
+        Return the query of the issues of the project updated since the
+        given minute, sorted by date of update
+        """
+        jql = 'project=' + self.projectName
+        if since:
+            jql += ' AND updated >= "' + since + '"'
+        return jql + ' order by updated asc, id asc'
+
+    def get_issues_page(self, jira, since, start_at, max_results):
+        """
+        Retrieve a page of issues of the project in a single call,
+        including their changelog, comments and attachments. Only
+        the fields read by the backend are requested.
+        """
+        return self.search_page(jira, self.get_jql(since), start_at,
+                                max_results)
+
+    def search_page(self, jira, jql, start_at, max_results):
+        # The Jira client makes the requests on its own, so the pace
+        # is kept once per page
+        wait_delay(limit_rate=True)
+        return jira.search_issues(jql,
+                                  startAt=start_at, maxResults=max_results,
+                                  fields=self.fields, expand='changelog')
+
+    def get_last_key(self, jira):
+        """
+        Return the number of the last key of the project
+        """
+        issues = jira.search_issues('project=' + self.projectName + ' order by key desc',
+                                    startAt=0, maxResults=1, fields='key')
+        if not issues:
+            return 0
+        return int(issues[0].key.split('-')[-1])
+
+    def get_last_update(self, jira):
+        """
+        Return the minute of the last update of the issues of the
+        project, or None when there are no issues
+        """
+        issues = jira.search_issues('project=' + self.projectName + ' order by updated desc',
+                                    startAt=0, maxResults=1, fields='updated')
+        if not issues:
+            return None
+        return parse(issues[0].fields.updated).strftime('%Y-%m-%d %H:%M')
+
+    def get_range_name(self, first, last):
+        return RANGE_CHECKPOINT % self.projectName + u'%d-%d' % (first, last)
+
+    def get_stored_ranges(self, bugsdb, dbtrk_id):
+        """
+        Return the ranges of keys of an interrupted parallel import,
+        sorted, and whether each one was already stored
+        """
+        prefix = RANGE_CHECKPOINT % self.projectName
+        checkpoints = bugsdb.get_checkpoints(dbtrk_id, prefix)
+        ranges = []
+        for name, position in checkpoints.items():
+            first, last = name[len(prefix):].split('-')
+            ranges.append((int(first), int(last), position == RANGE_DONE))
+        return sorted(ranges)
+
+    def start_key_ranges(self, jira, bugsdb, dbtrk_id):
+        """
+        Split the keys of the project in ranges of L{KEYS_PER_RANGE}
+        and store them as checkpoints, together with the last update
+        of the project. Once every range is stored, the issues updated
+        since then are retrieved.
+        """
+        last_update = self.get_last_update(jira)
+        last = self.get_last_key(jira)
+        ranges = [(n, min(n + KEYS_PER_RANGE, last + 1), False)
+                  for n in range(1, last + 1, KEYS_PER_RANGE)]
+
+        names = [self.get_range_name(first, end) for first, end, done in ranges]
+        checkpoints = dict.fromkeys(names)
+        checkpoints[START_CHECKPOINT % self.projectName] = last_update
+        bugsdb.set_checkpoints(dbtrk_id, checkpoints)
+        return ranges
+
+    def get_key_range(self, jira, first, last, max_results):
+        """
+        Retrieve the issues of the project whose keys are numbered from
+        C{first} up to C{last}, not included, sorted by key
+        """
+        jql = 'project=%s AND key >= "%s-%d" AND key < "%s-%d" order by key asc' \
+            % (self.projectName, self.projectName, first,
+               self.projectName, last)
+        issues = []
+        while True:
+            page = self.search_page(jira, jql, len(issues), max_results)
+            issues.extend(page)
+            if len(page) < max_results:
+                break
+        return issues
+
+    def analyze_key_ranges(self, jira, ranges, issues_per_query, bugsdb, dbtrk_id):
+        """
+        Retrieve and store the issues of the project with keys in the
+        given ranges.
+
+        Ranges are retrieved by a pool of workers sharing the rate
+        limiter. They are stored by this thread, which checkpoints
+        each one once it is stored, so an interrupted run is resumed
+        by the next one.
+        """
+        # ranges retrieved but not stored yet are kept in memory, so
+        # workers do not go too far ahead
+        max_pending = 2 * self.workers
+
+        pool = ThreadPool(self.workers)
+        pending = collections.deque()
+        nbugs = 0
+        try:
+            for key_range in ranges:
+                pending.append((key_range,
+                                pool.apply_async(self.get_key_range,
+                                                 (jira,) + key_range +
+                                                 (issues_per_query,))))
+                while len(pending) > max_pending or \
+                        (pending and key_range == ranges[-1]):
+                    (start, end), issues = pending.popleft()
+                    issues = issues.get()
+                    self.analyze_bug_list(issues, self.serverUrl+'/browse/', bugsdb, dbtrk_id)
+                    bugsdb.set_checkpoint(dbtrk_id,
+                                          self.get_range_name(start, end),
+                                          RANGE_DONE)
+                    nbugs += len(issues)
+                    printdbg("Issues %s-%d to %s-%d stored (%d issues)"
+                             % (self.projectName, start, self.projectName,
+                                end - 1, len(issues)))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return nbugs
+
+    def get_next_cursor(self, issues, since, start_at):
+        """
+        Return the position of the page that follows the given one: the
+        minute of update of its last issue and the number of issues
+        updated on that minute that were already retrieved.
+
+        Pages are not requested by offset from the beginning, because
+        the issues updated while retrieving the others move to the end
+        of the list and the next ones would be skipped.
+        """
+        minutes = [parse(bug.fields.updated).strftime('%Y-%m-%d %H:%M')
+                   for bug in issues]
+        last = minutes[-1]
+        seen = minutes.count(last)
+        if last == since:
+            # the whole page was updated on the same minute
+            seen += start_at
+        return last, seen
+
     # http://stackoverflow.com/questions/8733233/filtering-out-certain-bytes-in-python
     def valid_XML_char_ordinal(self, i):
         return ( # conditions ordered by presumed frequency
@@ -768,8 +1032,7 @@ Jira Backend
 
         try:
             issuesDB = handler.getIssues(issues, url)
-            for issue in issuesDB:
-                bugsdb.insert_issue(issue, dbtrk_id)
+            bugsdb.insert_issues(issuesDB, dbtrk_id)
         except Exception, e:
             import traceback
             traceback.print_exc()
@@ -802,33 +1065,97 @@ Jira Backend
             bugs_number = self.bugsNumber(jira)
 
             try:
-                issue = jira.issue(bug_key,expand='changelog')
+                issue = jira.issue(bug_key,fields=self.fields,expand='changelog')
                 self.analyze_bug_list(issue, self.serverUrl+'/browse/', bugsdb, dbtrk.id)
             except Exception, e:
                 #printerr(e)
                 print(e)
 
         else:
-            self.last_mod_date = bugsdb.get_last_modification_date(tracker_id=dbtrk.id)
-            if self.last_mod_date:
-                # self.url = self.url + "&updated:after=" + last_mod_date
-                printdbg("Last bugs cached were modified at: %s" % self.last_mod_date)
+            nbugs = 0
+            last_mod_date = bugsdb.get_last_modification_date(tracker_id=dbtrk.id)
+
+            # Until a parallel import is finished, issues are not stored
+            # in order of update, so the last one stored is not where
+            # the next run has to start
+            ranges = self.get_stored_ranges(bugsdb, dbtrk.id)
+            if ranges:
+                printout("Resuming an interrupted parallel import")
+            elif self.parallel and not last_mod_date:
+                ranges = self.start_key_ranges(jira, bugsdb, dbtrk.id)
+            elif self.parallel:
+                printout("Issues already imported. Retrieving the updated ones")
+
+            if ranges:
+                pending = [(first, end) for first, end, done in ranges if not done]
+                print "Ranges of tickets to be retrieved:", str(len(pending))
+                nbugs += self.analyze_key_ranges(jira, pending, issues_per_query,
+                                                 bugsdb, dbtrk.id)
+                bugsdb.delete_checkpoints(dbtrk.id,
+                                          RANGE_CHECKPOINT % self.projectName)
+
+            nbugs += self.analyze_updated_issues(jira, last_mod_date,
+                                                 issues_per_query, bugsdb, dbtrk.id)
+            printout("Done. %s bugs analyzed" % (nbugs))
+
+    def analyze_updated_issues(self, jira, last_mod_date, issues_per_query, bugsdb, dbtrk_id):
+        """
+        Retrieve and store the issues of the project updated since the
+        last one stored or, after a parallel import, since the import
+        started.
+        """
+        start_name = START_CHECKPOINT % self.projectName
+        checkpoints = bugsdb.get_checkpoints(dbtrk_id, start_name)
+        start = checkpoints.get(start_name)
 
-            bugs_number = self.bugsNumber(jira)
-            print "Tickets to be retrieved:", str(bugs_number)
-            remaining = bugs_number
-            while (remaining > 0):
-                startAtIssue = bugs_number-remaining
-                jira = JIRA(options_jira)
-                issuesAux = jira.search_issues('project=' + self.projectName + ' order by id asc',startAt=startAtIssue,maxResults=issues_per_query,fields=None)
-                issues=[]
-                for i in issuesAux:
-                    issues.append(jira.issue(i.key, expand='changelog'))
-                self.analyze_bug_list(issues, self.serverUrl+'/browse/', bugsdb, dbtrk.id)
-                remaining -= issues_per_query
-                #print "Remaining time: ", (remaining/issues_per_xml_query)*Config.delay/60, "m", "(",remaining,")"
-                time.sleep(self.delay)
-
-            printout("Done. %s bugs analyzed" % (bugs_number))
+        self.last_mod_date = start or last_mod_date
+        if self.last_mod_date:
+            # self.url = self.url + "&updated:after=" + last_mod_date
+            printdbg("Last bugs cached were modified at: %s" % self.last_mod_date)
+
+        # Only the issues updated since the last one stored are
+        # retrieved. Issues are stored in order of update, so an
+        # interrupted run is resumed from the last one stored.
+        since = self.last_mod_date
+        bugs_number = self.bugsNumber(jira, since)
+        print "Tickets to be retrieved:", str(bugs_number)
+
+        # The next page is requested in the background while the
+        # current one is converted and stored. The same client is
+        # used for the whole run.
+        pager = ThreadPool(1)
+        nbugs = 0
+        try:
+            startAtIssue = 0
+            next_issues = pager.apply_async(self.get_issues_page,
+                                            (jira, since, startAtIssue,
+                                             issues_per_query))
+            while True:
+                issues = next_issues.get()
+                if not issues:
+                    break
+
+                last_page = len(issues) < issues_per_query
+                if not last_page:
+                    since, startAtIssue = self.get_next_cursor(issues, since,
+                                                               startAtIssue)
+                    next_issues = pager.apply_async(self.get_issues_page,
+                                                    (jira, since, startAtIssue,
+                                                     issues_per_query))
+                self.analyze_bug_list(issues, self.serverUrl+'/browse/', bugsdb, dbtrk_id)
+                nbugs += len(issues)
+
+                if last_page:
+                    break
+            pager.close()
+        except:
+            pager.terminate()
+            raise
+        finally:
+            pager.join()
+
+        if start_name in checkpoints:
+            bugsdb.delete_checkpoints(dbtrk_id, start_name)
+        return nbugs
 
 Backend.register_backend("atljira", JiraBackend)
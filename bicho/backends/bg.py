@@ -22,15 +22,28 @@
 #          Santiago Dueñas <sduenas@libresoft.es>
 #          Alvaro del Castillo <acs@bitergia.com>
 
+import Queue
+import cgi
+import httplib
+import re
+import sgmllib
+import socket
 import string
+import sys
+import threading
 import time
 import urllib
 import urllib2
 import urlparse
+import xml.parsers.expat
 import xml.sax.handler
+import xmlrpclib
 
 from datetime import datetime, timedelta
 from dateutil.parser import parse
+from dateutil.tz import gettz, tzutc
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 from storm.locals import DateTime, Int, Reference, Unicode, Desc
 
@@ -40,10 +53,19 @@ from bicho.config import Config
 from bicho.backends import Backend
 from bicho.common import Tracker, People, Issue, Comment, Change
 from bicho.db.database import DBIssue, DBBackend, DBTracker, get_database
-from bicho.utils import printerr, printdbg, printout, valid_XML_char_ordinal
+from bicho.utils import printerr, printdbg, printout, clean_xml, \
+    urlopen, get_http_session, wait_delay
 
 BUGZILLA = "bugzilla"
 
+# Prefix of the names of the attachment fields, not shown on the
+# activity pages after the link to the attachment
+ATTACHMENT_FIELD_PREFIX = re.compile(u'^Attachment\s+')
+
+# Values shown on the activity pages instead of the stored ones, since
+# Bugzilla 4.0
+VALUE_DESCS = {'resolution': {u'': u'---'}}
+
 
 class DBBugzillaIssueExt(object):
     """
@@ -126,7 +148,92 @@ class DBBugzillaIssueExtMySQL(DBBugzillaIssueExt):
                        REFERENCES issues (id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBBugzillaIssueExtSQLite(DBBugzillaIssueExt):
+    """
+    SQLite subclass of L{DBBugzillaIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_bugzilla ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     alias VARCHAR(32) default NULL, \
+                     delta_ts DATETIME NOT NULL, \
+                     reporter_accessible VARCHAR(32) default NULL, \
+                     cclist_accessible VARCHAR(32) default NULL, \
+                     classification_id VARCHAR(32) default NULL, \
+                     classification VARCHAR(32) default NULL, \
+                     product VARCHAR(32) default NULL, \
+                     component VARCHAR(32) default NULL, \
+                     version VARCHAR(32) default NULL, \
+                     rep_platform VARCHAR(32) default NULL, \
+                     op_sys VARCHAR(32) default NULL, \
+                     dup_id INTEGER default NULL, \
+                     bug_file_loc VARCHAR(32) default NULL, \
+                     status_whiteboard VARCHAR(32) default NULL, \
+                     target_milestone VARCHAR(32) default NULL, \
+                     votes INTEGER default NULL, \
+                     everconfirmed VARCHAR(32) default NULL, \
+                     qa_contact VARCHAR(32) default NULL, \
+                     estimated_time VARCHAR(32) default NULL, \
+                     remaining_time VARCHAR(32) default NULL, \
+                     actual_time VARCHAR(32) default NULL, \
+                     deadline DATETIME default NULL, \
+                     keywords VARCHAR(32) default NULL, \
+                     flag VARCHAR(32) default NULL, \
+                     cc VARCHAR(32) default NULL, \
+                     group_bugzilla VARCHAR(32) default NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues (id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBBugzillaIssueExtPostgreSQL(DBBugzillaIssueExt):
+    """
+    PostgreSQL subclass of L{DBBugzillaIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_bugzilla ( \
+                     id SERIAL, \
+                     alias TEXT default NULL, \
+                     delta_ts TIMESTAMP NOT NULL, \
+                     reporter_accessible TEXT default NULL, \
+                     cclist_accessible TEXT default NULL, \
+                     classification_id TEXT default NULL, \
+                     classification TEXT default NULL, \
+                     product TEXT default NULL, \
+                     component TEXT default NULL, \
+                     version TEXT default NULL, \
+                     rep_platform TEXT default NULL, \
+                     op_sys TEXT default NULL, \
+                     dup_id INTEGER default NULL, \
+                     bug_file_loc TEXT default NULL, \
+                     status_whiteboard TEXT default NULL, \
+                     target_milestone TEXT default NULL, \
+                     votes INTEGER default NULL, \
+                     everconfirmed TEXT default NULL, \
+                     qa_contact TEXT default NULL, \
+                     estimated_time TEXT default NULL, \
+                     remaining_time TEXT default NULL, \
+                     actual_time TEXT default NULL, \
+                     deadline TIMESTAMP default NULL, \
+                     keywords TEXT default NULL, \
+                     flag TEXT default NULL, \
+                     cc TEXT default NULL, \
+                     group_bugzilla TEXT default NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues (id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
 
 
 class DBBugzillaBackend(DBBackend):
@@ -135,6 +242,8 @@ class DBBugzillaBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBBugzillaIssueExtMySQL]
+        self.SQLITE_EXT = [DBBugzillaIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBBugzillaIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
         """
@@ -247,6 +356,38 @@ class DBBugzillaBackend(DBBackend):
         delta_ts = db_issue_ext.delta_ts
         return delta_ts
 
+    def get_last_cursor(self, store, trk_id):
+        """
+        Return the position where the retrieval of the issues of a
+        tracker stopped, as a tuple with the last modification date
+        stored and the greatest issue id modified on that date.
+        Issues are stored sorted by those two keys, so they are
+        enough to resume the retrieval.
+
+        @param store: database store
+        @type store: C{storm.store.Store}
+        @param trk_id: tracker identifier
+        @type trk_id: C{int}
+
+        @return: last date and issue id or C{None} when there are no
+          issues stored
+        @rtype: C{tuple} of (C{datetime}, C{int})
+        """
+        delta_ts = self.get_last_modification_date(store, trk_id)
+
+        if delta_ts is None:
+            return None
+
+        result = store.find(DBIssue.issue,
+                            DBBugzillaIssueExt.issue_id == DBIssue.id,
+                            DBBugzillaIssueExt.delta_ts == delta_ts,
+                            DBIssue.tracker_id == trk_id)
+        # Issue ids are stored as strings
+        ids = [int(issue) for issue in result]
+        if not ids:
+            return None
+        return delta_ts, max(ids)
+
 
 class SoupHtmlParser():
     """
@@ -289,7 +430,6 @@ class SoupHtmlParser():
         soup = BeautifulSoup(self.html)
         self.remove_comments(soup)
         remove_tags = ['a', 'span', 'i']
-        changes = []
         tables = soup.findAll('table')
 
         # We look for the first table with 5 cols
@@ -304,36 +444,39 @@ class SoupHtmlParser():
                 break
 
         if table is None:
-            return changes
+            return []
+
+        rows = [[col.contents for col in row.findAll('td')]
+                for row in table.findAll('tr')[1:]]
+        return self.get_changes(rows)
+
+    def get_changes(self, rows):
+        """
+        Return the changes found in the rows of the activity table.
+
+        @param rows: rows of the table, but the header; each one is
+          a list of cells and each cell, the list of its contents
+        @type rows: C{list}
 
-        rows = list(table.findAll('tr'))
-        for row in rows[1:]:
-            cols = list(row.findAll('td'))
+        @return: list of changes
+        @rtype: C{list} of L{Change}
+        """
+        changes = []
+
+        for cols in rows:
             if len(cols) == 5:
-                person_email = cols[0].contents[0].strip()
+                person_email = cols[0][0].strip()
                 person_email = unicode(person_email.replace('&#64;', '@'))
-                date = self._to_datetime_with_secs(cols[1].contents[0].strip())
-                # when the field contains an Attachment, the list has more
-                #than a field. For example:
-                #
-                # [u'\n', u'Attachment #12723', u'\n              Flag\n            ']
-                #
-                if len(cols[2].contents) > 1:
-                    aux_c = unicode(" ".join(cols[2].contents))
-                    field = unicode(aux_c.replace("\n", "").strip())
-                else:
-                    field = unicode(cols[2].contents[0].replace("\n", "").strip())
-                removed = unicode(cols[3].contents[0].strip())
-                added = unicode(cols[4].contents[0].strip())
-            else:
-                # same as above with the Attachment example
-                if len(cols[0].contents) > 1:
-                    aux_c = unicode(" ".join(cols[0].contents))
-                    field = aux_c.replace("\n", "").strip()
-                else:
-                    field = cols[0].contents[0].strip()
-                removed = cols[1].contents[0].strip()
-                added = cols[2].contents[0].strip()
+                date = self._to_datetime_with_secs(cols[1][0].strip())
+                cols = cols[2:]
+            # when the field contains an Attachment, the list has more
+            #than a field. For example:
+            #
+            # [u'Attachment #12723', u'\n              Flag\n            ']
+            #
+            field = self._join_field(cols[0])
+            removed = self._join_value(cols[1])
+            added = self._join_value(cols[2])
 
             field, removed, added = self.sanityze_change(field, removed, added)
             by = People(person_email)
@@ -343,6 +486,269 @@ class SoupHtmlParser():
 
         return changes
 
+    def _join_field(self, contents):
+        """
+        Join the contents of the cell of a field, collapsing the
+        spaces left by the indentation of the page
+        """
+        return u" ".join(u" ".join([unicode(c) for c in contents]).split())
+
+    def _join_value(self, contents):
+        """
+        Join the contents of the cell of a value, which are split
+        when it contains links or other markup
+        """
+        return u"".join([unicode(c) for c in contents]).strip()
+
+
+class ActivityTableParser(sgmllib.SGMLParser):
+    """
+    Event-driven parser of the activity table of a bug
+    (show_activity.cgi).
+
+    Only the first table whose header has 5 columns is kept, so no
+    tree is built for the rest of the page. The contents of its cells
+    are split in the same strings BeautifulSoup returns once C{a},
+    C{span} and C{i} tags are replaced by their text.
+    """
+
+    # Fixes applied by BeautifulSoup before parsing
+    MARKUP_MASSAGE = [(re.compile('(<[^<>]*)/>'),
+                       lambda x: x.group(1) + ' />'),
+                      (re.compile('<!\s+([^<>]*)>'),
+                       lambda x: '<!' + x.group(1) + '>')]
+    FLATTEN_TAGS = ('a', 'span', 'i')
+    QUOTE_TAGS = ('script', 'textarea')
+    ASCII_SPACES = ' \t\n\r\x0c'
+
+    def __init__(self):
+        sgmllib.SGMLParser.__init__(self)
+        self.rows = []
+        # Number of rows and header columns of each open table and
+        # whether it is the activity table
+        self.tables = []
+        self.row = None
+        self.cell = None
+        self.data = []
+        self.flatten_depth = 0
+        self.flatten_data = []
+        self.quote_tag = None
+
+    def parse(self, html):
+        """
+        Return the rows of the activity table found in C{html}, but
+        the header. Each row is a list of cells and each cell, the
+        list of strings it contains.
+        """
+        for fix, m in self.MARKUP_MASSAGE:
+            html = fix.sub(m, html)
+
+        try:
+            self.feed(html)
+            self.close()
+        except ActivityTableParsed:
+            pass
+        return self.rows
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.data.append(data)
+
+    def handle_charref(self, ref):
+        self.handle_data('&#%s;' % ref)
+
+    def handle_entityref(self, ref):
+        self.handle_data('&%s;' % ref)
+
+    def handle_comment(self, text):
+        self._end_data()
+
+    def unknown_starttag(self, tag, attrs):
+        if self.quote_tag:
+            attrs = ''.join([' %s="%s"' % (x, y) for x, y in attrs])
+            self.handle_data('<%s%s>' % (tag, attrs))
+            return
+        self._end_data()
+
+        if tag in self.QUOTE_TAGS:
+            self.quote_tag = tag
+            self.literal = 1
+        elif tag == 'table':
+            self._end_row()
+            self.tables.append({'rows': 0, 'cols': 0, 'activity': False})
+        elif not self.tables:
+            return
+        elif tag == 'tr':
+            self._end_row()
+            table = self.tables[-1]
+            table['rows'] += 1
+            if table['rows'] == 2:
+                table['activity'] = table['cols'] == 5
+            if table['activity']:
+                self.row = []
+        elif tag == 'th':
+            if self.tables[-1]['rows'] == 1:
+                self.tables[-1]['cols'] += 1
+        elif tag == 'td':
+            self._end_cell()
+            if self.row is not None:
+                self.cell = []
+        elif tag in self.FLATTEN_TAGS and self.cell is not None:
+            if not self.flatten_depth:
+                self.flatten_data = []
+            self.flatten_depth += 1
+
+    def unknown_endtag(self, tag):
+        if self.quote_tag:
+            if tag != self.quote_tag:
+                self.handle_data('</%s>' % tag)
+                return
+            self.quote_tag = None
+            self.literal = 0
+        self._end_data()
+
+        if not self.tables:
+            return
+        elif tag == 'table':
+            self._end_row()
+            table = self.tables.pop()
+            if table['activity'] or table['cols'] == 5:
+                raise ActivityTableParsed()
+        elif tag == 'tr':
+            self._end_row()
+            table = self.tables[-1]
+            if table['rows'] == 1:
+                table['activity'] = table['cols'] == 5
+        elif tag == 'td':
+            self._end_cell()
+        elif tag in self.FLATTEN_TAGS and self.flatten_depth:
+            self.flatten_depth -= 1
+            if not self.flatten_depth:
+                self.cell.append(u''.join(self.flatten_data))
+
+    def _end_data(self):
+        if not self.data:
+            return
+        data = u''.join(self.data)
+        self.data = []
+
+        if self.flatten_depth:
+            self.flatten_data.append(data.strip())
+            return
+        # Strings made of white spaces are collapsed
+        if not data.strip(self.ASCII_SPACES):
+            if '\n' in data:
+                data = u'\n'
+            else:
+                data = u' '
+        self.cell.append(data)
+
+    def _end_cell(self):
+        self._end_data()
+        if self.flatten_depth:
+            self.flatten_depth = 0
+            self.cell.append(u''.join(self.flatten_data))
+        if self.cell is not None and self.row is not None:
+            self.row.append(self.cell)
+        self.cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self.row is not None:
+            self.rows.append(self.row)
+        self.row = None
+
+
+class WebServiceActivityParser(SoupHtmlParser):
+    """
+    Builds the changes of a bug from its history, as returned by the
+    method Bug.history of the WebService of Bugzilla.
+
+    Fields and values are written as they are shown on the activity
+    pages, so the changes are the same ones found by the HTML parsers.
+    Dates, given in UTC, are moved to the timezone of the tracker.
+    """
+
+    def __init__(self, history, idBug, field_names, timezone,
+                 value_descs=None):
+        SoupHtmlParser.__init__(self, None, idBug)
+        self.history = history
+        self.field_names = field_names
+        self.timezone = timezone
+        self.value_descs = value_descs or {}
+
+    def parse_changes(self):
+        changes = []
+
+        for entry in self.history:
+            person_email = unicode(entry['who'])
+            date = self._to_local_datetime(entry['when'])
+
+            for c in entry['changes']:
+                field = self.field_names.get(c['field_name'], c['field_name'])
+                if c.get('attachment_id'):
+                    # The name of the field follows the link to the
+                    # attachment, without its "Attachment" prefix
+                    field = ATTACHMENT_FIELD_PREFIX.sub(u'', field)
+                    field = u"Attachment #%s %s" % (c['attachment_id'], field)
+                descs = self.value_descs.get(c['field_name'], {})
+                removed = unicode(c['removed'])
+                removed = self._quote(descs.get(removed, removed))
+                added = unicode(c['added'])
+                added = self._quote(descs.get(added, added))
+
+                field, removed, added = self.sanityze_change(field, removed,
+                                                             added)
+                by = People(person_email)
+                by.set_email(person_email)
+                change = Change(field, removed, added, by, date)
+                changes.append(change)
+
+        return changes
+
+    def _to_local_datetime(self, when):
+        """
+        Moves a date in UTC to the timezone of the tracker, taking
+        into account its daylight saving time on that date
+        """
+        when = when.replace(tzinfo=tzutc()).astimezone(self.timezone)
+        return when.replace(tzinfo=None)
+
+    def _quote(self, value):
+        """
+        Quotes a value like the activity pages of Bugzilla do
+        """
+        value = value.strip()
+        if not value:
+            # Empty cells are filled with a non-breaking space
+            return u'&nbsp;'
+        value = cgi.escape(value, True)
+        return value.replace('@', '&#64;')
+
+
+class ActivityTableParsed(Exception):
+    """
+    Raised to stop parsing once the activity table is read
+    """
+
+
+class ActivityHtmlParser(SoupHtmlParser):
+    """
+    Parses the activity of a bug using L{ActivityTableParser}, which
+    is faster than building the whole HTML tree with BeautifulSoup.
+    """
+
+    def parse_changes(self):
+        html = self.html
+        if not isinstance(html, unicode):
+            try:
+                html = html.decode('utf-8')
+            except UnicodeDecodeError:
+                html = html.decode('windows-1252', 'replace')
+
+        rows = ActivityTableParser().parse(html)
+        return self.get_changes(rows)
+
 
 class BugzillaIssue(Issue):
     """
@@ -644,12 +1050,17 @@ class BugsHandler(xml.sax.handler.ContentHandler):
     https://bugzilla.libresoft.es/bugzilla.dtd
     """
 
-    def __init__(self):
+    def __init__(self, callback=None):
         """
+        @param callback: function called with each issue as soon as
+          it is parsed; when it is given, issues are not kept by the
+          handler
+        @type callback: C{function}
         """
         # TBD attachments and flag, see bugzilla.dtd
         #self.issues_data = {}
         self.issues_data = []
+        self.callback = callback
         self.init_bug()
 
     def get_issues(self):
@@ -794,7 +1205,10 @@ class BugsHandler(xml.sax.handler.ContentHandler):
             self.tag_name = None
         elif name == "bug":
             #self.issues_data[self.atags["bug_id"]] = self.get_issue()
-            self.issues_data.append(self.get_issue())
+            if self.callback:
+                self.callback(self.get_issue())
+            else:
+                self.issues_data.append(self.get_issue())
 
     def print_debug_data(self):
         printdbg("")
@@ -916,20 +1330,152 @@ class BugsHandler(xml.sax.handler.ContentHandler):
 
         return issue
 
+# The number of issues requested at once to show_bug.cgi is tuned
+# while retrieving them, between these bounds.
 # 500 is the max recommend by bugmaster@gnome.org.
-# Use 1 for legacy working.
-# 250 for working with bugzilla in redhat
-MAX_ISSUES_PER_XML_QUERY = 250
+MIN_ISSUES_PER_XML_QUERY = 1
+MAX_ISSUES_PER_XML_QUERY = 500
+ISSUES_PER_XML_QUERY = 100
+
+# time in seconds and size in bytes that a single request of issues
+# should not exceed
+XML_QUERY_TARGET_TIME = 30
+XML_QUERY_MAX_BYTES = 16 * 1024 * 1024
 
 # length of hibernation in seconds
 HIBERNATION_LENGTH = 100
 
+# size in bytes of the chunks of XML fed to the parser
+XML_CHUNK_SIZE = 64 * 1024
+
+# max number of issues parsed but not stored yet
+MAX_PENDING_ISSUES = MAX_ISSUES_PER_XML_QUERY
+
+# initial, min and max span of the windows of the list of issues
+LIST_WINDOW = timedelta(days=7)
+LIST_WINDOW_MIN = timedelta(hours=1)
+LIST_WINDOW_MAX = timedelta(days=365)
+
+# number of issues per window the crawler tries to keep
+LIST_WINDOW_SIZE = 2000
+
+# prefix of the names of the checkpoints of the shards and position
+# of the shards already retrieved
+SHARD_CHECKPOINT = u'bg-shard '
+SHARD_DONE = u'done'
+# Name of the checkpoint of the last issue of the list stored, where the
+# next run goes on
+LIST_CURSOR_CHECKPOINT = u'bg-cursor'
+
+
+class XMLBatchSize():
+    """
+    Number of issues requested at once, tuned from the time taken and
+    the bytes received by the previous requests.
+
+    The size grows while requests stay well within the targets and
+    shrinks when they exceed them or fail. It can be shared by several
+    threads.
+    """
+
+    def __init__(self, size=ISSUES_PER_XML_QUERY,
+                 min_size=MIN_ISSUES_PER_XML_QUERY,
+                 max_size=MAX_ISSUES_PER_XML_QUERY,
+                 target_time=XML_QUERY_TARGET_TIME,
+                 max_bytes=XML_QUERY_MAX_BYTES):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_time = target_time
+        self.max_bytes = max_bytes
+        self.requests = 0
+        self.errors = 0
+        self.issues = 0
+        self.bytes = 0
+        self.time = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the number of issues to request next
+        """
+        return self.size
+
+    def update(self, nissues, elapsed, nbytes):
+        """
+        Tune the size from a request that succeeded
+
+        @param nissues: number of issues requested
+        @type nissues: C{int}
+        @param elapsed: seconds taken by the request
+        @type elapsed: C{float}
+        @param nbytes: bytes received
+        @type nbytes: C{int}
+        """
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            self.issues += nissues
+            self.bytes += nbytes
+            self.time += elapsed
+
+            if elapsed > self.target_time or nbytes > self.max_bytes:
+                # Scale down to fit both targets
+                ratio = min(self.target_time / max(elapsed, 0.001),
+                            float(self.max_bytes) / max(nbytes, 1))
+                self._set_size(int(nissues * ratio))
+            elif nissues >= self.size and \
+                    elapsed < self.target_time / 2 and \
+                    nbytes < self.max_bytes / 2:
+                self._set_size(self.size + max(1, self.size / 2))
+
+            printdbg("XML query of %d issues: %.2f s, %d KB, "
+                     "%.1f issues/s. Next size: %d"
+                     % (nissues, elapsed, nbytes / 1024,
+                        nissues / max(elapsed, 0.001), self.size))
+        finally:
+            self.lock.release()
+
+    def shrink(self):
+        """
+        Halve the size after a request that failed
+        """
+        self.lock.acquire()
+        try:
+            self.errors += 1
+            self._set_size(self.size / 2)
+            printdbg("XML query failed. Next size: %d" % self.size)
+        finally:
+            self.lock.release()
+
+    def get_stats(self):
+        """
+        Return a summary of the requests done
+        """
+        return ("%d XML queries (%d failed), %d issues, %d KB in %.2f s, "
+                "%.1f issues/s. Last size: %d"
+                % (self.requests, self.errors, self.issues,
+                   self.bytes / 1024, self.time,
+                   self.issues / max(self.time, 0.001), self.size))
+
+    def _set_size(self, size):
+        self.size = max(self.min_size, min(self.max_size, size))
+
 
 class BGBackend(Backend):
 
     def __init__(self):
         self.url = self._healthy_url(Config.url)
         self.delay = Config.delay
+        self.workers = max(1, getattr(Config, 'workers', 1) or 1)
+        self.shards = getattr(Config, 'bg_shards', 1) or 1
+        self.batch_size = XMLBatchSize()
+        self.webservice = getattr(Config, 'bg_webservice', False)
+        self.field_names = {}
+        self.value_descs = {}
+        self.timezone = None
+        if getattr(Config, 'bg_timezone', None):
+            self.timezone = gettz(Config.bg_timezone)
         self.cookies = {}
         self.version = None
         self.tracker = None
@@ -947,14 +1493,18 @@ class BGBackend(Backend):
         self.bugsdb = get_database(DBBugzillaBackend())
 
     def run(self):
-        printout("Running Bicho with delay of %s seconds" % str(self.delay))
+        printout("Running Bicho with delay of %s seconds and %d workers"
+                 % (str(self.delay), self.workers))
 
         self._login()
         self._set_version()
+        self._set_webservice()
         self._set_tracker()
 
         self._process_issues()
 
+        printdbg(self.batch_size.get_stats())
+
         if not self.retrieved:
             printout("No issues found. Did you provide the correct url?")
         else:
@@ -968,21 +1518,15 @@ class BGBackend(Backend):
             printdbg("No account data provided. Not logged in bugzilla")
             return
 
-        import cookielib
-
-        cookie_j = cookielib.CookieJar()
-        cookie_h = urllib2.HTTPCookieProcessor(cookie_j)
-
         url = self._get_login_url(self.url)
         values = {'Bugzilla_login': self.backend_user,
                   'Bugzilla_password': self.backend_password}
 
-        opener = urllib2.build_opener(cookie_h)
-        urllib2.install_opener(opener)
-        data = urllib.urlencode(values)
-        request = urllib2.Request(url, data)
-        urllib2.urlopen(request)
-        for i, c in enumerate(cookie_j):
+        # Session cookies are kept by the shared HTTP session and
+        # sent on every request
+        session = get_http_session()
+        urlopen(url, urllib.urlencode(values)).read()
+        for c in session.cookies:
             self.cookies[c.name] = c.value
 
         printout("Logged in bugzilla as %s" % self.backend_user)
@@ -1008,9 +1552,7 @@ class BGBackend(Backend):
         parser = xml.sax.make_parser()
         parser.setContentHandler(handler)
         try:
-            cleaned_contents = ''. \
-                join(c for c in contents if valid_XML_char_ordinal(ord(c)))
-            parser.feed(cleaned_contents)
+            parser.feed(clean_xml(contents))
         except Exception:
             printerr("Error parsing URL %s" % info_url)
             raise
@@ -1019,6 +1561,56 @@ class BGBackend(Backend):
         self.version = handler.get_version()
         printdbg("Bugzilla version: %s" % self.version)
 
+    def _set_webservice(self):
+        """
+        Check whether the WebService of Bugzilla is available, getting
+        the names of the fields shown on the activity pages. When it is
+        not available, activity pages are scraped.
+        """
+        if not self.webservice:
+            return
+        if self.timezone is None:
+            # Dates of the WebService are given in UTC
+            printout("Timezone of Bugzilla not set (--bg-timezone). "
+                     "Activity pages will be scraped")
+            self.webservice = False
+            return
+
+        try:
+            fields = self._call_webservice('Bug.fields')['fields']
+        except (urllib2.URLError, xmlrpclib.Error,
+                xml.parsers.expat.ExpatError, KeyError), e:
+            printout("Bugzilla WebService not available (%s). "
+                     "Activity pages will be scraped" % e)
+            self.webservice = False
+            return
+
+        for field in fields:
+            self.field_names[field['name']] = unicode(field['display_name'])
+        major = re.match(r'\d+', self.version or '')
+        if major and int(major.group()) >= 4:
+            self.value_descs = VALUE_DESCS
+        printdbg("Using Bugzilla WebService at %s"
+                 % self._get_webservice_url(self.url))
+
+    def _call_webservice(self, method, **params):
+        """
+        Call a method of the XML-RPC WebService of Bugzilla
+        """
+        if self.backend_user and self.backend_password:
+            params['Bugzilla_login'] = self.backend_user
+            params['Bugzilla_password'] = self.backend_password
+
+        request = urllib2.Request(self._get_webservice_url(self.url),
+                                  xmlrpclib.dumps((params,), method),
+                                  {'Content-Type': 'text/xml'})
+        f = urlopen(request)
+        try:
+            response, method = xmlrpclib.loads(f.read(), use_datetime=True)
+        finally:
+            f.close()
+        return response[0]
+
     def _set_tracker(self):
         # FIXME: supported trackers have to be inserted during
         # the initialization
@@ -1034,37 +1626,254 @@ class BGBackend(Backend):
             printdbg("Issue #%s URL found" % ids[0])
             url = self._get_domain(self.url)
             self._retrieve_issues(ids, url, self.tracker.id)
+        elif self.shards > 1 or self._get_stored_shards():
+            self._retrieve_shards(self._get_domain(self.url))
         else:
-            i = 0
-            max_rounds = 50  # 50*10000
             url = self._get_domain(self.url)
-            last_date, next_date = self._get_last_and_next_dates()
-
-            # Some bugzillas limit the number of results that a query can return.
-            # Due to this, bicho will search for new issues/changes until there
-            # are no more new ones.
-            ids = self._retrieve_issues_ids(self.url, self.version, next_date)
-
-            while(ids):
-                if (i >= max_rounds):
-                    break
-                printout("Round #%d - Total issues to retrieve: %d" % (i, len(ids)))
-                self._retrieve_issues(ids, url, self.tracker.id)
-                i += 1
-                # Search new ids, but first, we have to check whether they are
-                # already stored or not
-                last_date, next_date = self._get_last_and_next_dates()
-                ids = self._retrieve_issues_ids(self.url, self.version, last_date)
-                # If there aren't new issues from the same date, ask for a new one
-                if not ids:
-                    printdbg("No issues found for date %s. Trying with %s" % (last_date, next_date))
-                    ids = self._retrieve_issues_ids(self.url, self.version, next_date)
-
-            if i > 0:
-                printout("No more issues to retrieve")
-
-    def _retrieve_issues_ids(self, base_url, version, from_date, not_retrieved=True):
-        url = self._get_issues_list_url(base_url, version, from_date)
+            cursor = self._get_cursor()
+            from_date = cursor and cursor[0]
+            batches = self._get_list_batches(from_date, cursor)
+            self._retrieve_batches([batches], url, self.tracker.id)
+
+    def _get_list_batches(self, from_date=None, cursor=None):
+        """
+        Generate the batches of ids of the issues modified since
+        C{from_date}, after C{cursor}. After each batch, the position
+        of its last issue is generated as the checkpoint of the list.
+        """
+        nround = 0
+
+        for issues in self._walk_issues_list(from_date, None, cursor):
+            nround += 1
+            printout("Round #%d - Total issues to retrieve: %d"
+                     % (nround, len(issues)))
+            for batch in self._get_batches(issues):
+                yield [str(issue_id) for changed_on, issue_id in batch]
+                yield {LIST_CURSOR_CHECKPOINT: self._cursor_to_str(batch[-1])}
+
+        if nround > 0:
+            printout("No more issues to retrieve")
+
+    def _walk_issues_list(self, from_date=None, until=None, cursor=None):
+        """
+        Generate the lists of the issues modified since C{from_date}
+        and before C{until}, after C{cursor}. Each issue is given by
+        its position, a tuple of modification date and id.
+
+        The list of issues is walked in windows of modification dates,
+        oldest first. The cursor points to the last issue of the
+        previous window, so every list only brings new work. The span
+        of the windows adapts to the number of issues they return.
+        When C{until} is not set, the last window is open so it also
+        gets the issues modified while retrieving the others. Some
+        bugzillas limit the number of results that a query can return;
+        as lists are sorted, the next query starts where the cut was
+        made.
+
+        @param from_date: lower bound of the modification date
+        @type from_date: C{datetime}
+        @param until: upper bound of the modification date, not
+          included, or C{None} for no bound
+        @type until: C{datetime}
+        @param cursor: last issue already retrieved
+        @type cursor: C{tuple} of (C{datetime}, C{int})
+        """
+        window = LIST_WINDOW
+
+        while True:
+            to_date = until
+            if from_date and from_date + window < (until or datetime.now()):
+                to_date = from_date + window
+
+            issues = self._retrieve_issues_ids(self.url, self.version,
+                                               from_date, to_date, cursor)
+            if until:
+                issues = [issue for issue in issues if issue[0] < until]
+
+            if issues:
+                yield issues
+
+                cursor = issues[-1]
+                from_date = cursor[0]
+                if len(issues) > LIST_WINDOW_SIZE:
+                    window = max(window / 2, LIST_WINDOW_MIN)
+                elif len(issues) < LIST_WINDOW_SIZE / 4:
+                    window = min(window * 2, LIST_WINDOW_MAX)
+            elif to_date == until:
+                break
+            else:
+                printdbg("No issues found until %s" % to_date)
+                from_date = to_date
+                window = min(window * 2, LIST_WINDOW_MAX)
+
+    def _get_shards(self, nshards):
+        """
+        Split the history of the product in C{nshards} ranges of
+        modification dates. The last range is open.
+
+        @return: lower and upper bounds of each range
+        @rtype: C{list} of C{tuple} of (C{datetime}, C{datetime})
+        """
+        first = self._retrieve_issues_ids(self.url, self.version, None,
+                                          limit=1)
+        if not first:
+            return [(None, None)]
+
+        start = first[0][0]
+        span = (datetime.now() - start) / nshards
+        if span < LIST_WINDOW_MIN:
+            return [(None, None)]
+
+        bounds = [start + span * i for i in range(1, nshards)]
+        return zip([None] + bounds, bounds + [None])
+
+    def _retrieve_shards(self, base_url):
+        """
+        Retrieve concurrently the issues of each shard of the history
+        of the product.
+
+        Issues are not stored in order of modification date, so the
+        last one stored is not a valid cursor until every shard is
+        done. Meanwhile, the position reached in each shard is kept
+        in the database and an interrupted run is resumed by the next
+        one, even when it is not sharded.
+        """
+        shards = self._get_stored_shards()
+        if shards:
+            printout("Resuming %d shards of an interrupted run" % len(shards))
+        else:
+            shards = [(from_date, until, None)
+                      for from_date, until in self._get_shards(self.shards)]
+            # All the shards are stored at once; otherwise, an
+            # interrupted run would only resume some of them
+            names = [self._get_shard_name(from_date, until)
+                     for from_date, until, cursor in shards]
+            self.bugsdb.set_checkpoints(self.tracker.id, dict.fromkeys(names))
+            printout("Retrieving issues in %d shards" % len(shards))
+
+        producers = [self._get_shard_batches(from_date, until, cursor)
+                     for from_date, until, cursor in shards
+                     if cursor != SHARD_DONE]
+        self._retrieve_batches(producers, base_url, self.tracker.id)
+        self.bugsdb.delete_checkpoints(self.tracker.id, SHARD_CHECKPOINT)
+
+    def _get_stored_shards(self):
+        """
+        Return the shards of an interrupted run, sorted by date.
+
+        @return: lower and upper bounds of each shard and the last
+          issue retrieved, C{None} when none was retrieved yet or
+          L{SHARD_DONE} when the shard was finished
+        @rtype: C{list} of C{tuple} of (C{datetime}, C{datetime},
+          C{tuple})
+        """
+        checkpoints = self.bugsdb.get_checkpoints(self.tracker.id,
+                                                  SHARD_CHECKPOINT)
+        shards = []
+        for name, position in checkpoints.items():
+            bounds = name[len(SHARD_CHECKPOINT):].split('/')
+            from_date, until = [bound and parse(bound) or None
+                                for bound in bounds]
+            cursor = position
+            if position and position != SHARD_DONE:
+                cursor = self._str_to_cursor(position)
+            shards.append((from_date, until, cursor))
+        shards.sort(key=lambda shard: shard[0] or datetime.min)
+        return shards
+
+    def _get_shard_name(self, from_date, until):
+        return SHARD_CHECKPOINT + u'%s/%s' % \
+            (self._timestamp_to_str(from_date) or u'',
+             self._timestamp_to_str(until) or u'')
+
+    def _get_shard_batches(self, from_date, until, cursor=None):
+        """
+        Generate the batches of ids of the issues modified in a shard,
+        after C{cursor}. After each batch, the position of its last
+        issue is generated as the checkpoint of the shard; once the
+        shard is walked, it is marked as finished.
+
+        The last shard is open, so its checkpoints are also the ones
+        of the list, where the next runs go on.
+        """
+        printdbg("Shard from %s until %s" % (from_date, until))
+        name = self._get_shard_name(from_date, until)
+        if cursor:
+            from_date = cursor[0]
+
+        for issues in self._walk_issues_list(from_date, until, cursor):
+            for batch in self._get_batches(issues):
+                yield [str(issue_id) for changed_on, issue_id in batch]
+                position = self._cursor_to_str(batch[-1])
+                checkpoints = {name: position}
+                if until is None:
+                    checkpoints[LIST_CURSOR_CHECKPOINT] = position
+                yield checkpoints
+        yield {name: SHARD_DONE}
+
+    def _get_batches(self, ids):
+        """
+        Generate the batches of ids to request at once. The size of
+        each batch is taken when it is requested, so it follows the
+        time taken by the previous ones.
+        """
+        i = 0
+        while i < len(ids):
+            size = self.batch_size.get()
+            yield ids[i:i + size]
+            i += size
+
+    def _get_cursor(self):
+        """
+        Return the position of the last issue of the list stored, where
+        the retrieval of the list of issues has to be resumed
+        """
+        checkpoints = self.bugsdb.get_checkpoints(self.tracker.id,
+                                                  LIST_CURSOR_CHECKPOINT)
+        position = checkpoints.get(LIST_CURSOR_CHECKPOINT)
+        if position:
+            cursor = self._str_to_cursor(position)
+        else:
+            # Issues stored before the list was checkpointed
+            cursor = self.bugsdb.backend.get_last_cursor(self.bugsdb.store,
+                                                         self.tracker.id)
+        if cursor:
+            printdbg("Last issue cached was #%s, modified on: %s"
+                     % (cursor[1], cursor[0]))
+        return cursor
+
+    def _cursor_to_str(self, cursor):
+        return u'%s %d' % (self._timestamp_to_str(cursor[0]), cursor[1])
+
+    def _str_to_cursor(self, position):
+        changed_on, issue_id = position.rsplit(' ', 1)
+        return parse(changed_on), int(issue_id)
+
+    def _retrieve_issues_ids(self, base_url, version, from_date,
+                             to_date=None, cursor=None, limit=None):
+        """
+        Return the issues modified between C{from_date} and C{to_date}
+        that come after C{cursor}, sorted by modification date and id.
+
+        @param from_date: lower bound of the modification date
+        @type from_date: C{datetime}
+        @param to_date: upper bound of the modification date or
+          C{None} for no bound
+        @type to_date: C{datetime}
+        @param cursor: last issue already retrieved
+        @type cursor: C{tuple} of (C{datetime}, C{int})
+        @param limit: max number of issues to list, when the server
+          supports it
+        @type limit: C{int}
+
+        @return: modification date and id of the issues
+        @rtype: C{list} of C{tuple} of (C{datetime}, C{int})
+        """
+        url = self._get_issues_list_url(base_url, version,
+                                        self._timestamp_to_str(from_date),
+                                        self._timestamp_to_str(to_date))
+        if limit:
+            url = url + "&limit=%d" % limit
         printdbg("Getting bugzilla issues from %s" % url)
 
         f = self._urlopen_auth(url)
@@ -1073,61 +1882,230 @@ class BGBackend(Backend):
         # '"' character. Easier using split.
         # Moreover, we drop the first line of the CSV because it contains
         # the headers
-        ids = []
+        issues = []
         csv = f.read().split('\n')[1:]
         for line in csv:
+            if not line.strip():
+                continue
             # 0: bug_id, 7: changeddate
             values = line.split(',')
-            id = values[0]
-            change_ts = values[7].strip('"')
+            issue = (parse(values[7].strip('"')), int(values[0]))
 
-            # Filter issues already retrieved
-            if not_retrieved:
-                if (not id in self.retrieved) or (self.retrieved[id] != change_ts):
-                    ids.append(id)
-            else:
-                ids.append(id)
-        return ids
+            # Filter the issues modified on the same date than the
+            # cursor that were already retrieved
+            if cursor is None or issue > cursor:
+                issues.append(issue)
+        issues.sort()
+        return issues
 
     def _retrieve_issues(self, ids, base_url, trk_id):
-        # We want to use pop() to get the oldest first so we must reverse the
-        # order
-        ids.reverse()
-        while(ids):
-            query_issues = []
-            while (len(query_issues) < MAX_ISSUES_PER_XML_QUERY and ids):
-                query_issues.append(ids.pop())
-
-            # Retrieving main bug information
-            url = self._get_issues_info_url(base_url, query_issues)
-            printdbg("Issues to retrieve from: %s" % url)
-
-            handler = BugsHandler()
-            self._safe_xml_parse(url, handler)
-            issues = handler.get_issues()
-
-            # Retrieving changes
-            for issue in issues:
-                changes = self._retrieve_issue_activity(base_url, issue.issue)
-                for c in changes:
+        """
+        Retrieve and store the given issues, oldest first.
+        """
+        if not ids:
+            return
+        self._retrieve_batches([self._get_batches(ids)], base_url, trk_id)
+
+    def _retrieve_batches(self, producers, base_url, trk_id):
+        """
+        Retrieve and store the issues of the batches of ids generated
+        by each producer.
+
+        A thread for each producer parses the XML of its batches as it
+        is downloaded and hands over each issue as soon as it is parsed.
+        Activity pages are fetched concurrently by a pool of workers.
+        Issues are stored in the order they were handed over by the
+        calling thread, which is the only one that writes to the
+        database. Producers may also generate dicts of checkpoints,
+        stored in the same transaction as the issues handed over
+        before them.
+        """
+        pool = ThreadPool(self.workers)
+        retrieve_activity = partial(self._retrieve_issue_activity, base_url)
+        # Parsed issues together with the function which returns their
+        # activity, in order. None marks the end of the parsing of
+        # a producer or the checkpoints generated by it.
+        parsed = Queue.Queue()
+        pending_slots = threading.Semaphore(MAX_PENDING_ISSUES)
+
+        def emit_issue(issue, history=None):
+            pending_slots.acquire()
+            batch_history = history and history.get()
+            if batch_history is not None:
+                activity = partial(self._get_issue_history_changes,
+                                   batch_history, issue)
+            else:
+                activity = pool.apply_async(retrieve_activity,
+                                            (issue.issue,)).get
+            parsed.put((issue, activity))
+
+        def parse_batches(batches):
+            try:
+                for batch in batches:
+                    if isinstance(batch, dict):
+                        # Checkpoints are stored by the writer
+                        parsed.put((None, batch))
+                        continue
+                    callback = emit_issue
+                    if self.webservice:
+                        # The history of the whole batch is requested
+                        # while its XML is parsed
+                        history = pool.apply_async(self._retrieve_issues_history,
+                                                   (batch,))
+                        callback = partial(emit_issue, history=history)
+                    self._retrieve_issues_info(base_url, batch, callback)
+                parsed.put((None, None))
+            except:
+                parsed.put((None, sys.exc_info()))
+
+        for batches in producers:
+            parser = threading.Thread(target=parse_batches, args=(batches,))
+            parser.daemon = True
+            parser.start()
+
+        def store_issues(issues, checkpoints=None):
+            self._store_retrieved_issues(issues, trk_id, checkpoints)
+            for i in range(len(issues)):
+                pending_slots.release()
+
+        try:
+            issues = []
+            running = len(producers)
+            while running:
+                issue, activity = parsed.get()
+                if issue is None:
+                    if activity is None:
+                        running -= 1
+                    elif isinstance(activity, tuple):
+                        raise activity[0], activity[1], activity[2]
+                    else:
+                        # The issues handed over before the checkpoints
+                        # are stored in the same transaction
+                        store_issues(issues, activity)
+                        issues = []
+                    continue
+
+                for c in activity():
                     issue.add_change(c)
+                issues.append(issue)
 
-                # We store here the issue once the complete retrieval
-                # for each bug is done
-                self._store_issue(issue, trk_id)
-                self.retrieved[issue.issue] = self._timestamp_to_str(issue.delta_ts)
+                # Store the issues retrieved so far when there are
+                # no more issues waiting
+                if parsed.empty() or len(issues) >= MAX_PENDING_ISSUES:
+                    store_issues(issues)
+                    issues = []
+
+            self._store_retrieved_issues(issues, trk_id)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _retrieve_issues_info(self, base_url, ids, callback=None):
+        """
+        Retrieve the main information of the given issues. When
+        C{callback} is given, it is called with each issue as soon
+        as it is parsed; otherwise, the list of issues is returned.
+        """
+        url = self._get_issues_info_url(base_url, ids)
+        printdbg("Issues to retrieve from: %s" % url)
+
+        emitted = set()
+        issues = []
 
-                time.sleep(self.delay)
+        def emit_issue(issue):
+            emitted.add(issue.issue)
+            if callback:
+                callback(issue)
+            else:
+                issues.append(issue)
+
+        handler = BugsHandler(emit_issue)
+        start = time.time()
+        try:
+            nbytes = self._safe_xml_parse(url, handler)
+        except (socket.error, httplib.HTTPException, urllib2.URLError,
+                xml.sax.SAXException):
+            if len(ids) <= MIN_ISSUES_PER_XML_QUERY:
+                raise
+            # Too many issues at once for the server. Retry the ones
+            # not parsed yet in smaller batches.
+            self.batch_size.shrink()
+            for batch in self._get_batches([id for id in ids
+                                            if id not in emitted]):
+                issues += self._retrieve_issues_info(base_url, batch,
+                                                     callback)
+            return issues
+        self.batch_size.update(len(ids), time.time() - start, nbytes)
+        return issues
 
     def _retrieve_issue_activity(self, base_url, id):
         activity_url = self._get_issue_activity_url(base_url, id)
         printdbg("Retrieving activity of issue #%s from %s"
                  % (id, activity_url))
+        wait_delay()
         data = self._urlopen_auth(activity_url).read()
-        parser = SoupHtmlParser(data, id)
+        parser = ActivityHtmlParser(data, id)
         changes = parser.parse_changes()
         return changes
 
+    def _retrieve_issues_history(self, ids):
+        """
+        Retrieve the history of the given issues in a single call to
+        the WebService. Returns a dict with the history of each issue
+        or None when it could not be retrieved.
+        """
+        printdbg("Retrieving history of %d issues from WebService" % len(ids))
+        wait_delay()
+        try:
+            result = self._call_webservice('Bug.history',
+                                           ids=[int(id) for id in ids])
+        except xmlrpclib.Fault, e:
+            # Any issue not accessible makes the whole call to fail
+            printdbg("Error retrieving history from WebService: %s. "
+                     "Scraping activity pages" % e)
+            return None
+        except (urllib2.URLError, socket.error, httplib.HTTPException,
+                xml.parsers.expat.ExpatError, xmlrpclib.ResponseError), e:
+            # Transport errors are not raised; otherwise the batch of
+            # issues being parsed would be retrieved again
+            printerr("Error connecting to WebService: %s. "
+                     "Scraping activity pages" % e)
+            return None
+
+        history = {}
+        for bug in result['bugs']:
+            history[unicode(bug['id'])] = bug['history']
+        return history
+
+    def _get_issue_history_changes(self, history, issue):
+        parser = WebServiceActivityParser(history.get(issue.issue, []),
+                                          issue.issue, self.field_names,
+                                          self.timezone, self.value_descs)
+        return parser.parse_changes()
+
+    def _store_retrieved_issues(self, issues, trk_id, checkpoints=None):
+        if not issues:
+            if checkpoints:
+                self.bugsdb.set_checkpoints(trk_id, checkpoints)
+            return
+        self._store_issues(issues, trk_id, checkpoints)
+        for issue in issues:
+            self.retrieved[issue.issue] = self._timestamp_to_str(issue.delta_ts)
+
+    def _store_issues(self, issues, trk_id, checkpoints=None):
+        try:
+            self.bugsdb.insert_issues(issues, trk_id, checkpoints)
+            printdbg("%d issues stored" % len(issues))
+        except UnicodeEncodeError:
+            # Store them one by one to find out which one is failing
+            for issue in issues:
+                self._store_issue(issue, trk_id)
+            if checkpoints:
+                self.bugsdb.set_checkpoints(trk_id, checkpoints)
+
     def _store_issue(self, issue, trk_id):
         try:
             self.bugsdb.insert_issue(issue, trk_id)
@@ -1136,21 +2114,6 @@ class BGBackend(Backend):
             printerr("UnicodeEncodeError: the issue %s couldn't be stored"
                      % issue.issue)
 
-    def _get_last_and_next_dates(self):
-        last_ts = self.bugsdb.get_last_modification_date(tracker_id=self.tracker.id)
-
-        if not last_ts:
-            return None, None
-        printdbg("Last issues cached were modified on: %s" % last_ts)
-
-        last_ts_str = self._timestamp_to_str(last_ts)
-
-        # We add one second to the last date to avoid retrieving the same
-        # changes modified at that date.
-        next_ts = last_ts + timedelta(seconds=1)
-        next_ts_str = self._timestamp_to_str(next_ts)
-        return last_ts_str, next_ts_str
-
     def _healthy_url(self, url):
         tokens = url.split('product=')
         component = tokens[1].split('&component=')
@@ -1161,20 +2124,15 @@ class BGBackend(Backend):
             url = tokens[0] + 'product=' + urllib.quote(tokens[1])
         return url
 
-    def _urlopen_auth(self, url):
+    def _urlopen_auth(self, url, stream=False):
         """
         Opens an URL using an authenticated session
         """
         keep_trying = True
         while keep_trying:
-            if self._is_auth_session():
-                opener = urllib2.build_opener()
-                for c in self.cookies:
-                    q = str(c) + '=' + self.cookies[c]
-                    opener.addheaders.append(('Cookie', q))
             keep_trying = False
             try:
-                aux = urllib2.urlopen(url)
+                aux = urlopen(url, stream=stream)
             except urllib2.HTTPError as e:
                 printerr("The server couldn\'t fulfill the request.")
                 printerr("Error code: %s" % e.code)
@@ -1224,20 +2182,25 @@ class BGBackend(Backend):
             url = self._get_domain(base_url) + "show_bug.cgi?id=&ctype=xml"
         return url
 
-    def _get_issues_list_url(self, base_url, version, from_date=None):
+    def _get_issues_list_url(self, base_url, version, from_date=None,
+                             to_date=None):
         if ((version == "3.2.3") or (version == "3.2.2")):
             url = base_url + "&order=Last+Changed&ctype=csv"
+            # Firefox ITS (3.2.3) replaces %20 with %2520 that causes
+            # Bicho to crash. Both bounds are days, so the issues of
+            # the same days are filtered later.
             if from_date:
-                """
-                Firefox ITS (3.2.3) replaces %20 with %2520 that causes
-                Bicho to crash
-                """
                 day = from_date[:from_date.index(' ')]
                 url = url + "&chfieldfrom=" + day
+            if to_date:
+                day = to_date[:to_date.index(' ')]
+                url = url + "&chfieldto=" + day
         else:
-            url = base_url + "&order=changeddate&ctype=csv"
+            url = base_url + "&order=changeddate%2Cbug_id&ctype=csv"
             if from_date:
                 url = url + "&chfieldfrom=" + from_date.replace(' ', '%20')
+            if to_date:
+                url = url + "&chfieldto=" + to_date.replace(' ', '%20')
         return url
 
     def _get_issues_info_url(self, base_url, ids):
@@ -1253,35 +2216,33 @@ class BGBackend(Backend):
     def _get_issue_activity_url(self, base_url, issue_id):
         return base_url + "show_activity.cgi?id=" + issue_id
 
+    def _get_webservice_url(self, base_url):
+        return self._get_domain(base_url) + "xmlrpc.cgi"
+
     def _safe_xml_parse(self, bugs_url, handler):
-        f = self._urlopen_auth(bugs_url)
+        """
+        Parse the XML document at C{bugs_url} as it is downloaded,
+        removing the characters not allowed in XML on the fly.
+        Returns the number of bytes read.
+        """
+        f = self._urlopen_auth(bugs_url, stream=True)
         parser = xml.sax.make_parser()
         parser.setContentHandler(handler)
+        nbytes = 0
 
         try:
-            contents = f.read()
-        except Exception:
-            printerr("Error retrieving URL: %s" % (bugs_url))
-            raise
-
-        try:
-            parser.feed(contents)
+            chunk = f.read(XML_CHUNK_SIZE)
+            while chunk:
+                nbytes += len(chunk)
+                parser.feed(clean_xml(chunk))
+                chunk = f.read(XML_CHUNK_SIZE)
             parser.close()
+            return nbytes
         except Exception:
-            # Clean only the invalid XML
-            try:
-                parser2 = xml.sax.make_parser()
-                parser2.setContentHandler(handler)
-                parser2.setContentHandler(handler)
-                printdbg("Cleaning dirty XML")
-                cleaned_contents = ''. \
-                    join(c for c in contents if valid_XML_char_ordinal(ord(c)))
-                parser2.feed(cleaned_contents)
-                parser2.close()
-            except Exception:
-                printerr("Error parsing URL: %s" % (bugs_url))
-                raise
-        f.close()
+            printerr("Error retrieving or parsing URL: %s" % (bugs_url))
+            raise
+        finally:
+            f.close()
 
     def _timestamp_to_str(self, ts):
         if not ts:
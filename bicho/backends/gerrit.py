@@ -86,7 +86,54 @@ class DBGerritIssueExtMySQL(DBGerritIssueExt):
                     REFERENCES issues (id) \
                     ON DELETE CASCADE \
                     ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBGerritIssueExtSQLite(DBGerritIssueExt):
+    """
+    SQLite subclass of L{DBGerritIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_gerrit ( \
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                    branch TEXT, \
+                    url TEXT,  \
+                    change_id TEXT, \
+                    related_artifacts TEXT, \
+                    project TEXT, \
+                    mod_date DATETIME, \
+                    issue_id INTEGER NOT NULL, \
+                    open TEXT, \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
+
+
+class DBGerritIssueExtPostgreSQL(DBGerritIssueExt):
+    """
+    PostgreSQL subclass of L{DBGerritIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_gerrit ( \
+                    id SERIAL, \
+                    branch TEXT, \
+                    url TEXT,  \
+                    change_id TEXT, \
+                    related_artifacts TEXT, \
+                    project TEXT, \
+                    mod_date TIMESTAMP, \
+                    issue_id INTEGER NOT NULL, \
+                    open TEXT, \
+                    PRIMARY KEY(id), \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
 
 
 class DBGerritBackend(DBBackend):
@@ -95,6 +142,8 @@ class DBGerritBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBGerritIssueExtMySQL]
+        self.SQLITE_EXT = [DBGerritIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBGerritIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
         """
@@ -321,11 +370,11 @@ class Gerrit():
         # Check with changes added from MERGED and ABANDONED comments
         query_i = "SELECT COUNT(id) FROM  "
         query_c = "SELECT COUNT(DISTINCT(issue_id)) FROM  "
-        query_i_m = query_i + 'issues WHERE status="MERGED" AND tracker_id='+str(dbtrk_id)
-        query_c_m = query_c + 'changes, issues WHERE field="status" AND new_value="MERGED"'
+        query_i_m = query_i + "issues WHERE status='MERGED' AND tracker_id="+str(dbtrk_id)
+        query_c_m = query_c + "changes, issues WHERE field='status' AND new_value='MERGED'"
         query_c_m += ' AND changes.issue_id = issues.id AND tracker_id='+str(dbtrk_id)
-        query_i_a = query_i + 'issues WHERE status="ABANDONED" AND tracker_id='+str(dbtrk_id)
-        query_c_a = query_c + 'changes, issues WHERE field="status" AND new_value="ABANDONED"'
+        query_i_a = query_i + "issues WHERE status='ABANDONED' AND tracker_id="+str(dbtrk_id)
+        query_c_a = query_c + "changes, issues WHERE field='status' AND new_value='ABANDONED'"
         query_c_a += ' AND changes.issue_id = issues.id AND tracker_id='+str(dbtrk_id)
         aux = store.execute(query_i_m)
         issues_merged = aux.get_one()[0]
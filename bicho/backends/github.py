@@ -17,15 +17,18 @@
 #
 # Authors: Luis Cañas Díaz <lcanas@libresoft.es>
 
+import os
 import sys
-import time
-import urllib2
-import base64
 import json
+import tempfile
+
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 from bicho.backends import Backend
 from bicho.config import Config
-from bicho.utils import printerr, printdbg, printout
+from bicho.utils import printerr, printdbg, printout, urlopen, \
+    get_http_session, wait_delay
 from bicho.common import Tracker, People, Issue, Comment, Change, \
     TempRelationship, Attachment
 from bicho.db.database import DBIssue, DBTracker, DBBackend, get_database
@@ -40,6 +43,45 @@ from lazr.restfulclient.errors import HTTPError
 CLOSED_STATE = "closed"
 OPEN_STATE = "open"
 
+# Size in megabytes of the cache of downloaded URLs, unless it is set
+CACHE_SIZE = 64
+
+
+class GroupedItems:
+    """
+    Items of a listing grouped by issue number.
+
+    Items are spilled to a temporary file as they are added, so only
+    their offsets are kept in memory, whatever the size of the listing.
+    """
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.offsets = {}
+
+    def add(self, number, item):
+        data = json.dumps(item)
+        self.file.seek(0, os.SEEK_END)
+        self.offsets.setdefault(number, []).append((self.file.tell(),
+                                                    len(data)))
+        self.file.write(data)
+
+    def get(self, number):
+        """
+        Return the items of the given issue, in the order they were
+        added.
+        """
+        items = []
+        for offset, length in self.offsets.get(number, []):
+            self.file.seek(offset)
+            items.append(json.loads(self.file.read(length)))
+        return items
+
+    def close(self):
+        self.file.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
 
 class DBGithubIssueExt(object):
     """
@@ -91,7 +133,60 @@ class DBGithubIssueExtMySQL(DBGithubIssueExt):
                        REFERENCES issues(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM; '
+                     ) ENGINE=%(engine)s; '
+
+
+class DBGithubIssueExtSQLite(DBGithubIssueExt):
+    """
+    SQLite subclass of L{DBGithubIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_github (\
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     status VARCHAR(32) default NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     web_link VARCHAR(255) default NULL, \
+                     closed_at DATETIME default NULL, \
+                     updated_at DATETIME default NULL, \
+                     milestone_name VARCHAR(32) default NULL, \
+                     milestone_summary VARCHAR(255) default NULL, \
+                     milestone_title VARCHAR(255) default NULL, \
+                     milestone_web_link VARCHAR(255) default NULL, \
+                     labels VARCHAR(255) default NULL, \
+                     title VARCHAR(255) default NULL, \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBGithubIssueExtPostgreSQL(DBGithubIssueExt):
+    """
+    PostgreSQL subclass of L{DBGithubIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_github (\
+                     id SERIAL, \
+                     status TEXT default NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     web_link TEXT default NULL, \
+                     closed_at TIMESTAMP default NULL, \
+                     updated_at TIMESTAMP default NULL, \
+                     milestone_name TEXT default NULL, \
+                     milestone_summary TEXT default NULL, \
+                     milestone_title TEXT default NULL, \
+                     milestone_web_link TEXT default NULL, \
+                     labels TEXT default NULL, \
+                     title TEXT default NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
 
 
 class DBGithubBackend(DBBackend):
@@ -100,6 +195,8 @@ class DBGithubBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBGithubIssueExtMySQL]
+        self.SQLITE_EXT = [DBGithubIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBGithubIssueExtPostgreSQL]
 
     def get_last_modification_date(self, store, bugs_state, tracker_id):
         # get last modification date stored in the database for a given status
@@ -372,6 +469,8 @@ class GithubBackend(Backend):
     def __init__(self):
         self.url = Config.url
         self.delay = Config.delay
+        self.workers = max(1, getattr(Config, 'workers', 1) or 1)
+        self.bulk = getattr(Config, 'github_bulk', False)
         try:
             self.backend_password = Config.backend_password
             self.backend_user = Config.backend_user
@@ -379,13 +478,23 @@ class GithubBackend(Backend):
             printerr("\n--backend-user and --backend-password are mandatory \
             to download bugs from Github\n")
             sys.exit(1)
+        if getattr(Config, 'cache_size', None) is None:
+            # Listings are revalidated with their ETag, so pages not
+            # modified since the last run do not count against the
+            # rate limit
+            Config.cache_size = CACHE_SIZE
+        get_http_session().set_auth(self.backend_user, self.backend_password)
         self.remaining_ratelimit = 0
 
     def get_domain(self, url):
         strings = url.split('/')
         return strings[0] + "//" + strings[2] + "/"
 
-    def analyze_bug(self, bug):
+    def analyze_bug(self, bug, comments=None, entries=None):
+        """
+        Build the issue of the given bug. Its comments and events are
+        retrieved when they are not given.
+        """
         #Retrieving main bug information
 
         printdbg(bug['url'] + " " + bug['state'] + " updated_at " +
@@ -435,7 +544,8 @@ class GithubBackend(Backend):
             issue.set_milestone_title(bug['milestone']['title'])
             issue.set_milestone_web_link(bug['milestone']['url'])
 
-        comments = self.__get_batch_comments(bug['number'])
+        if comments is None:
+            comments = self.__get_batch_comments(bug['number'])
         for c in comments:
             by = People(c['user']['login'])
             ## by.setname() FIXME - to be done
@@ -444,7 +554,8 @@ class GithubBackend(Backend):
             issue.add_comment(com)
 
         # activity
-        entries = self.__get_batch_activities(bug['number'])
+        if entries is None:
+            entries = self.__get_batch_activities(bug['number'])
         for e in entries:
             field = e['event']
             added = e['commit_id']
@@ -485,14 +596,7 @@ class GithubBackend(Backend):
 
     def __get_batch_activities(self, bug_number):
         url = self.url + "/" + str(bug_number) + "/events"
-        base64string = base64.encodestring(
-            '%s:%s' % (self.backend_user,
-                       self.backend_password)).replace('\n', '')
-
-        request = urllib2.Request(url)
-        request.add_header("Authorization", "Basic %s" % base64string)
-
-        result = urllib2.urlopen(request)
+        result = urlopen(url)
         content = result.read()
 
         events = json.loads(content)
@@ -501,62 +605,145 @@ class GithubBackend(Backend):
 
     def __get_batch_comments(self, bug_number):
         url = self.url + "/" + str(bug_number) + "/comments"
-        base64string = base64.encodestring(
-            '%s:%s' % (self.backend_user,
-                       self.backend_password)).replace('\n', '')
-
-        request = urllib2.Request(url)
-        request.add_header("Authorization", "Basic %s" % base64string)
-
-        result = urllib2.urlopen(request)
+        # The issues are paced once, when their comments are requested
+        wait_delay()
+        result = urlopen(url)
         content = result.read()
 
         comments = json.loads(content)
 
         return comments
 
-    def __get_batch_bugs_state(self, state=OPEN_STATE, since=None):
-        if state == OPEN_STATE:
-            url = self.url + "?state=open&page=" + str(self.pagecont) \
-                + "&per_page=100&sort=updated&direction=asc"
-        else:
-            url = self.url + "?state=closed&page=" + str(self.pagecont) \
-                + "&per_page=100&sort=updated&direction=asc"
-            # we need to download both closed and open bugs,
-            #by default state = open
-
+    def __get_bugs_url(self, since=None):
+        # open and closed bugs are listed at once
+        url = self.url + "?state=all&per_page=100&sort=updated&direction=asc"
         if since:
-            url = url + "&since=" + str(since)
+            url = url + "&since=" + since.isoformat()
+        return url
+
+    def __get_next_url(self, headers):
+        """
+        Return the URL of the next page of a listing, given in the
+        Link header of the current one, or None for the last page
+        """
+        # Link: <https://...&page=2>; rel="next", <https://...>; rel="last"
+        link = headers.get('link')
+        if not link:
+            return None
+
+        for value in link.split(','):
+            params = [param.strip() for param in value.split(';')]
+            if 'rel="next"' in params[1:]:
+                return params[0][1:-1]
+        return None
 
-        base64string = base64.encodestring(
-            '%s:%s' % (self.backend_user,
-                       self.backend_password)).replace('\n', '')
+    def __get_page(self, url):
+        """
+        Retrieve a page of a listing. Returns its items and the URL of
+        the next page. The HTTP cache revalidates pages already seen
+        with their ETag, so unchanged pages are not downloaded again.
+        """
+        result = urlopen(url)
+        content = result.read()
+        return json.loads(content), self.__get_next_url(result.info())
 
-        request = urllib2.Request(url)
-        request.add_header("Authorization", "Basic %s" % base64string)
+    def __get_batch_bugs(self):
+        if not self.next_url:
+            return []
 
-        result = urllib2.urlopen(request)
+        result = urlopen(self.next_url)
         content = result.read()
 
-        self.remaining_ratelimit = result.info()['x-ratelimit-remaining']
+        self.remaining_ratelimit = result.info().get('x-ratelimit-remaining')
+        self.next_url = self.__get_next_url(result.info())
         bugs = json.loads(content)
 
         return bugs
 
-    def __get_batch_bugs(self):
-        if self.bugs_state == OPEN_STATE:
-            bugs = self.__get_batch_bugs_state(state=OPEN_STATE,
-                                               since=self.mod_date_open)
-            if len(bugs) == 0:
-                self.bugs_state = CLOSED_STATE
-                self.pagecont = 1
-        if self.bugs_state == CLOSED_STATE:
-            bugs = self.__get_batch_bugs_state(state=CLOSED_STATE,
-                                               since=self.mod_date_closed)
-        return bugs
+    def __get_issue_number(self, issue_url):
+        return int(issue_url[issue_url.rfind('/') + 1:])
+
+    def __get_bulk_comments(self, since=None):
+        """
+        Retrieve the comments of all the issues of the repository
+        updated since the given date, grouped by issue number
+        """
+        grouped = GroupedItems()
+        url = self.url + "/comments?per_page=100&sort=updated&direction=asc"
+        if since:
+            url = url + "&since=" + since.isoformat()
+
+        while url:
+            comments, url = self.__get_page(url)
+
+            for c in comments:
+                grouped.add(self.__get_issue_number(c['issue_url']), c)
+
+        printdbg("%d issues with new comments" % len(grouped))
+        return grouped
+
+    def __get_bulk_activities(self, since=None):
+        """
+        Retrieve the events of all the issues of the repository
+        created since the given date, grouped by issue number
+        """
+        grouped = GroupedItems()
+        url = self.url + "/events?per_page=100"
+
+        # events are listed newest first and they can not be filtered
+        # by date, so the listing stops at the first old one
+        while url:
+            events, url = self.__get_page(url)
+
+            for e in events:
+                if since and self.__to_datetime(e['created_at']) < since:
+                    url = None
+                    break
+                grouped.add(e['issue']['number'], e)
+
+        printdbg("%d issues with new events" % len(grouped))
+        return grouped
+
+    def __fetch_bugs_data(self, pool, bugs):
+        """
+        Request the comments and the events of the given bugs to the
+        pool of workers. Returns the bugs together with the functions
+        that wait for their comments and events, in the same order.
+        """
+        fetched = []
+        for bug in bugs:
+            comments = pool.apply_async(self.__get_batch_comments,
+                                        (bug['number'],))
+            entries = pool.apply_async(self.__get_batch_activities,
+                                       (bug['number'],))
+            fetched.append((bug, comments.get, entries.get))
+        return fetched
+
+    def __join_bugs_data(self, bugs, comments, entries):
+        """
+        Join the given bugs with their comments and events, retrieved
+        in bulk. The result is the same of L{__fetch_bugs_data}.
+        """
+        return [(bug, partial(self.__get_grouped_comments, comments,
+                              bug['number']),
+                 partial(self.__get_grouped_events, entries, bug['number']))
+                for bug in bugs]
+
+    def __get_grouped_comments(self, grouped, number):
+        # the comments of an issue are given in order of creation
+        comments = grouped.get(number)
+        comments.sort(key=lambda c: c['created_at'])
+        return comments
+
+    def __get_grouped_events(self, grouped, number):
+        # events were listed newest first
+        events = grouped.get(number)
+        events.reverse()
+        return events
 
     def run(self):
-        print("Running Bicho with delay of %s seconds" % (str(self.delay)))
+        print("Running Bicho with delay of %s seconds and %d workers"
+              % (str(self.delay), self.workers))
 
         bugsdb = get_database(DBGithubBackend())
 
@@ -570,23 +757,19 @@ class GithubBackend(Backend):
         trk = Tracker(url, "github", "v3")
         dbtrk = bugsdb.insert_tracker(trk)
 
-        self.bugs_state = "open"
-        self.pagecont = 1
-
-        self.mod_date_open = None
-        self.mod_date_closed = None
-
         aux_date_open = bugsdb.get_last_modification_date(state="open",
                                                           tracker_id=dbtrk.id)
-        if aux_date_open:
-            self.mod_date_open = aux_date_open.isoformat()
         aux_date_closed = bugsdb.get_last_modification_date(state="closed",
                                                             tracker_id=dbtrk.id)
-        if aux_date_closed:
-            self.mod_date_closed = aux_date_closed.isoformat()
+        printdbg("Last open bug already cached: %s" % aux_date_open)
+        printdbg("Last closed bug already cached: %s" % aux_date_closed)
+
+        # Bugs of both states are retrieved in the same sweep, so only
+        # those updated after the last one stored are needed
+        dates = [d for d in (aux_date_open, aux_date_closed) if d]
+        since = dates and max(dates) or None
 
-        printdbg("Last open bug already cached: %s" % self.mod_date_open)
-        printdbg("Last closed bug already cached: %s" % self.mod_date_closed)
+        self.next_url = self.__get_bugs_url(since)
         bugs = self.__get_batch_bugs()
         nbugs = len(bugs)
 
@@ -597,41 +780,77 @@ class GithubBackend(Backend):
                 printout("No bugs found. Did you provide the correct url?")
             sys.exit(0)
 
-        auxcont = 0
-        while len(bugs) > 0:
-
-            for bug in bugs:
-
-                try:
-                    issue_data = self.analyze_bug(bug)
-                except Exception:
-                    #FIXME it does not handle the e
-                    printerr("Error in function analyzeBug with URL: ' \
-                    '%s and Bug: %s" % (url, bug))
-                    raise
-
-                try:
-                    # we can have meta-trackers but we want to have the
-                    # original tracker name
-                    tr_url = self.__get_tracker_url_from_bug(bug)
-                    if (tr_url != url):
-                        aux_trk = Tracker(tr_url, "github", "v3")
-                        dbtrk = bugsdb.insert_tracker(aux_trk)
-                    bugsdb.insert_issue(issue_data, dbtrk.id)
-                except UnicodeEncodeError:
-                    printerr(
-                        "UnicodeEncodeError: the issue %s couldn't be stored"
-                        % (issue_data.issue))
-                except Exception, e:
-                    printerr("ERROR: ")
-                    print e
-
-                printdbg ("Getting ticket number " + str(bug["number"]))
-                time.sleep(self.delay)
-
-            self.pagecont += 1
-            bugs = self.__get_batch_bugs()
-            nbugs = nbugs + len(bugs)
+        # The comments and events of the bugs of a page are retrieved
+        # concurrently by a pool of workers, while the next page is
+        # requested in the background. Bugs are stored in order by
+        # this thread.
+        pool = ThreadPool(self.workers)
+        pager = ThreadPool(1)
+
+        try:
+            if self.bulk:
+                # Comments and events of the whole repository are
+                # retrieved at once
+                printdbg("Retrieving comments and events since %s" % since)
+                all_comments = pool.apply_async(self.__get_bulk_comments,
+                                                (since,))
+                all_entries = pool.apply_async(self.__get_bulk_activities,
+                                               (since,))
+                all_comments = all_comments.get()
+                all_entries = all_entries.get()
+
+            while len(bugs) > 0:
+                if self.bulk:
+                    fetched = self.__join_bugs_data(bugs, all_comments,
+                                                    all_entries)
+                else:
+                    fetched = self.__fetch_bugs_data(pool, bugs)
+                next_bugs = pager.apply_async(self.__get_batch_bugs)
+
+                for bug, comments, entries in fetched:
+
+                    try:
+                        issue_data = self.analyze_bug(bug, comments(),
+                                                      entries())
+                    except Exception:
+                        #FIXME it does not handle the e
+                        printerr("Error in function analyzeBug with URL: ' \
+                        '%s and Bug: %s" % (url, bug))
+                        raise
+
+                    try:
+                        # we can have meta-trackers but we want to have the
+                        # original tracker name
+                        tr_url = self.__get_tracker_url_from_bug(bug)
+                        if (tr_url != url):
+                            aux_trk = Tracker(tr_url, "github", "v3")
+                            dbtrk = bugsdb.insert_tracker(aux_trk)
+                        bugsdb.insert_issue(issue_data, dbtrk.id)
+                    except UnicodeEncodeError:
+                        printerr(
+                            "UnicodeEncodeError: the issue %s couldn't be stored"
+                            % (issue_data.issue))
+                    except Exception, e:
+                        printerr("ERROR: ")
+                        print e
+
+                    printdbg ("Getting ticket number " + str(bug["number"]))
+
+                bugs = next_bugs.get()
+                nbugs = nbugs + len(bugs)
+
+            if self.bulk:
+                all_comments.close()
+                all_entries.close()
+            pool.close()
+            pager.close()
+        except:
+            pool.terminate()
+            pager.terminate()
+            raise
+        finally:
+            pool.join()
+            pager.join()
 
         #end while
 
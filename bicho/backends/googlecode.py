@@ -25,7 +25,8 @@ The Google Code backend is abandoned and nonfunctional as of November 2013.
 from bicho.config import Config
 
 from bicho.backends import Backend
-from bicho.utils import create_dir, printdbg, printout, printerr
+from bicho.utils import create_dir, printdbg, printout, printerr, \
+    urlopen, wait_delay
 from bicho.db.database import DBIssue, DBBackend, get_database
 from bicho.common import Tracker, Issue, People, Change
 
@@ -38,7 +39,6 @@ import os
 import pprint
 import random
 import sys
-import time
 import traceback
 import urllib
 import feedparser
@@ -79,7 +79,48 @@ class DBGoogleCodeIssueExtMySQL(DBGoogleCodeIssueExt):
                     REFERENCES issues (id) \
                     ON DELETE CASCADE \
                     ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBGoogleCodeIssueExtSQLite(DBGoogleCodeIssueExt):
+    """
+    SQLite subclass of L{DBGoogleCodeIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_googlecode ( \
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                    star TEXT, \
+                    ticket_num INTEGER NOT NULL, \
+                    mod_date DATETIME, \
+                    closed_date DATETIME, \
+                    issue_id INTEGER NOT NULL, \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
+
+
+class DBGoogleCodeIssueExtPostgreSQL(DBGoogleCodeIssueExt):
+    """
+    PostgreSQL subclass of L{DBGoogleCodeIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_googlecode ( \
+                    id SERIAL, \
+                    star TEXT, \
+                    ticket_num INTEGER NOT NULL, \
+                    mod_date TIMESTAMP, \
+                    closed_date TIMESTAMP, \
+                    issue_id INTEGER NOT NULL, \
+                    PRIMARY KEY(id), \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
 
 
 class DBGoogleCodeBackend(DBBackend):
@@ -88,6 +129,8 @@ class DBGoogleCodeBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBGoogleCodeIssueExtMySQL]
+        self.SQLITE_EXT = [DBGoogleCodeIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBGoogleCodeIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
 
@@ -176,7 +219,7 @@ class GoogleCode():
         changes_url = Config.url + "/issues/" + issue.ticket_num + "/comments/full"
         printdbg("Analyzing issue " + changes_url)
 
-        d = feedparser.parse(changes_url)
+        d = feedparser.parse(urlopen(changes_url).read())
         changes = self.parse_changes(d, issue.ticket_num)
 
         for c in changes:
@@ -229,7 +272,7 @@ class GoogleCode():
         self.url_issues = Config.url + "/issues/full?max-results=1"
         printdbg("URL for getting metadata " + self.url_issues)
 
-        d = feedparser.parse(self.url_issues)
+        d = feedparser.parse(urlopen(self.url_issues).read())
 
         total_issues = int(d['feed']['opensearch_totalresults'])
         print "Total bugs: ", total_issues
@@ -246,7 +289,7 @@ class GoogleCode():
 
             printdbg("URL for next issues " + self.url_issues)
 
-            d = feedparser.parse(self.url_issues)
+            d = feedparser.parse(urlopen(self.url_issues).read())
 
             for entry in d['entries']:
                 try:
@@ -256,7 +299,7 @@ class GoogleCode():
                     bugsdb.insert_issue(issue, dbtrk.id)
                     remaining -= 1
                     print "Remaining time: ", (remaining) * Config.delay / 60, "m", " issues ", str(remaining)
-                    time.sleep(Config.delay)
+                    wait_delay()
                 except Exception, e:
                     printerr("Error in function analyze_bug ")
                     pprint.pprint(entry)
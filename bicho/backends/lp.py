@@ -17,17 +17,20 @@
 #
 # Authors: Luis Cañas Díaz <lcanas@libresoft.es>
 
+import collections
 import sys
-import time
 import os
 import pwd
+import threading
+
+from multiprocessing.pool import ThreadPool
 
 from launchpadlib.launchpad import Launchpad
 from launchpadlib.credentials import Credentials
 
 from bicho.backends import Backend
 from bicho.config import Config
-from bicho.utils import printerr, printdbg, printout
+from bicho.utils import printerr, printdbg, printout, wait_delay
 from bicho.common import Tracker, People, Issue, Comment, Change, TempRelationship, Attachment
 from bicho.db.database import DBIssue, DBBackend, get_database, NotFoundError
 
@@ -129,7 +132,100 @@ class DBLaunchpadIssueExtMySQL(DBLaunchpadIssueExt):
                        REFERENCES issues(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM; '
+                     ) ENGINE=%(engine)s; '
+
+
+class DBLaunchpadIssueExtSQLite(DBLaunchpadIssueExt):
+    """
+    SQLite subclass of L{DBLaunchpadIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_launchpad (\
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     status VARCHAR(32) default NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     description TEXT default NULL, \
+                     web_link VARCHAR(32) default NULL, \
+                     bug_target_display_name VARCHAR(32) default NULL, \
+                     bug_target_name VARCHAR(32) default NULL, \
+                     date_assigned DATETIME default NULL, \
+                     date_closed DATETIME default NULL, \
+                     date_confirmed DATETIME default NULL, \
+                     date_created DATETIME default NULL, \
+                     date_fix_committed DATETIME default NULL, \
+                     date_fix_released DATETIME default NULL, \
+                     date_in_progress DATETIME default NULL, \
+                     date_incomplete DATETIME default NULL, \
+                     date_left_closed DATETIME default NULL, \
+                     date_left_new DATETIME default NULL, \
+                     date_triaged DATETIME default NULL, \
+                     date_last_message DATETIME default NULL, \
+                     date_last_updated DATETIME default NULL, \
+                     milestone_code_name VARCHAR(32) default NULL, \
+                     milestone_data_targeted VARCHAR(32) default NULL, \
+                     milestone_name VARCHAR(32) default NULL, \
+                     milestone_summary VARCHAR(32) default NULL, \
+                     milestone_title VARCHAR(32) default NULL, \
+                     milestone_web_link VARCHAR(32) default NULL, \
+                     heat INTEGER default NULL, \
+                     linked_branches VARCHAR(32) default NULL, \
+                     tags VARCHAR(32) default NULL, \
+                     title VARCHAR(32) default NULL, \
+                     users_affected_count INTEGER default NULL, \
+                     web_link_standalone VARCHAR(32) default NULL, \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBLaunchpadIssueExtPostgreSQL(DBLaunchpadIssueExt):
+    """
+    PostgreSQL subclass of L{DBLaunchpadIssueExt}
+    """
+
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_launchpad (\
+                     id SERIAL, \
+                     status TEXT default NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     description TEXT default NULL, \
+                     web_link TEXT default NULL, \
+                     bug_target_display_name TEXT default NULL, \
+                     bug_target_name TEXT default NULL, \
+                     date_assigned TIMESTAMP default NULL, \
+                     date_closed TIMESTAMP default NULL, \
+                     date_confirmed TIMESTAMP default NULL, \
+                     date_created TIMESTAMP default NULL, \
+                     date_fix_committed TIMESTAMP default NULL, \
+                     date_fix_released TIMESTAMP default NULL, \
+                     date_in_progress TIMESTAMP default NULL, \
+                     date_incomplete TIMESTAMP default NULL, \
+                     date_left_closed TIMESTAMP default NULL, \
+                     date_left_new TIMESTAMP default NULL, \
+                     date_triaged TIMESTAMP default NULL, \
+                     date_last_message TIMESTAMP default NULL, \
+                     date_last_updated TIMESTAMP default NULL, \
+                     milestone_code_name TEXT default NULL, \
+                     milestone_data_targeted TEXT default NULL, \
+                     milestone_name TEXT default NULL, \
+                     milestone_summary TEXT default NULL, \
+                     milestone_title TEXT default NULL, \
+                     milestone_web_link TEXT default NULL, \
+                     heat INTEGER default NULL, \
+                     linked_branches TEXT default NULL, \
+                     tags TEXT default NULL, \
+                     title TEXT default NULL, \
+                     users_affected_count INTEGER default NULL, \
+                     web_link_standalone TEXT default NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
 
 
 class DBLaunchpadBackend(DBBackend):
@@ -138,6 +234,8 @@ class DBLaunchpadBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBLaunchpadIssueExtMySQL]
+        self.SQLITE_EXT = [DBLaunchpadIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBLaunchpadIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
         """
@@ -699,6 +797,10 @@ class LPBackend(Backend):
     def __init__(self):
         self.url = Config.url
         self.delay = Config.delay
+        self.workers = max(1, getattr(Config, 'workers', 1) or 1)
+        # Launchpad sessions can not be shared by threads, so every
+        # worker logs in on its own
+        self.local = threading.local()
 
     def get_domain(self, url):
         strings = url.split('/')
@@ -913,7 +1015,7 @@ class LPBackend(Backend):
     def __get_people_from_uri(self, uri):
         # returns People object from uri (person_link)
         try:
-            people_lp = self.lp.people[self._get_nickname_from_uri(uri)]
+            people_lp = self._get_lp().people[self._get_nickname_from_uri(uri)]
             people_issue = People(people_lp.name)
             people_issue.set_name(people_lp.display_name)
         except KeyError:
@@ -938,13 +1040,48 @@ class LPBackend(Backend):
     def __get_tracker_url_from_bug(self, bug):
         return bug.web_link[:bug.web_link.rfind('+bug') - 1]
 
+    def _login(self):
+        return Launchpad.login_with('Bicho', 'production',
+                                    credentials_file=self.cre_file)
+
+    def _get_lp(self):
+        """
+        Return the Launchpad session of the running thread
+        """
+        if getattr(self.local, 'lp', None) is None:
+            self.local.lp = self._login()
+        return self.local.lp
+
+    def _analyze_task(self, task_link):
+        """
+        Analyze the bug task at the given link in the running thread.
+        The task is loaded again with the session of the thread, so all
+        the requests made by launchpadlib to analyze it go through it.
+
+        @return: the issue and the URL of its tracker
+        @rtype: C{tuple}
+        """
+        # launchpadlib makes the requests on its own, so the pace
+        # is kept once per bug
+        wait_delay(limit_rate=True)
+        bug = self._get_lp().load(task_link)
+        try:
+            issue_data = self.analyze_bug(bug)
+        except Exception:
+            #FIXME it does not handle the e
+            printerr("Error in function analyzeBug with URL: ' \
+            '%s and Bug: %s" % (self.url, bug))
+            raise
+        return issue_data, self.__get_tracker_url_from_bug(bug)
+
     def __no_credential():
         print "Can't proceed without Launchpad credential."
         sys.exit()
 
     def run(self):
 
-        print("Running Bicho with delay of %s seconds" % (str(self.delay)))
+        print("Running Bicho with delay of %s seconds and %d workers"
+              % (str(self.delay), self.workers))
 
         url = self.url
         pname = None
@@ -959,9 +1096,8 @@ class LPBackend(Backend):
         cachedir = os.path.join(homedir, ".cache/bicho/")
         if not os.path.exists(cachedir):
             os.makedirs(cachedir)
-        cre_file = os.path.join(cachedir + 'launchpad-credential')
-        self.lp = Launchpad.login_with('Bicho', 'production',
-                                       credentials_file=cre_file)
+        self.cre_file = os.path.join(cachedir + 'launchpad-credential')
+        self.lp = self._login()
 
         aux_status = ["New", "Incomplete", "Opinion", "Invalid", "Won't Fix",
                       "Expired", "Confirmed", "Triaged", "In Progress",
@@ -994,29 +1130,26 @@ class LPBackend(Backend):
             printout("No bugs found. Did you provide the correct url?")
             sys.exit(0)
 
-        analyzed = []
-
-        for bug in bugs:
-
-            if bug.web_link in analyzed:
-                continue  # for the bizarre error #338
-
-            try:
-                issue_data = self.analyze_bug(bug)
-            except Exception:
-                #FIXME it does not handle the e
-                printerr("Error in function analyzeBug with URL: ' \
-                '%s and Bug: %s" % (url, bug))
-                raise
-
+        # Bugs are analyzed concurrently by a pool of workers, each one
+        # with its own Launchpad session. Issues are stored in order by
+        # this thread, which is the only one that writes to the
+        # database. Workers do not go too far ahead of it.
+        pool = ThreadPool(self.workers)
+        pending = collections.deque()
+        max_pending = 2 * self.workers
+        analyzed = set()
+
+        def store_issue(result):
+            issue_data, tr_url = result.get()
             try:
                 # we can have meta-trackers but we want to have the original
                 #tracker name
-                tr_url = self.__get_tracker_url_from_bug(bug)
                 if (tr_url != url):
                     aux_trk = Tracker(tr_url, "launchpad", "x.x")
-                    dbtrk = bugsdb.insert_tracker(aux_trk)
-                bugsdb.insert_issue(issue_data, dbtrk.id)
+                    trk_id = bugsdb.insert_tracker(aux_trk).id
+                else:
+                    trk_id = dbtrk.id
+                bugsdb.insert_issue(issue_data, trk_id)
             except UnicodeEncodeError:
                 printerr("UnicodeEncodeError: the issue %s couldn't be stored"
                          % (issue_data.issue))
@@ -1028,8 +1161,26 @@ class LPBackend(Backend):
                          % (issue_data.issue))
                 print e
 
-            analyzed.append(bug.web_link)  # for the bizarre error #338
-            time.sleep(self.delay)
+        try:
+            for bug in bugs:
+
+                if bug.web_link in analyzed:
+                    continue  # for the bizarre error #338
+                analyzed.add(bug.web_link)  # for the bizarre error #338
+
+                pending.append(pool.apply_async(self._analyze_task,
+                                                (bug.self_link,)))
+                if len(pending) > max_pending:
+                    store_issue(pending.popleft())
+
+            while pending:
+                store_issue(pending.popleft())
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
         try:
             # we read the temporary table with the relationships and create
@@ -21,9 +21,7 @@
 #
 
 import json
-import time
 import urllib2
-import base64
 import pprint
 import re
 
@@ -35,7 +33,8 @@ from BeautifulSoup import BeautifulSoup
 
 from bicho.config import Config
 from bicho.backends import Backend
-from bicho.utils import printdbg, printout
+from bicho.utils import printdbg, printout, urlopen, get_http_session, \
+    wait_delay
 from bicho.db.database import DBIssue, DBBackend, DBTracker, get_database
 from bicho.common import Tracker, Issue, People, Change, Comment
 
@@ -97,7 +96,68 @@ class DBRedmineIssueExtMySQL(DBRedmineIssueExt):
                     REFERENCES issues (id) \
                     ON DELETE CASCADE \
                     ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBRedmineIssueExtSQLite(DBRedmineIssueExt):
+    """
+    SQLite subclass of L{DBRedmineIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_redmine ( \
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                    category_id INTEGER, \
+                    done_ratio INTEGER, \
+                    due_date DATETIME, \
+                    estimated_hours INTEGER, \
+                    fixed_version_id INTEGER, \
+                    lft INTEGER, \
+                    rgt INTEGER, \
+                    lock_version INTEGER, \
+                    parent_id INTEGER, \
+                    project_id INTEGER, \
+                    root_id INTEGER, \
+                    start_date DATETIME, \
+                    tracker_id INTEGER, \
+                    updated_on DATETIME, \
+                    issue_id INTEGER, \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
+
+
+class DBRedmineIssueExtPostgreSQL(DBRedmineIssueExt):
+    """
+    PostgreSQL subclass of L{DBRedmineIssueExt}
+    """
+
+    # If the table is changed you need to remove old from database
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_redmine ( \
+                    id SERIAL, \
+                    category_id INTEGER, \
+                    done_ratio INTEGER, \
+                    due_date TIMESTAMP, \
+                    estimated_hours INTEGER, \
+                    fixed_version_id INTEGER, \
+                    lft INTEGER, \
+                    rgt INTEGER, \
+                    lock_version INTEGER, \
+                    parent_id INTEGER, \
+                    project_id INTEGER, \
+                    root_id INTEGER, \
+                    start_date TIMESTAMP, \
+                    tracker_id INTEGER, \
+                    updated_on TIMESTAMP, \
+                    issue_id INTEGER, \
+                    PRIMARY KEY(id), \
+                    FOREIGN KEY(issue_id) \
+                    REFERENCES issues (id) \
+                    ON DELETE CASCADE \
+                    ON UPDATE CASCADE \
+                     );'
 
 
 class DBRedmineBackend(DBBackend):
@@ -106,6 +166,8 @@ class DBRedmineBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBRedmineIssueExtMySQL]
+        self.SQLITE_EXT = [DBRedmineIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBRedmineIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
 
@@ -202,6 +264,10 @@ class Redmine():
             self.backend_password = None
             self.backend_user = None
 
+        if self.backend_user:
+            get_http_session().set_auth(self.backend_user,
+                                        self.backend_password)
+
     def _convert_to_datetime(self, str_date):
         """
         Returns datetime object from string
@@ -214,7 +280,7 @@ class Redmine():
     def _get_statuses(self):
         root = self._get_redmine_root(Config.url)
         statuses_url = root + "issue_statuses.json"
-        f = urllib2.urlopen(statuses_url)
+        f = urlopen(statuses_url)
         statuses = json.loads(f.read())
 
         for status in statuses["issue_statuses"]:
@@ -230,7 +296,7 @@ class Redmine():
         #print author_url
         identity = None
         try:
-            f = urllib2.urlopen(author_url)
+            f = urlopen(author_url)
             person = json.loads(f.read())
             identity = person['user']['mail']
         except (urllib2.HTTPError, KeyError):
@@ -345,7 +411,7 @@ class Redmine():
         issue_url = self._get_issue_url(issue_id)
 
         printdbg("Analyzing issue journals " + issue_url)
-        f = urllib2.urlopen(issue_url)
+        f = urlopen(issue_url)
         data = json.loads(f.read())
         journals = data["issue"]["journals"]
 
@@ -430,31 +496,23 @@ class Redmine():
         updated_on = bugsdb.get_last_modification_date(tracker_id=dbtrk.id)
         self.url_issues = self._get_issues_url(updated_on)
         url = self.url_issues + "&page=" + str(last_page)
-        request = urllib2.Request(url)
-
-        if self.backend_user:
-            base64string = base64.encodestring('%s:%s' % (Config.backend_user, Config.backend_password)).replace('\n', '')
-            request.add_header("Authorization", "Basic %s" % base64string)   
 
         # Get statuses
         self._get_statuses()
 
-        f = urllib2.urlopen(request)         
+        f = urlopen(url)
         tickets = json.loads(f.read())
         for ticket in tickets["issues"]:
             issue = self.analyze_bug(ticket)
             bugsdb.insert_issue(issue, dbtrk.id)
-            time.sleep(self.delay)
+            wait_delay()
 
         last_ticket = tickets["issues"][0]['id']
 
         while True:
             last_page += 1
             url = self.url_issues + "&page=" + str(last_page)
-            request = urllib2.Request(url)
-            #base64string = base64.encodestring('%s:%s' % (Config.backend_user, Config.backend_password)).replace('\n', '')
-            #request.add_header("Authorization", "Basic %s" % base64string)
-            f = urllib2.urlopen(request)
+            f = urlopen(url)
             tickets = json.loads(f.read())
 
             if len(tickets['issues']) == 0:
@@ -468,7 +526,7 @@ class Redmine():
             for ticket in tickets["issues"]:
                 issue = self.analyze_bug(ticket)
                 bugsdb.insert_issue(issue, dbtrk.id)
-                time.sleep(self.delay)
+                wait_delay()
 
         pprint.pprint("Total pages: " + str(last_page))
 
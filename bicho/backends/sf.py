@@ -27,9 +27,7 @@ The SourceForge backend is abandoned and nonfunctional as of November 2013.
 
 import re
 import urlparse
-import urllib2
 import sys
-import time
 
 import BeautifulSoup
 from storm.locals import Int, Unicode, Reference
@@ -38,7 +36,7 @@ from bicho.common import Issue, People, Tracker, Comment, Attachment, Change
 from bicho.backends import Backend
 from bicho.db.database import DBIssue, DBBackend, get_database
 from bicho.config import Config
-from bicho.utils import printdbg, printout, printerr
+from bicho.utils import printdbg, printout, printerr, urlopen, wait_delay
 
 from dateutil.parser import parse
 
@@ -152,7 +150,7 @@ class DBSourceForgeIssueExtMySQL(DBSourceForgeIssueExt):
                      id INTEGER NOT NULL AUTO_INCREMENT, \
                      category VARCHAR(32) NOT NULL, \
                      group_sf VARCHAR(32) NOT NULL, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(issue_id), \
                      INDEX ext_issue_idx(issue_id), \
@@ -160,7 +158,42 @@ class DBSourceForgeIssueExtMySQL(DBSourceForgeIssueExt):
                        REFERENCES issues (id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
+
+
+class DBSourceForgeIssueExtSQLite(DBSourceForgeIssueExt):
+    """
+    SQLite subclass of L{DBSourceForgeIssueExt}
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_sf ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     category VARCHAR(32) NOT NULL, \
+                     group_sf VARCHAR(32) NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues (id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBSourceForgeIssueExtPostgreSQL(DBSourceForgeIssueExt):
+    """
+    PostgreSQL subclass of L{DBSourceForgeIssueExt}
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_ext_sf ( \
+                     id SERIAL, \
+                     category TEXT NOT NULL, \
+                     group_sf TEXT NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues (id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
 
 
 class DBSourceForgeBackend(DBBackend):
@@ -169,6 +202,8 @@ class DBSourceForgeBackend(DBBackend):
     """
     def __init__(self):
         self.MYSQL_EXT = [DBSourceForgeIssueExtMySQL]
+        self.SQLITE_EXT = [DBSourceForgeIssueExtSQLite]
+        self.POSTGRESQL_EXT = [DBSourceForgeIssueExtPostgreSQL]
 
     def insert_issue_ext(self, store, issue, issue_id):
         """
@@ -640,7 +675,7 @@ class SourceForge():
             issue = self.__get_issue(url)
             self.__insert_issue(issue)
 
-            time.sleep(self.delay)
+            wait_delay()
 
         printout("Done. %s bugs analyzed" % (nbugs))
 
@@ -684,7 +719,7 @@ class SourceForge():
     def __get_html(self, url):
         """
         """
-        html = urllib2.urlopen(url).read()
+        html = urlopen(url).read()
         return html
 
     def __check_tracker_url(self, url):
@@ -721,7 +756,7 @@ Backend.register_backend('sf', SourceForge)
 
 if __name__ == "__main__":
     url = "http://sourceforge.net/tracker/?func=detail&aid=3178299&group_id=152568&atid=784665"
-    html = urllib2.urlopen(url)
+    html = urlopen(url)
 
     parser = SourceForgeParser()
     parser.parse_issue(html)
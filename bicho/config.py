@@ -24,6 +24,7 @@
 from backends import Backend
 import info
 from argparse import ArgumentParser
+from dateutil.tz import gettz
 import os
 import sys
 from urllib2 import Request, urlopen, urlparse, URLError, HTTPError
@@ -110,6 +111,12 @@ class Config():
         instance, invoking the Launchpad backend uses 'lp', and so the filename
         is 'lp.py'.
         """
+        if getattr(Config, 'db_convert_engine', False):
+            # Only the output database is needed to convert its tables
+            Config.check_params(['db_user_out', 'db_password_out',
+                                 'db_hostname_out', 'db_database_out'])
+            return
+
         Config.check_params(['url', 'backend'])
 
         if Config.backend + ".py" not in Backend.get_all_backends():
@@ -130,14 +137,27 @@ class Config():
         except ValueError, e:
             print("Not an URL: " + Config.url)
 
+        if getattr(Config, 'bg_timezone', None) and \
+                gettz(Config.bg_timezone) is None:
+            raise InvalidConfig('Unknown timezone "%s"' % Config.bg_timezone)
+
         if getattr(Config, 'input', None) == 'db':
             Config.check_params(['db_driver_in', 'db_user_in',
                                  'db_password_in', 'db_hostname_in',
                                  'db_port_in', 'db_database_in'])
         if getattr(Config, 'output', None) == 'db':
-            Config.check_params(['db_driver_out', 'db_user_out',
-                                 'db_password_out', 'db_hostname_out',
-                                 'db_port_out', 'db_database_out'])
+            if getattr(Config, 'db_driver_out', None) == 'sqlite':
+                Config.check_params(['db_database_out'])
+            else:
+                Config.check_params(['db_driver_out', 'db_user_out',
+                                     'db_password_out', 'db_hostname_out',
+                                     'db_database_out'])
+
+        # The issues log tables are only generated on MySQL databases
+        if getattr(Config, 'logtable', False) and \
+                getattr(Config, 'db_driver_out', None) != 'mysql':
+            raise InvalidConfig('Issues log table is only supported '
+                                'by MySQL output databases')
 
     @staticmethod
     def clean_empty_options(options):
@@ -180,26 +200,85 @@ class Config():
         parser.add_argument('-c', '--cfg', dest='cfgfile',
                             help='Use a custom configuration file', default=None)
         parser.add_argument('-d', '--delay', type=int, dest='delay',
-                            help='Delay in seconds betweeen petitions to avoid been banned',
+                            help='Delay in seconds between the issues retrieved by '
+                            'each worker to avoid been banned',
                             default='5')
+        parser.add_argument('--rate', type=float, dest='rate',
+                            help='Maximum number of requests per second. '
+                            'When it is set, --delay is not waited '
+                            '(default: no limit)',
+                            default=None)
+        parser.add_argument('--burst', type=int, dest='burst',
+                            help='Number of requests allowed at once before '
+                            'limiting the rate', default='1')
+        parser.add_argument('-w', '--workers', type=int, dest='workers',
+                            help='Number of concurrent requests to the tracker',
+                            default='4')
         parser.add_argument('-g', '--debug', action='store_true', dest='debug',
                             help='Enable debug mode', default=False)
+        parser.add_argument('--bg-webservice', action='store_true',
+                            dest='bg_webservice',
+                            help='Retrieve the activity of the issues using '
+                            'the WebService of Bugzilla, when it is '
+                            'available (bg backend)', default=False)
+        parser.add_argument('--bg-timezone', dest='bg_timezone',
+                            help='Timezone of the dates shown by Bugzilla, '
+                            'like America/New_York. The dates of the '
+                            'WebService, given in UTC, are moved to it, so '
+                            'it is needed by --bg-webservice (bg backend)',
+                            default=None)
+        parser.add_argument('--bg-shards', type=int, dest='bg_shards',
+                            help='Split the whole history of the product in '
+                            'this number of date ranges, retrieved '
+                            'concurrently. Meant for the initial import; '
+                            'an interrupted one is resumed by the next run '
+                            '(bg backend)', default=1)
         parser.add_argument('--gerrit-project', dest='gerrit_project',
                             help='Project to be analyzed (gerrit backend)',
                             default=None)
+        parser.add_argument('--github-bulk', action='store_true',
+                            dest='github_bulk',
+                            help='Retrieve the comments and events of all '
+                            'the issues of the repository at once, instead '
+                            'of issue by issue. They are kept in a temporary '
+                            'file until their issues are stored (github '
+                            'backend)',
+                            default=False)
+        parser.add_argument('--jira-fields', dest='jira_fields',
+                            help='Comma separated list of fields of the '
+                            'issues to retrieve besides the ones stored by '
+                            'Bicho (atljira backend)', default=None)
+        parser.add_argument('--jira-parallel', action='store_true',
+                            dest='jira_parallel',
+                            help='Retrieve the issues by ranges of keys, '
+                            'using all the workers, when the project was not '
+                            'imported yet. An interrupted import is resumed '
+                            'by the next run (atljira backend)',
+                            default=False)
         parser.add_argument('-i', '--input', choices=['url', 'db'],
                             dest='input', help='Input format', default='url')
         parser.add_argument('-o', '--output', choices=['db'],
                             dest='output', help='Output format', default='db')
         parser.add_argument('-p', '--path', dest='path',
-                            help='Path where downloaded URLs will be stored',
+                            help='Path where downloaded URLs will be stored '
+                            '(default: ~/.bicho/cache)', default=None)
+        parser.add_argument('--cache-size', type=int, dest='cache_size',
+                            help='Cache downloaded URLs, up to the given '
+                            'size in megabytes; 0 disables it (default: '
+                            'disabled, but for the github backend)',
                             default=None)
+        parser.add_argument('--cache-replay', action='store_true',
+                            dest='cache_replay',
+                            help='Use the cached URLs without checking '
+                            'whether they were modified, e.g. to resume '
+                            'a crashed run', default=False)
         parser.add_argument('-u', '--url', dest='url',
                             help='URL to get issues from using the backend',
                             default=None)
         parser.add_argument('-l', '--logtable', action='store_true',
                             dest='logtable',
-                            help='Enable generation of issues log table',
+                            help='Enable generation of issues log table '
+                            '(MySQL only)',
                             default=False)
 
         # Options for output database
@@ -216,10 +295,26 @@ class Config():
                            help='Name of the host where database server is running',
                            default='localhost')
         group.add_argument('--db-port-out', dest='db_port_out',
-                           help='Port of the host where database server is running',
-                           default='3306')
+                           help='Port of the host where database server is '
+                           'running (default: 3306 for MySQL, 5432 for '
+                           'PostgreSQL)', default=None)
         group.add_argument('--db-database-out', dest='db_database_out',
-                           help='Output database name', default=None)
+                           help='Output database name (path of the file '
+                           'for SQLite)', default=None)
+        group.add_argument('--db-engine-out', choices=['MyISAM', 'InnoDB'],
+                           dest='db_engine_out',
+                           help='Storage engine of the tables (MySQL only)',
+                           default='MyISAM')
+        group.add_argument('--db-convert-engine', action='store_true',
+                           dest='db_convert_engine',
+                           help='Convert the tables of the output database '
+                           'to the storage engine set by --db-engine-out '
+                           'and exit', default=False)
+        group.add_argument('--db-bulk-insert', action='store_true',
+                           dest='db_bulk_insert',
+                           help='Store comments, changes, attachments and '
+                           'watchers using multi-row INSERT statements',
+                           default=False)
 
         # Options for input database
         group = parser.add_argument_group('Input database specific options')
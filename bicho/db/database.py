@@ -25,14 +25,75 @@ Database module
 """
 
 import datetime
+import hashlib
+
+from collections import OrderedDict
 
 from storm.exceptions import IntegrityError # DatabaseError,
 from storm.locals import DateTime, Int, Reference, Unicode
 
-from bicho.utils import printdbg
+from bicho.utils import printdbg, printerr, printout
 from bicho.config import Config
 
 
+# Limits for each multi-row INSERT statement used in bulk mode. The size
+# limit keeps statements below the default max_allowed_packet of MySQL.
+MAX_BULK_INSERT_ROWS = 500
+MAX_BULK_INSERT_SIZE = 512 * 1024
+
+# Maximum number of identities kept in memory by L{PeopleCache}
+PEOPLE_CACHE_SIZE = 100000
+
+# Columns used to calculate the content hash of the rows of each table
+HASHED_COLUMNS = {
+    'comments': ('text', 'submitted_on'),
+    'attachments': ('url', 'submitted_on'),
+    'changes': ('field', 'old_value', 'new_value', 'changed_on')}
+
+
+def content_hash(*values):
+    """
+    Return the SHA-1 digest of the given values.
+
+    Comments, attachments and changes store the hash of the columns
+    listed in L{HASHED_COLUMNS}, so duplicates are found using an
+    index instead of comparing TEXT columns.
+
+    @return: hexadecimal digest
+    @rtype: C{unicode}
+    """
+    digest = hashlib.sha1()
+
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            value = value.strftime('%Y-%m-%d %H:%M:%S')
+        digest.update(unicode(value).encode('utf-8'))
+        digest.update('\0')
+    return unicode(digest.hexdigest())
+
+
+def comment_hash(comment):
+    """
+    Return the content hash of a L{Comment}
+    """
+    return content_hash(comment.comment, comment.submitted_on)
+
+
+def attachment_hash(attachment):
+    """
+    Return the content hash of an L{Attachment}
+    """
+    return content_hash(attachment.url, attachment.submitted_on)
+
+
+def change_hash(change):
+    """
+    Return the content hash of a L{Change}
+    """
+    return content_hash(change.field, change.old_value, change.new_value,
+                        change.changed_on)
+
+
 class NotFoundError(Exception):
     """
     Exception raised when an entry is not found into the database.
@@ -47,6 +108,48 @@ class NotFoundError(Exception):
         return repr(self.msg)
 
 
+class PeopleCache:
+    """
+    Map of user identifiers to the identifiers of the X{people} table.
+
+    The number of entries is bounded. When the cache is full, the
+    least recently used entry is discarded.
+
+    @param size: maximum number of entries
+    @type size: C{int}
+    """
+    def __init__(self, size=PEOPLE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        """
+        Return the identifier of X{user_id} or C{None} when it is
+        not cached.
+        """
+        try:
+            people_id = self.entries.pop(user_id)
+        except KeyError:
+            return None
+        self.entries[user_id] = people_id
+        return people_id
+
+    def set(self, user_id, people_id):
+        """
+        Cache the identifier of X{user_id}.
+        """
+        self.entries.pop(user_id, None)
+        self.entries[user_id] = people_id
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all the entries.
+        """
+        self.entries.clear()
+
+
 class DBDatabase:
     """
     """
@@ -54,19 +157,93 @@ class DBDatabase:
         self.database = None
         self.store = None
         self.backend = backend
+        self.bulk_insert = getattr(Config, 'db_bulk_insert', False)
+        self.people_cache = PeopleCache()
+        # Maximum number of parameters of a statement, if any
+        self.max_params = None
 
     def create_tables(self, clsl):
         """
         Create the database tables.
 
         SQL query with the structure of each table is stored into
-        X{__sql_table__} attribute of database classes.
+        X{__sql_table__} attribute of database classes. Dialects which
+        do not support inline index definitions store the queries to
+        create them into X{__sql_indexes__}.
 
         @param clsl: a list of database classes
         @type clsl: C{list} of L{object}
         """
         for c in clsl:
             self.store.execute(c.__sql_table__)
+            for index in getattr(c, '__sql_indexes__', []):
+                self.store.execute(index)
+
+    def upgrade_tables(self):
+        """
+        Upgrade the tables created by older versions of Bicho.
+
+        Adds the X{hash} column to the tables listed in
+        L{HASHED_COLUMNS}, calculates it for the stored rows and
+        creates its index. The index is created at the end, so an
+        interrupted upgrade is resumed on the next run.
+        """
+        for table, columns in HASHED_COLUMNS.items():
+            index = table + '_hash_idx'
+            if self._has_index(table, index):
+                continue
+
+            if not self._has_column(table, 'hash'):
+                self.store.execute('ALTER TABLE %s ADD COLUMN hash CHAR(40) NULL'
+                                   % table)
+            self._backfill_hashes(table, columns)
+            self.store.execute('CREATE INDEX %s ON %s (issue_id, hash)'
+                               % (index, table))
+            self.store.commit()
+
+    def _backfill_hashes(self, table, columns):
+        """
+        Calculate the content hash of the rows of X{table} that
+        do not have it.
+        """
+        printout("Calculating content hashes of table %s" % table)
+
+        select = 'SELECT id, %s FROM %s WHERE id > ? AND hash IS NULL ' \
+            'ORDER BY id LIMIT %d' % (', '.join(columns), table,
+                                      self._get_max_rows(3))
+        last_id = 0
+
+        while True:
+            rows = self.store.execute(select, (last_id,)).get_all()
+            if not rows:
+                break
+
+            params = []
+            for row in rows:
+                params.extend([row[0], content_hash(*row[1:])])
+            params.extend([row[0] for row in rows])
+
+            sql = 'UPDATE %s SET hash = CASE id %s END WHERE id IN (%s)' % \
+                (table, ' '.join(['WHEN ? THEN ?'] * len(rows)),
+                 ', '.join(['?'] * len(rows)))
+            self.store.execute(sql, params, noresult=True)
+            self.store.commit()
+
+            last_id = rows[-1][0]
+            printdbg("Content hashes of %s calculated up to id %s"
+                     % (table, last_id))
+
+    def _has_column(self, table, column):
+        """
+        Abstract method for checking whether X{table} has the given column
+        """
+        raise NotImplementedError
+
+    def _has_index(self, table, index):
+        """
+        Abstract method for checking whether X{table} has the given index
+        """
+        raise NotImplementedError
 
     def insert_supported_traker(self, name, version):
         """
@@ -125,16 +302,15 @@ class DBDatabase:
         @rtype: L{People}
         """
         try:
-            db_people = DBPeople(people.user_id)
-            db_people.set_name(people.name)
-            db_people.set_email(people.email)
-            self.store.add(db_people)
+            people_id = self._get_people_id(people)
             self.store.commit()
-        except IntegrityError:
-            db_people = self._get_db_people(people.user_id)
-        return db_people
+        except:
+            self.people_cache.clear()
+            self.store.rollback()
+            raise
+        return self.store.get(DBPeople, people_id)
 
-    def insert_issue(self, issue, tracker_id):
+    def insert_issue(self, issue, tracker_id, checkpoints=None):
         """
         Insert the given issue managed by the tracker with X{tracker_id}.
 
@@ -142,14 +318,23 @@ class DBDatabase:
         @type issue: L{Issue}
         @param tracker_id: identifier of the tracker
         @type tracker_id: C{int}
+        @param checkpoints: positions of the checkpoints of the tracker
+          reached once the issue is stored, indexed by name; they are
+          committed together with the issue
+        @type checkpoints: C{dict}
 
         @return: the inserted issue
         @rtype: L{DBIssue}
         """
+        if self.bulk_insert:
+            return self.insert_issues([issue], tracker_id, checkpoints)[0]
 
         newIssue = False;
 
         try:
+            # Identities of the issue are resolved at once
+            people = self._get_people_ids(self._get_issues_people([issue]))
+
             db_issue = self._get_db_issue(issue.issue, tracker_id)
 
             #if issue does not in the tracker, we create a new one
@@ -164,13 +349,13 @@ class DBDatabase:
             db_issue.status = unicode(issue.status)
             db_issue.resolution = unicode(issue.resolution)
             db_issue.priority = unicode(issue.priority)
-            db_issue.submitted_by = self.insert_people(issue.submitted_by).id
+            db_issue.submitted_by = self._get_people_id(issue.submitted_by)
 
 
             db_issue.submitted_on = issue.submitted_on
 
             if issue.assigned_to is not None:
-                db_issue.assigned_to = self.insert_people(issue.assigned_to).id
+                db_issue.assigned_to = self._get_people_id(issue.assigned_to)
 
             #if issue is new, we add to the data base before the flush()
             if newIssue == True:
@@ -190,46 +375,517 @@ class DBDatabase:
                     if self.backend is not None:
                         self.backend.insert_temp_rel(self.store, trel, db_trel, tracker_id)
 
+            comments, attachments, changes = \
+                self._get_new_children(issue, db_issue.id, newIssue)
+
             # Insert comments
-            for comment in issue.comments:
-                db_comment = self._get_db_comment(comment, db_issue.id, tracker_id)
-                if db_comment == -1:
-                    db_comment = self._insert_comment(comment, db_issue.id, tracker_id)
-                    if self.backend is not None:
-                        self.backend.insert_comment_ext(self.store, comment, db_comment.id)
+            for comment in comments:
+                db_comment = self._insert_comment(comment, db_issue.id, tracker_id)
+                if self.backend is not None:
+                    self.backend.insert_comment_ext(self.store, comment, db_comment.id)
 
             # Insert attachments
-            for attachment in issue.attachments:
-                db_attch = self._get_db_attachment(attachment, db_issue.id, tracker_id)
-                if db_attch == -1:
-                    db_attch = self._insert_attachment(attachment, db_issue.id, tracker_id)
-                    if self.backend is not None:
-                        self.backend.insert_attachment_ext(self.store, attachment, db_attch.id)
+            for attachment in attachments:
+                db_attch = self._insert_attachment(attachment, db_issue.id, tracker_id)
+                if self.backend is not None:
+                    self.backend.insert_attachment_ext(self.store, attachment, db_attch.id)
 
             # Insert changes
-            for change in issue.changes:
-                db_change = self._get_db_change(change, db_issue.id, tracker_id)
-                if db_change == -1:
-                    db_change = self._insert_change(change, db_issue.id, tracker_id)
-                    if self.backend is not None:
-                        self.backend.insert_change_ext(self.store, change, db_change.id)
+            for change in changes:
+                db_change = self._insert_change(change, db_issue.id, tracker_id)
+                if self.backend is not None:
+                    self.backend.insert_change_ext(self.store, change, db_change.id)
+
+            # Insert CC/watchers not stored yet. Duplicated rows are not
+            # inserted; otherwise, the transaction would be aborted on
+            # some databases
+            for issue_id, person_id in self._get_new_watchers(issue, db_issue.id,
+                                                              newIssue, people):
+                self.store.add(DBIssuesWatchers(issue_id, person_id))
+            self.store.flush()
 
-            # Insert CC/watchers
-            for person in issue.watchers:
-                try:
-                    #db_issues_watchers = self._insert_issues_watchers(person, db_issue.id,
-                    #                                                  tracker_id)
-                    self._insert_issues_watchers(person, db_issue.id, tracker_id)
-                except:
-                    None
+            if checkpoints:
+                self._update_checkpoints(tracker_id, checkpoints)
 
             self.store.commit()
 
             return db_issue
         except:
+            self.people_cache.clear()
+            self.store.rollback()
+            raise
+
+    def insert_issues(self, issues, tracker_id, checkpoints=None):
+        """
+        Insert the given list of issues managed by the tracker with
+        X{tracker_id}.
+
+        When bulk mode is enabled, the comments, attachments, changes
+        and watchers of all the issues are written using multi-row
+        INSERT statements and the whole list is stored in a single
+        transaction. Otherwise, issues are inserted one by one using
+        L{insert_issue}.
+
+        @param issues: issues to insert
+        @type issues: C{list} of L{Issue}
+        @param tracker_id: identifier of the tracker
+        @type tracker_id: C{int}
+        @param checkpoints: positions of the checkpoints of the tracker
+          reached once the issues are stored, indexed by name; they are
+          committed together with the last issue
+        @type checkpoints: C{dict}
+
+        @return: the inserted issues
+        @rtype: C{list} of L{DBIssue}
+        """
+        if not issues:
+            if checkpoints:
+                self.set_checkpoints(tracker_id, checkpoints)
+            return []
+
+        if not self.bulk_insert:
+            db_issues = [self.insert_issue(issue, tracker_id)
+                         for issue in issues[:-1]]
+            db_issues.append(self.insert_issue(issues[-1], tracker_id,
+                                               checkpoints))
+            return db_issues
+
+        try:
+            people = self._get_people_ids(self._get_issues_people(issues))
+
+            db_issues = []
+            comments = []
+            attachments = []
+            changes = []
+            watchers = []
+
+            for issue in issues:
+                db_issue, new_issue = self._update_db_issue(issue, tracker_id,
+                                                            people)
+                db_issues.append(db_issue)
+
+                # Insert temporal relationships
+                for trel in issue.temp_relationships:
+                    db_trel = -1
+                    if not new_issue:
+                        db_trel = self._get_db_temp_rel(trel, db_issue.id)
+                    if db_trel == -1:
+                        db_trel = self._insert_temp_rel(trel, db_issue.id, tracker_id)
+                        if self.backend is not None:
+                            self.backend.insert_temp_rel(self.store, trel, db_trel, tracker_id)
+
+                new_comments, new_attachments, new_changes = \
+                    self._get_new_children(issue, db_issue.id, new_issue)
+                comments.extend([(db_issue.id, c) for c in new_comments])
+                attachments.extend([(db_issue.id, a) for a in new_attachments])
+                changes.extend([(db_issue.id, c) for c in new_changes])
+
+                watchers.extend(self._get_new_watchers(issue, db_issue.id,
+                                                       new_issue, people))
+
+            self._bulk_insert_comments(comments, people)
+            self._bulk_insert_attachments(attachments, people)
+            self._bulk_insert_changes(changes, people)
+            self._insert_rows('issues_watchers', ('issue_id', 'person_id'),
+                              watchers)
+
+            if checkpoints:
+                self._update_checkpoints(tracker_id, checkpoints)
+
+            self.store.commit()
+
+            return db_issues
+        except:
+            self.people_cache.clear()
             self.store.rollback()
             raise
 
+    def _get_issues_people(self, issues):
+        """
+        Return the identities involved in the given issues.
+
+        @param issues: list of issues
+        @type issues: C{list} of L{Issue}
+
+        @return: list of identities
+        @rtype: C{list} of L{People}
+        """
+        persons = []
+
+        for issue in issues:
+            persons.extend([issue.submitted_by, issue.assigned_to])
+            persons.extend([c.submitted_by for c in issue.comments])
+            persons.extend([a.submitted_by for a in issue.attachments])
+            persons.extend([c.changed_by for c in issue.changes])
+            persons.extend(issue.watchers)
+        return [p for p in persons if p is not None]
+
+    def _get_people_id(self, people):
+        """
+        Get the database identifier of the given identity, inserting
+        it when it is not stored yet.
+
+        @param people: identity
+        @type people: L{People}
+
+        @return: identifier of the identity in X{people} table
+        @rtype: C{int}
+        """
+        return self._get_people_ids([people])[unicode(people.user_id)]
+
+    def _get_people_ids(self, persons):
+        """
+        Get the database identifiers of the given identities.
+
+        Identifiers are taken from the cache of identities. Those
+        not found in it are looked up in the database in groups,
+        and the unknown ones are inserted using multi-row statements.
+        New identities are not committed.
+
+        @param persons: list of identities
+        @type persons: C{list} of L{People}
+
+        @return: identifiers indexed by user identifier
+        @rtype: C{dict}
+        """
+        ids = {}
+        missing = OrderedDict()
+
+        for person in persons:
+            user_id = unicode(person.user_id)
+            if user_id in ids or user_id in missing:
+                continue
+            people_id = self.people_cache.get(user_id)
+            if people_id is None:
+                missing[user_id] = person
+            else:
+                ids[user_id] = people_id
+
+        for user_id, people_id in self._find_people_ids(missing.keys()).iteritems():
+            del missing[user_id]
+            ids[user_id] = people_id
+
+        if missing:
+            ids.update(self._insert_people_rows(missing.values()))
+
+        for user_id, people_id in ids.iteritems():
+            # Identities that could not be stored are not cached
+            if people_id is not None:
+                self.people_cache.set(user_id, people_id)
+        return ids
+
+    def _find_people_ids(self, user_ids):
+        """
+        Look up the database identifiers of the given user identifiers
+        in groups.
+
+        @return: identifiers of the stored ones indexed by user
+          identifier
+        @rtype: C{dict}
+        """
+        ids = {}
+        wanted = set(user_ids)
+        for i in range(0, len(user_ids), MAX_BULK_INSERT_ROWS):
+            chunk = user_ids[i:i + MAX_BULK_INSERT_ROWS]
+            result = self.store.find((DBPeople.user_id, DBPeople.id),
+                                     DBPeople.user_id.is_in(chunk))
+            for user_id, people_id in result:
+                if user_id in wanted:
+                    ids[user_id] = people_id
+        return ids
+
+    def _insert_people_rows(self, persons):
+        """
+        Insert the given identities using multi-row statements.
+
+        When one of the identities is already stored (i.e, it matches
+        another user identifier under the collation of the database)
+        they are inserted one by one, taking the identifier of the
+        stored ones.
+
+        @return: identifiers indexed by user identifier
+        @rtype: C{dict}
+        """
+        columns = ('user_id', 'name', 'email')
+        rows = [(unicode(p.user_id), unicode(p.name), unicode(p.email))
+                for p in persons]
+
+        # Savepoints keep the transaction usable after a failed
+        # statement on those databases that abort it, like PostgreSQL
+        self.store.execute('SAVEPOINT people_rows', noresult=True)
+        try:
+            ids = self._insert_rows('people', columns, rows)
+            self.store.execute('RELEASE SAVEPOINT people_rows', noresult=True)
+            return dict(zip([row[0] for row in rows], ids))
+        except IntegrityError:
+            self.store.execute('ROLLBACK TO SAVEPOINT people_rows',
+                               noresult=True)
+            self.store.execute('RELEASE SAVEPOINT people_rows', noresult=True)
+
+        # Non transactional engines, like MyISAM, keep the rows inserted
+        # before the failure, so they are looked up again
+        ids = self._find_people_ids([row[0] for row in rows])
+        for row in rows:
+            if row[0] in ids:
+                continue
+            self.store.execute('SAVEPOINT people_row', noresult=True)
+            try:
+                ids[row[0]] = self._insert_rows('people', columns, [row])[0]
+            except IntegrityError:
+                self.store.execute('ROLLBACK TO SAVEPOINT people_row',
+                                   noresult=True)
+                db_people = self._get_db_people(row[0])
+                ids[row[0]] = db_people.id
+            self.store.execute('RELEASE SAVEPOINT people_row', noresult=True)
+        return ids
+
+    def _update_db_issue(self, issue, tracker_id, people):
+        """
+        Insert or update the main data of the given issue, including
+        the extra data managed by the backend.
+
+        @return: the stored issue and whether it is a new one
+        @rtype: C{tuple} of (L{DBIssue}, C{bool})
+        """
+        new_issue = False
+        db_issue = self._get_db_issue(issue.issue, tracker_id)
+
+        if db_issue == -1:
+            new_issue = True
+            db_issue = DBIssue(issue.issue, tracker_id)
+
+        db_issue.type = unicode(issue.type)
+        db_issue.summary = unicode(issue.summary)
+        db_issue.description = unicode(issue.description)
+        db_issue.status = unicode(issue.status)
+        db_issue.resolution = unicode(issue.resolution)
+        db_issue.priority = unicode(issue.priority)
+        db_issue.submitted_by = people[unicode(issue.submitted_by.user_id)]
+        db_issue.submitted_on = issue.submitted_on
+
+        if issue.assigned_to is not None:
+            db_issue.assigned_to = people[unicode(issue.assigned_to.user_id)]
+
+        if new_issue:
+            self.store.add(db_issue)
+
+        self.store.flush()
+
+        if self.backend is not None:
+            self.backend.insert_issue_ext(self.store, issue, db_issue.id)
+
+        return db_issue, new_issue
+
+    def _get_new_children(self, issue, issue_id, new_issue):
+        """
+        Return the comments, attachments and changes of the given issue
+        that are not stored yet.
+
+        The hashes of the stored children are retrieved with a single
+        query per table and compared against the parsed issue, instead
+        of looking for each child on the database. Children of new
+        issues can not be stored yet, so there is no need to look
+        for them.
+
+        @return: new comments, attachments and changes
+        @rtype: C{tuple} of (C{list} of L{Comment}, C{list} of
+            L{Attachment}, C{list} of L{Change})
+        """
+        children = ((DBComment, issue.comments, comment_hash),
+                    (DBAttachment, issue.attachments, attachment_hash),
+                    (DBChange, issue.changes, change_hash))
+        result = []
+
+        for db_class, objs, hash_func in children:
+            stored = set()
+            if not new_issue and objs:
+                stored = set(self.store.find(db_class.hash,
+                                             db_class.issue_id == issue_id))
+            new_objs = []
+            for obj in objs:
+                hash = hash_func(obj)
+                if hash not in stored:
+                    stored.add(hash)
+                    new_objs.append(obj)
+            result.append(new_objs)
+        return tuple(result)
+
+    def _get_new_watchers(self, issue, issue_id, new_issue, people):
+        """
+        Return the rows of X{issues_watchers} not stored yet for the
+        given issue.
+        """
+        stored = set()
+        if not new_issue:
+            stored = set(self.store.find(DBIssuesWatchers.person_id,
+                                         DBIssuesWatchers.issue_id == issue_id))
+        rows = []
+        for person in issue.watchers:
+            person_id = people[unicode(person.user_id)]
+            if person_id not in stored:
+                stored.add(person_id)
+                rows.append((issue_id, person_id))
+        return rows
+
+    def _bulk_insert_comments(self, comments, people):
+        """
+        Insert a list of (issue_id, L{Comment}) pairs calling the
+        backend hook with the identifier of each stored comment.
+        """
+        rows = [(issue_id, unicode(c.comment), people[unicode(c.submitted_by.user_id)],
+                 c.submitted_on, comment_hash(c))
+                for issue_id, c in comments]
+        ids = self._insert_rows('comments', ('issue_id', 'text', 'submitted_by',
+                                             'submitted_on', 'hash'), rows)
+
+        if self.backend is None:
+            return
+        for (issue_id, comment), comment_id in zip(comments, ids):
+            if comment_id is not None:
+                self.backend.insert_comment_ext(self.store, comment, comment_id)
+
+    def _bulk_insert_attachments(self, attachments, people):
+        """
+        Insert a list of (issue_id, L{Attachment}) pairs calling the
+        backend hook with the identifier of each stored attachment.
+        """
+        rows = []
+        for issue_id, a in attachments:
+            submitted_by = None
+            if a.submitted_by is not None:
+                submitted_by = people[unicode(a.submitted_by.user_id)]
+            rows.append((issue_id, unicode(a.name), unicode(a.description),
+                         unicode(a.url), submitted_by, a.submitted_on,
+                         attachment_hash(a)))
+        ids = self._insert_rows('attachments', ('issue_id', 'name', 'description',
+                                                'url', 'submitted_by',
+                                                'submitted_on', 'hash'), rows)
+
+        if self.backend is None:
+            return
+        for (issue_id, attachment), attch_id in zip(attachments, ids):
+            if attch_id is not None:
+                self.backend.insert_attachment_ext(self.store, attachment, attch_id)
+
+    def _bulk_insert_changes(self, changes, people):
+        """
+        Insert a list of (issue_id, L{Change}) pairs calling the
+        backend hook with the identifier of each stored change.
+        """
+        rows = [(issue_id, unicode(c.field), unicode(c.old_value),
+                 unicode(c.new_value), people[unicode(c.changed_by.user_id)],
+                 c.changed_on, change_hash(c))
+                for issue_id, c in changes]
+        ids = self._insert_rows('changes', ('issue_id', 'field', 'old_value',
+                                            'new_value', 'changed_by',
+                                            'changed_on', 'hash'), rows)
+
+        if self.backend is None:
+            return
+        for (issue_id, change), change_id in zip(changes, ids):
+            if change_id is not None:
+                self.backend.insert_change_ext(self.store, change, change_id)
+
+    def _insert_rows(self, table, columns, rows):
+        """
+        Insert the given rows into X{table} using multi-row INSERT
+        statements.
+
+        Rows that can not be encoded are skipped and their identifier
+        is set to C{None}.
+
+        @param table: name of the table
+        @type table: C{str}
+        @param columns: names of the columns to fill
+        @type columns: C{tuple} of C{str}
+        @param rows: values to insert, one tuple per row
+        @type rows: C{list} of C{tuple}
+
+        @return: identifiers of the inserted rows, in the same order
+        @rtype: C{list} of C{int}
+        """
+        ids = []
+
+        for chunk in self._split_rows(rows):
+            try:
+                ids.extend(self._execute_insert(table, columns, chunk))
+            except UnicodeEncodeError:
+                if len(chunk) == 1:
+                    printerr("UnicodeEncodeError: one row of the table "
+                             "%s couldn't be stored" % (table))
+                    ids.append(None)
+                else:
+                    ids.extend([self._insert_rows(table, columns, [row])[0]
+                                for row in chunk])
+        return ids
+
+    def _split_rows(self, rows):
+        """
+        Split the given rows in chunks small enough to be inserted
+        with a single statement.
+        """
+        chunk = []
+        size = 0
+
+        for row in rows:
+            max_rows = self._get_max_rows(len(row))
+            row_size = sum([len(v) for v in row if isinstance(v, basestring)])
+            if chunk and (len(chunk) >= max_rows or
+                          size + row_size > MAX_BULK_INSERT_SIZE):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(row)
+            size += row_size
+
+        if chunk:
+            yield chunk
+
+    def _get_max_rows(self, nparams):
+        """
+        Return the maximum number of rows handled by a single statement
+        when each row needs X{nparams} parameters.
+        """
+        if self.max_params is None:
+            return MAX_BULK_INSERT_ROWS
+        return max(1, min(MAX_BULK_INSERT_ROWS, self.max_params / nparams))
+
+    def _execute_insert(self, table, columns, rows):
+        """
+        Run a multi-row INSERT statement.
+
+        @return: identifiers of the inserted rows, in the same order
+        @rtype: C{list} of C{int}
+        """
+        marks = '(' + ', '.join(['?'] * len(columns)) + ')'
+        sql = 'INSERT INTO %s (%s) VALUES %s' % (table, ', '.join(columns),
+                                                 ', '.join([marks] * len(rows)))
+        params = []
+        for row in rows:
+            params.extend(row)
+
+        self.store.execute(sql, params, noresult=True)
+        first_id = self._get_first_insert_id(len(rows))
+        step = self._get_insert_id_step()
+        return range(first_id, first_id + len(rows) * step, step)
+
+    def _get_first_insert_id(self, nrows):
+        """
+        Abstract method for obtaining the identifier of the first row
+        inserted by the last multi-row INSERT statement.
+
+        @param nrows: number of rows inserted by the statement
+        @type nrows: C{int}
+        """
+        raise NotImplementedError
+
+    def _get_insert_id_step(self):
+        """
+        Return the difference between the identifiers of two rows
+        inserted one after the other by the same statement.
+        """
+        return 1
+
     def get_last_modification_date(self, state=None, tracker_id=None):
         """
         Return last modification date stored in database
@@ -242,6 +898,84 @@ class DBDatabase:
             else:
                 return self.backend.get_last_modification_date(self.store, tracker_id)
 
+    def get_checkpoints(self, tracker_id, prefix):
+        """
+        Return the checkpoints of the tracker with X{tracker_id} whose
+        name starts with X{prefix}.
+
+        @param tracker_id: identifier of the tracker
+        @type tracker_id: C{int}
+        @param prefix: prefix of the names
+        @type prefix: C{str}
+
+        @return: positions indexed by name
+        @rtype: C{dict}
+        """
+        result = self.store.find((DBCheckpoint.name, DBCheckpoint.position),
+                                 DBCheckpoint.tracker_id == tracker_id,
+                                 DBCheckpoint.name.like(unicode(prefix) + u'%'))
+        return dict(result)
+
+    def set_checkpoint(self, tracker_id, name, position=None):
+        """
+        Store the position of the checkpoint X{name} of the tracker
+        with X{tracker_id}. The checkpoint is committed.
+
+        @param tracker_id: identifier of the tracker
+        @type tracker_id: C{int}
+        @param name: name of the checkpoint
+        @type name: C{str}
+        @param position: position reached
+        @type position: C{str}
+        """
+        self.set_checkpoints(tracker_id, {name: position})
+
+    def set_checkpoints(self, tracker_id, positions):
+        """
+        Store the positions of several checkpoints of the tracker with
+        X{tracker_id}. They are committed at once.
+
+        @param tracker_id: identifier of the tracker
+        @type tracker_id: C{int}
+        @param positions: positions indexed by name of the checkpoint
+        @type positions: C{dict}
+        """
+        try:
+            self._update_checkpoints(tracker_id, positions)
+            self.store.commit()
+        except:
+            self.store.rollback()
+            raise
+
+    def _update_checkpoints(self, tracker_id, positions):
+        """
+        Store the positions of several checkpoints of the tracker with
+        X{tracker_id}, without committing them.
+        """
+        for name, position in positions.items():
+            db_checkpoint = self.store.find(DBCheckpoint,
+                                            DBCheckpoint.tracker_id == tracker_id,
+                                            DBCheckpoint.name == unicode(name)).one()
+            if db_checkpoint is None:
+                db_checkpoint = DBCheckpoint(tracker_id, name)
+                self.store.add(db_checkpoint)
+            db_checkpoint.position = position and unicode(position)
+
+    def delete_checkpoints(self, tracker_id, prefix):
+        """
+        Remove the checkpoints of the tracker with X{tracker_id} whose
+        name starts with X{prefix}. The removal is committed.
+
+        @param tracker_id: identifier of the tracker
+        @type tracker_id: C{int}
+        @param prefix: prefix of the names
+        @type prefix: C{str}
+        """
+        self.store.find(DBCheckpoint,
+                        DBCheckpoint.tracker_id == tracker_id,
+                        DBCheckpoint.name.like(unicode(prefix) + u'%')).remove()
+        self.store.commit()
+
     def _insert_relationship(self, issue_id, type, rel_id):
         """
         Insert a relationship between the given issues.
@@ -304,9 +1038,9 @@ class DBDatabase:
         @return: the inserted comment
         @rtype: L{DBComment}
         """
-        submitted_by = self.insert_people(comment.submitted_by)
+        submitted_by = self._get_people_id(comment.submitted_by)
 
-        db_comment = DBComment(comment.comment, submitted_by.id,
+        db_comment = DBComment(comment.comment, submitted_by,
                                comment.submitted_on, issue_id)
         self.store.add(db_comment)
         try:
@@ -331,8 +1065,7 @@ class DBDatabase:
         @rtype: L{DBAttachment}
         """
         if attachment.submitted_by is not None:
-            submitter = self.insert_people(attachment.submitted_by)
-            submitted_by = submitter.id
+            submitted_by = self._get_people_id(attachment.submitted_by)
         else:
             submitted_by = None
 
@@ -357,29 +1090,14 @@ class DBDatabase:
         @return: the inserted change
         @rtype: L{DBChange}
         """
-        changed_by = self.insert_people(change.changed_by)
+        changed_by = self._get_people_id(change.changed_by)
 
         db_change = DBChange(change.field, change.old_value, change.new_value,
-                             changed_by.id, change.changed_on, issue_id)
+                             changed_by, change.changed_on, issue_id)
         self.store.add(db_change)
         self.store.flush()
         return db_change
 
-    def _insert_issues_watchers(self, people, issue_id, tracker_id):
-        """
-        Insert watchers for the issue X{issue_id}
-
-        @return: the inserted comment
-        @rtype: L{DBComment}
-        """
-        watcher = self.insert_people(people)
-
-        db_issues_watchers = DBIssuesWatchers(issue_id, watcher.id)
-
-        self.store.add(db_issues_watchers)
-        self.store.flush()
-        return db_issues_watchers
-
     def _get_db_supported_tracker(self, name, version):
         """
         Get the supported tracker based on the given name and version.
@@ -467,79 +1185,6 @@ class DBDatabase:
 
         return db_issue
 
-    def _get_db_comment(self,comment, issue_id, tracker_id):
-        """
-        Search a comment for the issue X{issue_id}
-
-        @param comment: comment to insert
-        @type comment: L{Comment}
-        @param issue_id: issue identifier
-        @type issue_id: C{int}
-        @param tracker_id: identifier of the tracker
-        @type tracker_id: C{int}
-
-        """
-        db_comment = self.store.find(DBComment,
-                                    DBComment.issue_id == issue_id,
-                                    DBComment.text == comment.comment,
-                                    DBComment.submitted_on == comment.submitted_on).one()
-        if not db_comment:
-            #if comment is not stored, return -1 to know it's a new one
-            db_comment = -1
-
-        return db_comment
-
-    def _get_db_change(self,change, issue_id, tracker_id):
-        """
-        Search a change for the issue X{issue_id}
-
-        @param change: change to insert
-        @type change: L{Change}
-        @param issue_id: issue identifier
-        @type issue_id: C{int}
-        @param tracker_id: identifier of the tracker
-        @type tracker_id: C{int}
-
-        """
-        #source forge don't have new_value so we recived
-        #a string that must be unicode
-        if change.new_value == "unknown":
-            change.new_value = unicode(change.new_value)
-
-        db_change = self.store.find(DBChange,
-                                    DBChange.issue_id == issue_id,
-                                    DBChange.field == change.field,
-                                    DBChange.changed_on == change.changed_on,
-                                    DBChange.old_value == change.old_value,
-                                    DBChange.new_value == change.new_value).one()
-        if not db_change:
-            #if change is not stored, return -1 to know it's a new one
-            db_change = -1
-
-        return db_change
-
-    def _get_db_attachment(self, attachment, issue_id, tracker_id):
-        """
-        Search an attachment for the issue X{issue_id}
-
-        @param attachment: attachment to insert
-        @type attachment: L{Attachment}
-        @param issue_id: issue identifier
-        @type issue_id: C{int}
-        @param tracker_id: identifier of the tracker
-        @type tracker_id: C{int}
-
-        """
-        db_attachment = self.store.find(DBAttachment,
-                                    DBAttachment.issue_id == issue_id,
-                                    DBAttachment.url == attachment.url,
-                                    DBAttachment.submitted_on == attachment.submitted_on).one()
-        if not db_attachment:
-            #if attachment is not stored, return -1 to know it's a new one
-            db_attachment = -1
-
-        return db_attachment
-
     def _get_db_temp_rel(self, t_relationship, issue_id):
         """
         """
@@ -880,6 +1525,8 @@ class DBComment(object):
     @type submitted: L{storm.locals.Reference}
     @ivar issue_id: Issue identifier.
     @type issue_id: L{storm.locals.Int}
+    @ivar hash: Content hash of the comment.
+    @type hash: L{storm.locals.Unicode}
     """
     __storm_table__ = 'comments'
 
@@ -888,6 +1535,7 @@ class DBComment(object):
     submitted_by = Int()
     submitted_on = DateTime()
     issue_id = Int()
+    hash = Unicode()
 
     issue = Reference(issue_id, DBIssue.id)
     submitted = Reference(submitted_by, DBPeople.id)
@@ -897,6 +1545,7 @@ class DBComment(object):
         self.submitted_by = submitted_by
         self.submitted_on = submitted_on
         self.issue_id = issue_id
+        self.hash = content_hash(text, submitted_on)
 
 
 class DBAttachment(object):
@@ -934,6 +1583,8 @@ class DBAttachment(object):
     @type issue: L{storm.locals.Reference}
     @ivar submitted: Reference to L{DBPeople} object.
     @type submitted: L{storm.locals.Reference}
+    @ivar hash: Content hash of the attachment.
+    @type hash: L{storm.locals.Unicode}
     """
     __storm_table__ = 'attachments'
 
@@ -944,6 +1595,7 @@ class DBAttachment(object):
     submitted_by = Int()
     submitted_on = DateTime()
     issue_id = Int()
+    hash = Unicode()
 
     issue = Reference(issue_id, DBIssue.id)
     submitted = Reference(submitted_by, DBPeople.id)
@@ -955,6 +1607,7 @@ class DBAttachment(object):
         self.submitted_by = submitted_by
         self.submitted_on = submitted_on
         self.issue_id = issue_id
+        self.hash = content_hash(url, submitted_on)
 
 
 class DBChange(object):
@@ -995,6 +1648,8 @@ class DBChange(object):
     @type issue: L{storm.locals.Reference}
     @ivar people: Reference to L{DBPeople} object.
     @type people: L{storm.locals.Reference}
+    @ivar hash: Content hash of the change.
+    @type hash: L{storm.locals.Unicode}
     """
     __storm_table__ = 'changes'
 
@@ -1005,6 +1660,7 @@ class DBChange(object):
     changed_by = Int()
     changed_on = DateTime()
     issue_id = Int()
+    hash = Unicode()
 
     issue = Reference(issue_id, DBIssue.id)
     people = Reference(changed_by, DBPeople.id)
@@ -1016,6 +1672,48 @@ class DBChange(object):
         self.changed_by = changed_by
         self.changed_on = changed_on
         self.issue_id = issue_id
+        self.hash = content_hash(field, old_value, new_value, changed_on)
+
+
+class DBCheckpoint(object):
+    """
+    Maps elements from X{checkpoints} table.
+
+    Checkpoints keep the progress of a retrieval split in several
+    parts, so an interrupted one is resumed where each part stopped.
+
+    @param tracker_id: identifier of the tracker
+    @type tracker_id: C{int}
+    @param name: name of the part of the retrieval
+    @type name: C{str}
+
+    @ivar __storm_table__: Name of the database table.
+    @type __storm_table__: C{str}
+
+    @ivar id: Checkpoint identifier.
+    @type id: L{storm.locals.Int}
+    @ivar tracker_id: Tracker identifier.
+    @type tracker_id: L{storm.locals.Int}
+    @ivar name: Name of the part of the retrieval.
+    @type name: L{storm.locals.Unicode}
+    @ivar position: Position where the part stopped, in the format
+      chosen by the backend.
+    @type position: L{storm.locals.Unicode}
+    @ivar tracker: Reference to L{DBTracker} object.
+    @type tracker: L{storm.locals.Reference}
+    """
+    __storm_table__ = 'checkpoints'
+
+    id = Int(primary=True)
+    tracker_id = Int()
+    name = Unicode()
+    position = Unicode()
+
+    tracker = Reference(tracker_id, DBTracker.id)
+
+    def __init__(self, tracker_id, name):
+        self.tracker_id = tracker_id
+        self.name = unicode(name)
 
 
 class DBBackend:
@@ -1023,6 +1721,8 @@ class DBBackend:
     """
     def __init__(self):
         self.MYSQL_EXT = None
+        self.SQLITE_EXT = None
+        self.POSTGRESQL_EXT = None
 
     def insert_issue_ext(self, ext, issue_id):
         """
@@ -1065,3 +1765,9 @@ def get_database(backend=None):
     if opts.db_driver_out == "mysql":
         from bicho.db.mysql import DBMySQL
         return DBMySQL(backend)
+    elif opts.db_driver_out == "sqlite":
+        from bicho.db.sqlite import DBSQLite
+        return DBSQLite(backend)
+    elif opts.db_driver_out == "postgresql":
+        from bicho.db.postgresql import DBPostgreSQL
+        return DBPostgreSQL(backend)
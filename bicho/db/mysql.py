@@ -28,29 +28,71 @@ import warnings
 from storm.locals import Store, create_database
 
 from bicho.config import Config
+from bicho.utils import printout
 from bicho.db.database import DBDatabase, DBTracker, DBPeople, \
     DBIssue, DBIssuesWatchers, DBIssueRelationship, DBComment, DBAttachment, \
-    DBChange, DBSupportedTracker, DBIssueTempRelationship
+    DBChange, DBSupportedTracker, DBIssueTempRelationship, DBCheckpoint
+
+
+# Default storage engine of the tables
+DEFAULT_ENGINE = 'MyISAM'
+
+
+def create_mysql_database():
+    """
+    Return the output database set in the configuration.
+    """
+    opts = Config()
+
+    return create_database('mysql://' + opts.db_user_out + ':'
+                           + opts.db_password_out + '@'
+                           + opts.db_hostname_out + ':'
+                           + (opts.db_port_out or '3306') + '/'
+                           + opts.db_database_out)
+
+
+def convert_engine(engine):
+    """
+    Convert the tables of the output database to the given
+    storage engine.
+
+    Only the engine is changed. Foreign keys are not created on
+    tables converted from MyISAM.
+
+    @param engine: name of the storage engine
+    @type engine: C{str}
+    """
+    store = Store(create_mysql_database())
+
+    result = store.execute('SHOW TABLE STATUS WHERE Engine <> ?', (engine,))
+    tables = [row[0] for row in result]
+
+    for table in tables:
+        printout("Converting table %s to %s" % (table, engine))
+        store.execute('ALTER TABLE %s ENGINE=%s' % (table, engine))
+    store.commit()
+    store.close()
+    printout("%d tables converted to %s" % (len(tables), engine))
 
 
 class DBMySQL(DBDatabase):
     """
     MySQL database adapter.
+
+    Tables are created using the storage engine set on
+    X{db_engine_out} configuration parameter.
     """
 
     def __init__(self, backend=None):
         DBDatabase.__init__(self, backend)
-        opts = Config()
 
-        self.database = create_database('mysql://' + opts.db_user_out + ':'
-                                        + opts.db_password_out + '@'
-                                        + opts.db_hostname_out + ':'
-                                        + opts.db_port_out + '/'
-                                        + opts.db_database_out)
+        self.engine = getattr(Config, 'db_engine_out', None) or DEFAULT_ENGINE
+        self.id_step = None
+        self.database = create_mysql_database()
         self.store = Store(self.database)
 
-        clsl = [DBSupportedTracker, DBTrackerMySQL, DBPeopleMySQL,
-                DBIssueMySQL, DBIssueRelationshipMySQL,
+        clsl = [DBSupportedTracker, DBTrackerMySQL, DBCheckpointMySQL,
+                DBPeopleMySQL, DBIssueMySQL, DBIssueRelationshipMySQL,
                 DBCommentMySQL, DBAttachmentMySQL, DBChangeMySQL,
                 DBIssuesWatchersMySQL, DBIssueTempRelationshipMySQL]
 
@@ -59,10 +101,63 @@ class DBMySQL(DBDatabase):
 
         self.suppress_warnings()
         self.create_tables(clsl)
+        self.upgrade_tables()
+        self.check_engine()
 
     def suppress_warnings(self):
         warnings.filterwarnings("ignore", message="Table .* already exists")
 
+    def create_tables(self, clsl):
+        """
+        Create the database tables.
+
+        The storage engine is set replacing the X{engine} key
+        of X{__sql_table__} attribute of database classes.
+
+        @param clsl: a list of database classes
+        @type clsl: C{list} of L{object}
+        """
+        for c in clsl:
+            self.store.execute(c.__sql_table__ % {'engine': self.engine})
+
+    def check_engine(self):
+        """
+        Warn about the tables which use a storage engine different
+        from the configured one.
+        """
+        result = self.store.execute('SHOW TABLE STATUS WHERE Engine <> ?',
+                                    (self.engine,))
+        tables = [row[0] for row in result]
+
+        if tables:
+            printout("Warning: tables %s do not use %s engine. Run with "
+                     "--db-convert-engine to convert them"
+                     % (', '.join(tables), self.engine))
+
+    def _has_column(self, table, column):
+        result = self.store.execute("SHOW COLUMNS FROM %s LIKE '%s'"
+                                    % (table, column))
+        return result.get_one() is not None
+
+    def _has_index(self, table, index):
+        result = self.store.execute("SHOW INDEX FROM %s WHERE Key_name = '%s'"
+                                    % (table, index))
+        return result.get_one() is not None
+
+    def _get_first_insert_id(self, nrows):
+        # In a multi-row INSERT, LAST_INSERT_ID() returns the identifier
+        # of the first inserted row. The rest of identifiers follow it
+        # by steps of auto_increment_increment.
+        return self.store.execute('SELECT LAST_INSERT_ID()').get_one()[0]
+
+    def _get_insert_id_step(self):
+        # Replicated servers (i.e, Galera) set auto_increment_increment
+        # greater than 1 to avoid collisions between nodes
+        if self.id_step is None:
+            result = self.store.execute('SELECT @@auto_increment_increment')
+            self.id_step = int(result.get_one()[0])
+        return self.id_step
+
 
 class DBSupportedTracker(DBSupportedTracker):
     """
@@ -74,7 +169,7 @@ class DBSupportedTracker(DBSupportedTracker):
                      version VARCHAR(64) NOT NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(name, version) \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 class DBTrackerMySQL(DBTracker):
@@ -89,10 +184,28 @@ class DBTrackerMySQL(DBTracker):
                      PRIMARY KEY(id), \
                      UNIQUE KEY(url), \
                      FOREIGN KEY(type) \
-                       REFERENCES tracker_types (id) \
+                       REFERENCES supported_trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     ) ENGINE=%(engine)s;'
+
+
+class DBCheckpointMySQL(DBCheckpoint):
+    """
+    MySQL subclass of L{DBCheckpoint}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS checkpoints ( \
+                     id INTEGER NOT NULL AUTO_INCREMENT, \
+                     tracker_id INTEGER NOT NULL, \
+                     name VARCHAR(128) NOT NULL, \
+                     position VARCHAR(255) NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE KEY(tracker_id, name), \
+                     FOREIGN KEY(tracker_id) \
+                       REFERENCES trackers(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 class DBPeopleMySQL(DBPeople):
@@ -106,7 +219,7 @@ class DBPeopleMySQL(DBPeople):
                      user_id VARCHAR(255) NOT NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(user_id) \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 class DBIssueMySQL(DBIssue):
@@ -123,9 +236,9 @@ class DBIssueMySQL(DBIssue):
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      submitted_on DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(issue, tracker_id), \
                      INDEX issues_submitted_idx(submitted_by), \
@@ -133,7 +246,6 @@ class DBIssueMySQL(DBIssue):
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -143,7 +255,7 @@ class DBIssueMySQL(DBIssue):
                        REFERENCES trackers(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 class DBIssuesWatchersMySQL(DBIssuesWatchers):
     """
@@ -151,8 +263,8 @@ class DBIssuesWatchersMySQL(DBIssuesWatchers):
     """
     __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_watchers ( \
                      id INTEGER UNSIGNED NOT NULL AUTO_INCREMENT, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
-                     person_id INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     person_id INTEGER NOT NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(issue_id, person_id), \
                      INDEX issue_person_idx1(issue_id), \
@@ -165,7 +277,7 @@ class DBIssuesWatchersMySQL(DBIssuesWatchers):
                        REFERENCES people(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 class DBIssueRelationshipMySQL(DBIssueRelationship):
     """
@@ -173,8 +285,8 @@ class DBIssueRelationshipMySQL(DBIssueRelationship):
     """
     __sql_table__ = 'CREATE TABLE IF NOT EXISTS related_to ( \
                      id INTEGER UNSIGNED NOT NULL AUTO_INCREMENT, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
-                     related_to INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
+                     related_to INTEGER NOT NULL, \
                      type VARCHAR(64) NOT NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(issue_id, related_to, type), \
@@ -188,7 +300,7 @@ class DBIssueRelationshipMySQL(DBIssueRelationship):
                        REFERENCES issues(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 class DBIssueTempRelationshipMySQL(DBIssueTempRelationship):
     """
@@ -196,18 +308,14 @@ class DBIssueTempRelationshipMySQL(DBIssueTempRelationship):
     """
     __sql_table__ = 'CREATE TEMPORARY TABLE temp_related_to ( \
                      id INTEGER UNSIGNED NOT NULL AUTO_INCREMENT, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
                      related_to VARCHAR(64) NOT NULL, \
                      type VARCHAR(64) NOT NULL, \
                      tracker_id INTEGER UNSIGNED NOT NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(issue_id, related_to, type, tracker_id), \
-                     INDEX issues_related_idx1(issue_id), \
-                     FOREIGN KEY(issue_id) \
-                       REFERENCES issues(id) \
-                         ON DELETE CASCADE \
-                         ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     INDEX issues_related_idx1(issue_id) \
+                     ) ENGINE=%(engine)s;'
 
 
 class DBCommentMySQL(DBComment):
@@ -216,23 +324,24 @@ class DBCommentMySQL(DBComment):
     """
     __sql_table__ = 'CREATE TABLE IF NOT EXISTS comments ( \
                      id INTEGER UNSIGNED NOT NULL AUTO_INCREMENT, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
                      comment_id INTEGER UNSIGNED, \
                      text TEXT NOT NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      submitted_on DATETIME NOT NULL, \
+                     hash CHAR(40) NULL, \
                      PRIMARY KEY(id), \
                      INDEX comments_submitted_idx(submitted_by), \
                      INDEX comments_issue_idx(issue_id), \
+                     INDEX comments_hash_idx(issue_id, hash), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(issue_id) \
                        REFERENCES issues(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 class DBAttachmentMySQL(DBAttachment):
@@ -241,15 +350,17 @@ class DBAttachmentMySQL(DBAttachment):
     """
     __sql_table__ = 'CREATE TABLE IF NOT EXISTS attachments ( \
                      id INTEGER UNSIGNED NOT NULL AUTO_INCREMENT, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
                      name VARCHAR(64) NOT NULL, \
                      description TEXT NOT NULL, \
                      url VARCHAR(255) NOT NULL, \
-                     submitted_by INTEGER UNSIGNED, \
+                     submitted_by INTEGER, \
                      submitted_on DATETIME, \
+                     hash CHAR(40) NULL, \
                      PRIMARY KEY(id), \
                      INDEX attachments_submitted_idx(submitted_by), \
                      INDEX attachments_issue_idx(issue_id), \
+                     INDEX attachments_hash_idx(issue_id, hash), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
                          ON DELETE SET NULL \
@@ -258,7 +369,7 @@ class DBAttachmentMySQL(DBAttachment):
                        REFERENCES issues(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 class DBChangeMySQL(DBChange):
@@ -267,21 +378,22 @@ class DBChangeMySQL(DBChange):
     """
     __sql_table__ = 'CREATE TABLE IF NOT EXISTS changes ( \
                      id INTEGER UNSIGNED NOT NULL AUTO_INCREMENT, \
-                     issue_id INTEGER UNSIGNED NOT NULL, \
+                     issue_id INTEGER NOT NULL, \
                      field VARCHAR(64) NOT NULL, \
                      old_value TEXT NOT NULL, \
                      new_value TEXT NOT NULL, \
-                     changed_by INTEGER UNSIGNED NOT NULL, \
+                     changed_by INTEGER NOT NULL, \
                      changed_on DATETIME NOT NULL, \
+                     hash CHAR(40) NULL, \
                      PRIMARY KEY(id), \
                      INDEX changes_issue_idx(issue_id), \
                      INDEX changes_changed_idx(changed_by), \
+                     INDEX changes_hash_idx(issue_id, hash), \
                      FOREIGN KEY(issue_id) \
                        REFERENCES issues(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(changed_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE \
-                    ) ENGINE=MYISAM;'
+                    ) ENGINE=%(engine)s;'
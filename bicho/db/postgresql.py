@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2007-2011  GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+PostgreSQL database module
+
+PostgreSQL does not truncate the values longer than the size of
+a VARCHAR column, as MySQL does, so data retrieved from the trackers
+is stored into TEXT columns.
+"""
+
+from storm.locals import Store, create_database
+
+from bicho.config import Config
+from bicho.db.database import DBDatabase, DBTracker, DBPeople, \
+    DBIssue, DBIssuesWatchers, DBIssueRelationship, DBComment, DBAttachment, \
+    DBChange, DBSupportedTracker, DBIssueTempRelationship, DBCheckpoint
+
+
+class DBPostgreSQL(DBDatabase):
+    """
+    PostgreSQL database adapter.
+    """
+
+    def __init__(self, backend=None):
+        DBDatabase.__init__(self, backend)
+        opts = Config()
+
+        self.database = create_database('postgres://' + opts.db_user_out + ':'
+                                        + opts.db_password_out + '@'
+                                        + opts.db_hostname_out + ':'
+                                        + (opts.db_port_out or '5432') + '/'
+                                        + opts.db_database_out)
+        self.store = Store(self.database)
+
+        clsl = [DBSupportedTrackerPostgreSQL, DBTrackerPostgreSQL,
+                DBCheckpointPostgreSQL, DBPeoplePostgreSQL, DBIssuePostgreSQL,
+                DBIssueRelationshipPostgreSQL, DBCommentPostgreSQL,
+                DBAttachmentPostgreSQL, DBChangePostgreSQL,
+                DBIssuesWatchersPostgreSQL, DBIssueTempRelationshipPostgreSQL]
+
+        if backend is not None:
+            clsl.extend([cls for cls in backend.POSTGRESQL_EXT])
+
+        self.create_tables(clsl)
+        # Tables must be committed; otherwise, they would be removed
+        # on the first rollback
+        self.store.commit()
+        self.upgrade_tables()
+
+    def _has_column(self, table, column):
+        result = self.store.execute('SELECT column_name \
+                                     FROM information_schema.columns \
+                                     WHERE table_name = ? \
+                                     AND column_name = ?', (table, column))
+        return result.get_one() is not None
+
+    def _has_index(self, table, index):
+        result = self.store.execute('SELECT indexname FROM pg_indexes \
+                                     WHERE tablename = ? AND indexname = ?',
+                                    (table, index))
+        return result.get_one() is not None
+
+    def _execute_insert(self, table, columns, rows):
+        # Sequences may be shared by concurrent writers and the rows
+        # returned by INSERT ... RETURNING are not sorted as the
+        # VALUES list, so the identifiers are taken from the sequence
+        # first and inserted along with each row
+        result = self.store.execute("SELECT nextval(pg_get_serial_sequence(?, 'id')) \
+                                     FROM generate_series(1, ?)",
+                                    (unicode(table), len(rows)))
+        ids = [row[0] for row in result.get_all()]
+
+        marks = '(' + ', '.join(['?'] * (len(columns) + 1)) + ')'
+        sql = 'INSERT INTO %s (id, %s) VALUES %s' % \
+            (table, ', '.join(columns), ', '.join([marks] * len(rows)))
+        params = []
+        for row_id, row in zip(ids, rows):
+            params.append(row_id)
+            params.extend(row)
+
+        self.store.execute(sql, params, noresult=True)
+        return ids
+
+
+class DBSupportedTrackerPostgreSQL(DBSupportedTracker):
+    """
+    PostgreSQL subclass of L{DBSupportedTracker}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS supported_trackers ( \
+                     id SERIAL, \
+                     name VARCHAR(64) NOT NULL, \
+                     version VARCHAR(64) NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(name, version) \
+                     );'
+
+
+class DBTrackerPostgreSQL(DBTracker):
+    """
+    PostgreSQL subclass of L{DBTracker}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS trackers ( \
+                     id SERIAL, \
+                     url TEXT NOT NULL, \
+                     type INTEGER NOT NULL, \
+                     retrieved_on TIMESTAMP NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(url), \
+                     FOREIGN KEY(type) \
+                       REFERENCES supported_trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBCheckpointPostgreSQL(DBCheckpoint):
+    """
+    PostgreSQL subclass of L{DBCheckpoint}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS checkpoints ( \
+                     id SERIAL, \
+                     tracker_id INTEGER NOT NULL, \
+                     name TEXT NOT NULL, \
+                     position TEXT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(tracker_id, name), \
+                     FOREIGN KEY(tracker_id) \
+                       REFERENCES trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBPeoplePostgreSQL(DBPeople):
+    """
+    PostgreSQL subclass of L{DBPeople}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS people ( \
+                     id SERIAL, \
+                     name TEXT NULL, \
+                     email TEXT NULL, \
+                     user_id TEXT NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(user_id) \
+                     );'
+
+
+class DBIssuePostgreSQL(DBIssue):
+    """
+    PostgreSQL subclass of L{DBIssue}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues ( \
+                     id SERIAL, \
+                     tracker_id INTEGER NOT NULL, \
+                     issue TEXT NOT NULL, \
+                     type TEXT NULL, \
+                     summary TEXT NOT NULL, \
+                     description TEXT NOT NULL, \
+                     status TEXT NOT NULL, \
+                     resolution TEXT NULL, \
+                     priority TEXT NULL, \
+                     submitted_by INTEGER NOT NULL, \
+                     submitted_on TIMESTAMP NOT NULL, \
+                     assigned_to INTEGER NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue, tracker_id), \
+                     FOREIGN KEY(submitted_by) \
+                       REFERENCES people(id) \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(assigned_to) \
+                       REFERENCES people(id) \
+                         ON DELETE SET NULL \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(tracker_id) \
+                       REFERENCES trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS issues_submitted_idx \
+         ON issues (submitted_by);',
+        'CREATE INDEX IF NOT EXISTS issues_assigned_idx \
+         ON issues (assigned_to);',
+        'CREATE INDEX IF NOT EXISTS issues_tracker_idx \
+         ON issues (tracker_id);']
+
+
+class DBIssuesWatchersPostgreSQL(DBIssuesWatchers):
+    """
+    PostgreSQL subclass of L{DBIssuesWatchers}
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_watchers ( \
+                     id SERIAL, \
+                     issue_id INTEGER NOT NULL, \
+                     person_id INTEGER NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id, person_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(person_id) \
+                       REFERENCES people(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS issue_person_idx2 \
+         ON issues_watchers (person_id);']
+
+
+class DBIssueRelationshipPostgreSQL(DBIssueRelationship):
+    """
+    PostgreSQL subclass of L{DBIssueRelationship}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS related_to ( \
+                     id SERIAL, \
+                     issue_id INTEGER NOT NULL, \
+                     related_to INTEGER NOT NULL, \
+                     type TEXT NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id, related_to, type), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(related_to) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS issues_related_idx2 \
+         ON related_to (related_to);']
+
+
+class DBIssueTempRelationshipPostgreSQL(DBIssueTempRelationship):
+    """
+    PostgreSQL subclass of L{DBIssueTempRelationship}.
+
+    Temporary tables can not reference regular tables, so there are
+    no foreign keys.
+    """
+    __sql_table__ = 'CREATE TEMPORARY TABLE temp_related_to ( \
+                     id SERIAL, \
+                     issue_id INTEGER NOT NULL, \
+                     related_to TEXT NOT NULL, \
+                     type TEXT NOT NULL, \
+                     tracker_id INTEGER NOT NULL, \
+                     PRIMARY KEY(id), \
+                     UNIQUE(issue_id, related_to, type, tracker_id) \
+                     );'
+
+
+class DBCommentPostgreSQL(DBComment):
+    """
+    PostgreSQL subclass of L{DBComment}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS comments ( \
+                     id SERIAL, \
+                     issue_id INTEGER NOT NULL, \
+                     comment_id INTEGER, \
+                     text TEXT NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
+                     submitted_on TIMESTAMP NOT NULL, \
+                     hash CHAR(40) NULL, \
+                     PRIMARY KEY(id), \
+                     FOREIGN KEY(submitted_by) \
+                       REFERENCES people(id) \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS comments_submitted_idx \
+         ON comments (submitted_by);',
+        'CREATE INDEX IF NOT EXISTS comments_issue_idx \
+         ON comments (issue_id);',
+        'CREATE INDEX IF NOT EXISTS comments_hash_idx \
+         ON comments (issue_id, hash);']
+
+
+class DBAttachmentPostgreSQL(DBAttachment):
+    """
+    PostgreSQL subclass of L{DBAttachment}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS attachments ( \
+                     id SERIAL, \
+                     issue_id INTEGER NOT NULL, \
+                     name TEXT NOT NULL, \
+                     description TEXT NOT NULL, \
+                     url TEXT NOT NULL, \
+                     submitted_by INTEGER, \
+                     submitted_on TIMESTAMP, \
+                     hash CHAR(40) NULL, \
+                     PRIMARY KEY(id), \
+                     FOREIGN KEY(submitted_by) \
+                       REFERENCES people(id) \
+                         ON DELETE SET NULL \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS attachments_submitted_idx \
+         ON attachments (submitted_by);',
+        'CREATE INDEX IF NOT EXISTS attachments_issue_idx \
+         ON attachments (issue_id);',
+        'CREATE INDEX IF NOT EXISTS attachments_hash_idx \
+         ON attachments (issue_id, hash);']
+
+
+class DBChangePostgreSQL(DBChange):
+    """
+    PostgreSQL subclass of L{DBChange}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS changes ( \
+                     id SERIAL, \
+                     issue_id INTEGER NOT NULL, \
+                     field TEXT NOT NULL, \
+                     old_value TEXT NOT NULL, \
+                     new_value TEXT NOT NULL, \
+                     changed_by INTEGER NOT NULL, \
+                     changed_on TIMESTAMP NOT NULL, \
+                     hash CHAR(40) NULL, \
+                     PRIMARY KEY(id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(changed_by) \
+                       REFERENCES people(id) \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS changes_issue_idx \
+         ON changes (issue_id);',
+        'CREATE INDEX IF NOT EXISTS changes_changed_idx \
+         ON changes (changed_by);',
+        'CREATE INDEX IF NOT EXISTS changes_hash_idx \
+         ON changes (issue_id, hash);']
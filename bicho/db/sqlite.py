@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2007-2011  GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+SQLite database module
+"""
+
+from storm.locals import Store, create_database
+
+from bicho.config import Config
+from bicho.db.database import DBDatabase, DBTracker, DBPeople, \
+    DBIssue, DBIssuesWatchers, DBIssueRelationship, DBComment, DBAttachment, \
+    DBChange, DBSupportedTracker, DBIssueTempRelationship, DBCheckpoint
+
+
+# Default maximum number of parameters of a SQLite statement
+SQLITE_MAX_VARIABLE_NUMBER = 999
+
+
+class DBSQLite(DBDatabase):
+    """
+    SQLite database adapter.
+
+    The database is opened in WAL mode, so readers do not block
+    the writer during the import.
+    """
+
+    def __init__(self, backend=None):
+        DBDatabase.__init__(self, backend)
+        opts = Config()
+
+        self.database = create_database('sqlite:' + opts.db_database_out
+                                        + '?journal_mode=WAL'
+                                        + '&synchronous=NORMAL')
+        self.store = Store(self.database)
+        self.max_params = SQLITE_MAX_VARIABLE_NUMBER
+
+        clsl = [DBSupportedTrackerSQLite, DBTrackerSQLite, DBCheckpointSQLite,
+                DBPeopleSQLite, DBIssueSQLite, DBIssueRelationshipSQLite,
+                DBCommentSQLite, DBAttachmentSQLite, DBChangeSQLite,
+                DBIssuesWatchersSQLite, DBIssueTempRelationshipSQLite]
+
+        if backend is not None:
+            clsl.extend([cls for cls in backend.SQLITE_EXT])
+
+        self.create_tables(clsl)
+        # Tables must be committed; otherwise, they would be removed
+        # on the first rollback
+        self.store.commit()
+        self.upgrade_tables()
+
+    def _has_column(self, table, column):
+        result = self.store.execute('PRAGMA table_info(%s)' % table)
+        return column in [row[1] for row in result]
+
+    def _has_index(self, table, index):
+        # Byte strings are bound as blobs, which never match text
+        result = self.store.execute("SELECT name FROM sqlite_master \
+                                     WHERE type = 'index' AND tbl_name = ? \
+                                     AND name = ?",
+                                    (unicode(table), unicode(index)))
+        return result.get_one() is not None
+
+    def _get_first_insert_id(self, nrows):
+        # last_insert_rowid() returns the identifier of the last
+        # inserted row. The database is locked by the writer, so the
+        # identifiers of the statement are consecutive.
+        last_id = self.store.execute('SELECT last_insert_rowid()').get_one()[0]
+        return last_id - nrows + 1
+
+
+class DBSupportedTrackerSQLite(DBSupportedTracker):
+    """
+    SQLite subclass of L{DBSupportedTracker}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS supported_trackers ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     name VARCHAR(64) NOT NULL, \
+                     version VARCHAR(64) NOT NULL, \
+                     UNIQUE(name, version) \
+                     );'
+
+
+class DBTrackerSQLite(DBTracker):
+    """
+    SQLite subclass of L{DBTracker}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS trackers ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     url VARCHAR(255) NOT NULL, \
+                     type INTEGER NOT NULL, \
+                     retrieved_on DATETIME NOT NULL, \
+                     UNIQUE(url), \
+                     FOREIGN KEY(type) \
+                       REFERENCES supported_trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBCheckpointSQLite(DBCheckpoint):
+    """
+    SQLite subclass of L{DBCheckpoint}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS checkpoints ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     tracker_id INTEGER NOT NULL, \
+                     name VARCHAR(128) NOT NULL, \
+                     position VARCHAR(255) NULL, \
+                     UNIQUE(tracker_id, name), \
+                     FOREIGN KEY(tracker_id) \
+                       REFERENCES trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+
+
+class DBPeopleSQLite(DBPeople):
+    """
+    SQLite subclass of L{DBPeople}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS people ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     name VARCHAR(64) NULL, \
+                     email VARCHAR(64) NULL, \
+                     user_id VARCHAR(255) NOT NULL, \
+                     UNIQUE(user_id) \
+                     );'
+
+
+class DBIssueSQLite(DBIssue):
+    """
+    SQLite subclass of L{DBIssue}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     tracker_id INTEGER NOT NULL, \
+                     issue VARCHAR(255) NOT NULL, \
+                     type VARCHAR(32) NULL, \
+                     summary VARCHAR(255) NOT NULL, \
+                     description TEXT NOT NULL, \
+                     status VARCHAR(32) NOT NULL, \
+                     resolution VARCHAR(32) NULL, \
+                     priority VARCHAR(32) NULL, \
+                     submitted_by INTEGER NOT NULL, \
+                     submitted_on DATETIME NOT NULL, \
+                     assigned_to INTEGER NULL, \
+                     UNIQUE(issue, tracker_id), \
+                     FOREIGN KEY(submitted_by) \
+                       REFERENCES people(id) \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(assigned_to) \
+                       REFERENCES people(id) \
+                         ON DELETE SET NULL \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(tracker_id) \
+                       REFERENCES trackers(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS issues_submitted_idx \
+         ON issues (submitted_by);',
+        'CREATE INDEX IF NOT EXISTS issues_assigned_idx \
+         ON issues (assigned_to);',
+        'CREATE INDEX IF NOT EXISTS issues_tracker_idx \
+         ON issues (tracker_id);']
+
+
+class DBIssuesWatchersSQLite(DBIssuesWatchers):
+    """
+    SQLite subclass of L{DBIssuesWatchers}
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_watchers ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_id INTEGER NOT NULL, \
+                     person_id INTEGER NOT NULL, \
+                     UNIQUE(issue_id, person_id), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(person_id) \
+                       REFERENCES people(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS issue_person_idx2 \
+         ON issues_watchers (person_id);']
+
+
+class DBIssueRelationshipSQLite(DBIssueRelationship):
+    """
+    SQLite subclass of L{DBIssueRelationship}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS related_to ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_id INTEGER NOT NULL, \
+                     related_to INTEGER NOT NULL, \
+                     type VARCHAR(64) NOT NULL, \
+                     UNIQUE(issue_id, related_to, type), \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(related_to) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS issues_related_idx2 \
+         ON related_to (related_to);']
+
+
+class DBIssueTempRelationshipSQLite(DBIssueTempRelationship):
+    """
+    SQLite subclass of L{DBIssueTempRelationship}.
+    """
+    __sql_table__ = 'CREATE TEMPORARY TABLE temp_related_to ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_id INTEGER NOT NULL, \
+                     related_to VARCHAR(64) NOT NULL, \
+                     type VARCHAR(64) NOT NULL, \
+                     tracker_id INTEGER NOT NULL, \
+                     UNIQUE(issue_id, related_to, type, tracker_id) \
+                     );'
+
+
+class DBCommentSQLite(DBComment):
+    """
+    SQLite subclass of L{DBComment}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS comments ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_id INTEGER NOT NULL, \
+                     comment_id INTEGER, \
+                     text TEXT NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
+                     submitted_on DATETIME NOT NULL, \
+                     hash CHAR(40) NULL, \
+                     FOREIGN KEY(submitted_by) \
+                       REFERENCES people(id) \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS comments_submitted_idx \
+         ON comments (submitted_by);',
+        'CREATE INDEX IF NOT EXISTS comments_issue_idx \
+         ON comments (issue_id);',
+        'CREATE INDEX IF NOT EXISTS comments_hash_idx \
+         ON comments (issue_id, hash);']
+
+
+class DBAttachmentSQLite(DBAttachment):
+    """
+    SQLite subclass of L{DBAttachment}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS attachments ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_id INTEGER NOT NULL, \
+                     name VARCHAR(64) NOT NULL, \
+                     description TEXT NOT NULL, \
+                     url VARCHAR(255) NOT NULL, \
+                     submitted_by INTEGER, \
+                     submitted_on DATETIME, \
+                     hash CHAR(40) NULL, \
+                     FOREIGN KEY(submitted_by) \
+                       REFERENCES people(id) \
+                         ON DELETE SET NULL \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS attachments_submitted_idx \
+         ON attachments (submitted_by);',
+        'CREATE INDEX IF NOT EXISTS attachments_issue_idx \
+         ON attachments (issue_id);',
+        'CREATE INDEX IF NOT EXISTS attachments_hash_idx \
+         ON attachments (issue_id, hash);']
+
+
+class DBChangeSQLite(DBChange):
+    """
+    SQLite subclass of L{DBChange}.
+    """
+    __sql_table__ = 'CREATE TABLE IF NOT EXISTS changes ( \
+                     id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                     issue_id INTEGER NOT NULL, \
+                     field VARCHAR(64) NOT NULL, \
+                     old_value TEXT NOT NULL, \
+                     new_value TEXT NOT NULL, \
+                     changed_by INTEGER NOT NULL, \
+                     changed_on DATETIME NOT NULL, \
+                     hash CHAR(40) NULL, \
+                     FOREIGN KEY(issue_id) \
+                       REFERENCES issues(id) \
+                         ON DELETE CASCADE \
+                         ON UPDATE CASCADE, \
+                     FOREIGN KEY(changed_by) \
+                       REFERENCES people(id) \
+                         ON UPDATE CASCADE \
+                     );'
+    __sql_indexes__ = [
+        'CREATE INDEX IF NOT EXISTS changes_issue_idx \
+         ON changes (issue_id);',
+        'CREATE INDEX IF NOT EXISTS changes_changed_idx \
+         ON changes (changed_by);',
+        'CREATE INDEX IF NOT EXISTS changes_hash_idx \
+         ON changes (issue_id, hash);']
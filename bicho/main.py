@@ -47,6 +47,14 @@ def main():
         printerr(str(e))
         sys.exit(2)
 
+    if Config.db_convert_engine:
+        if Config.db_driver_out != 'mysql':
+            printerr("Storage engines can only be converted on MySQL databases")
+            sys.exit(2)
+        from db.mysql import convert_engine
+        convert_engine(Config.db_engine_out)
+        return
+
     try:
         backend = Backend.create_backend(Config.backend)
     except ImportError, e:
@@ -36,6 +36,7 @@ from bicho.utils import printerr, printdbg, printout
 from bicho.common import Tracker, People, Issue, Comment, Change
 from bicho.db.database import DBIssue, DBBackend, get_database, DBTracker,\
      DBPeople
+from bicho.db.mysql import DEFAULT_ENGINE
 from storm.locals import DateTime, Int, Reference, Unicode, Desc, Store, \
      create_database
 from storm.exceptions import NotOneError
@@ -96,12 +97,14 @@ class IssuesLog():
         self.database = create_database('mysql://' + opts.db_user_out + ':'
                                         + opts.db_password_out + '@'
                                         + opts.db_hostname_out + ':'
-                                        + opts.db_port_out + '/'
+                                        + (opts.db_port_out or '3306') + '/'
                                         + opts.db_database_out)
         self.store = Store(self.database)
 
     def _create_db(self):
-        self.store.execute(self._get_sql_create())
+        # Tables use the storage engine of the output database
+        engine = getattr(Config, 'db_engine_out', None) or DEFAULT_ENGINE
+        self.store.execute(self._get_sql_create() % {'engine': engine})
 
     def _drop_db(self):
         self.store.execute(self._get_sql_drop())
@@ -26,7 +26,7 @@ __sql_drop__ = 'DROP TABLE IF EXISTS issues_log_bugzilla;'
 
 __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                      id INTEGER NOT NULL AUTO_INCREMENT, \
-                     change_id INTEGER NOT NULL, \
+                     change_id INTEGER UNSIGNED NOT NULL, \
                      tracker_id INTEGER NOT NULL, \
                      issue_id INTEGER NOT NULL, \
                      issue VARCHAR(255) NOT NULL, \
@@ -36,9 +36,9 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      alias VARCHAR(32) default NULL, \
                      reporter_accessible VARCHAR(32) default NULL, \
                      cclist_accessible VARCHAR(32) default NULL, \
@@ -72,7 +72,6 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -86,7 +85,7 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                        REFERENCES changes(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 #
 # these dictionaries contain the text that appears in the HTML history
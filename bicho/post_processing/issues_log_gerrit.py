@@ -38,7 +38,7 @@ __gerrit_changes_fields__ = 'verified VARCHAR(255), \
                              review VARCHAR(255)'
 
 __common_fields__ = 'id INTEGER NOT NULL AUTO_INCREMENT, \
-                     change_id INTEGER NOT NULL, \
+                     change_id INTEGER UNSIGNED NOT NULL, \
                      changed_by INTEGER NOT NULL, \
                      tracker_id INTEGER NOT NULL, \
                      issue_id INTEGER NOT NULL, \
@@ -49,9 +49,9 @@ __common_fields__ = 'id INTEGER NOT NULL AUTO_INCREMENT, \
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL'
+                     assigned_to INTEGER NULL'
 
 
 __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_gerrit ( \
@@ -65,7 +65,6 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_gerrit ( \
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -79,7 +78,7 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_gerrit ( \
                        REFERENCES changes(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 # mapping between each different status field in changes table
@@ -26,7 +26,7 @@ __sql_drop__ = 'DROP TABLE IF EXISTS issues_log_jira;'
 
 __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                      id INTEGER NOT NULL AUTO_INCREMENT, \
-                     change_id INTEGER NOT NULL, \
+                     change_id INTEGER UNSIGNED NOT NULL, \
                      tracker_id INTEGER NOT NULL, \
                      issue_id INTEGER NOT NULL, \
                      issue VARCHAR(255) NOT NULL, \
@@ -36,9 +36,9 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      issue_key VARCHAR(32) default NULL, \
                      link VARCHAR(100) default NULL, \
                      title VARCHAR(100) default NULL, \
@@ -61,7 +61,6 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -75,7 +74,7 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                        REFERENCES changes(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 #
 # these dictionaries contain the text that appears in the HTML history
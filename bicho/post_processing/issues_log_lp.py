@@ -28,7 +28,7 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_launchpad (\
                      id INTEGER NOT NULL AUTO_INCREMENT, \
                      tracker_id INTEGER NOT NULL, \
                      issue_id INTEGER NOT NULL, \
-                     change_id INTEGER NOT NULL, \
+                     change_id INTEGER UNSIGNED NOT NULL, \
                      issue VARCHAR(255) NOT NULL, \
                      type VARCHAR(32) NULL, \
                      summary VARCHAR(255) NOT NULL, \
@@ -36,9 +36,9 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_launchpad (\
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      issue_key VARCHAR(32) default NULL, \
                      link VARCHAR(100) default NULL, \
                      title VARCHAR(100) default NULL, \
@@ -59,7 +59,6 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_launchpad (\
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -69,7 +68,7 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_launchpad (\
                        REFERENCES trackers(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 #
 # these dictionaries contain the text that appears in the HTML history
@@ -28,7 +28,7 @@ __sql_drop__ = 'DROP TABLE IF EXISTS issues_log_redmine;'
 
 __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_redmine ( \
                      id INTEGER NOT NULL AUTO_INCREMENT, \
-                     change_id INTEGER NOT NULL, \
+                     change_id INTEGER UNSIGNED NOT NULL, \
                      tracker_id INTEGER NOT NULL, \
                      issue_id INTEGER NOT NULL, \
                      issue VARCHAR(255) NOT NULL, \
@@ -38,9 +38,9 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_redmine ( \
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      PRIMARY KEY(id), \
                      UNIQUE KEY(id), \
                      INDEX issues_submitted_idx(submitted_by), \
@@ -48,7 +48,6 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_redmine ( \
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -62,7 +61,7 @@ __sql_table__ = 'CREATE TABLE IF NOT EXISTS issues_log_redmine ( \
                        REFERENCES changes(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 #
 # This dictionary contains the text that appears in the 
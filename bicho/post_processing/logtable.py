@@ -38,6 +38,7 @@ from bicho.utils import printerr, printdbg, printout
 from bicho.common import Tracker, People, Issue, Comment, Change
 from bicho.db.database import DBIssue, DBBackend, get_database, DBTracker, \
      DBPeople, DBChange
+from bicho.db.mysql import DEFAULT_ENGINE
 
 from storm.locals import DateTime, Int, Reference, Unicode, Desc, Asc, Store, \
      create_database
@@ -59,9 +60,9 @@ __sql_table_bugzilla__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      alias VARCHAR(32) default NULL, \
                      delta_ts DATETIME NOT NULL, \
                      reporter_accessible VARCHAR(32) default NULL, \
@@ -95,7 +96,6 @@ __sql_table_bugzilla__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -105,7 +105,7 @@ __sql_table_bugzilla__ = 'CREATE TABLE IF NOT EXISTS issues_log_bugzilla ( \
                        REFERENCES trackers(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 __sql_table_jira__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                      id INTEGER NOT NULL AUTO_INCREMENT, \
@@ -118,9 +118,9 @@ __sql_table_jira__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                      status VARCHAR(32) NOT NULL, \
                      resolution VARCHAR(32) NULL, \
                      priority VARCHAR(32) NULL, \
-                     submitted_by INTEGER UNSIGNED NOT NULL, \
+                     submitted_by INTEGER NOT NULL, \
                      date DATETIME NOT NULL, \
-                     assigned_to INTEGER UNSIGNED NOT NULL, \
+                     assigned_to INTEGER NULL, \
                      issue_key VARCHAR(32) NOT NULL, \
                      link VARCHAR(100) NOT NULL, \
                      title VARCHAR(100) NOT NULL, \
@@ -140,7 +140,6 @@ __sql_table_jira__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                      INDEX issues_tracker_idx(tracker_id), \
                      FOREIGN KEY(submitted_by) \
                        REFERENCES people(id) \
-                         ON DELETE SET NULL \
                          ON UPDATE CASCADE, \
                      FOREIGN KEY(assigned_to) \
                        REFERENCES people(id) \
@@ -150,7 +149,7 @@ __sql_table_jira__ = 'CREATE TABLE IF NOT EXISTS issues_log_jira ( \
                        REFERENCES trackers(id) \
                          ON DELETE CASCADE \
                          ON UPDATE CASCADE \
-                     ) ENGINE=MYISAM;'
+                     ) ENGINE=%(engine)s;'
 
 
 #
@@ -300,16 +299,18 @@ class IssuesLog():
         self.database = create_database('mysql://' + opts.db_user_out + ':'
                                         + opts.db_password_out + '@'
                                         + opts.db_hostname_out + ':'
-                                        + opts.db_port_out + '/'
+                                        + (opts.db_port_out or '3306') + '/'
                                         + opts.db_database_out)
         self.store = Store(self.database)
 
     def create_db(self):
         print("self.backend_name = %s" % (self.backend_name))
+        # Tables use the storage engine of the output database
+        engine = getattr(Config, 'db_engine_out', None) or DEFAULT_ENGINE
         if self.backend_is_bugzilla():
-            self.store.execute(__sql_table_bugzilla__)
+            self.store.execute(__sql_table_bugzilla__ % {'engine': engine})
         elif self.backend_is_jira():
-            self.store.execute(__sql_table_jira__)
+            self.store.execute(__sql_table_jira__ % {'engine': engine})
 
     def copy_issue(self, db_ilog):
         """
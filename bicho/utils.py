@@ -21,14 +21,28 @@
 #       Luis Cañas Díaz <lcanas@libresoft.es>
 #
 
+import base64
 import cgi
+import cookielib
 import errno
+import gzip
+import hashlib
+import httplib
+import json
 import os
 import random
+import socket
+import StringIO
 import sys
+import tempfile
+import threading
 import time
 import urllib
+import urllib2
+import urlparse
+import zlib
 
+import info
 from config import Config
 
 def printout(str='\n'):
@@ -100,6 +114,749 @@ def rdelay():
         printdbg("delay")
         time.sleep(random.randint(0,20))
 
+
+class RateLimiter:
+    """
+    Token bucket which limits the rate of the requests made by
+    several threads.
+
+    Up to X{burst} requests can be run at once; after that, requests
+    are run at X{rate} requests per second. A rate of C{None} means
+    no limit. Servers can also pause the requests, for instance, when
+    their quota is exhausted.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last_time = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block the calling thread until it is allowed to run a new
+        request.
+        """
+        self.lock.acquire()
+        try:
+            now = time.time()
+            wait = self.paused_until - now
+
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.last_time) * self.rate)
+                self.last_time = now
+                # Tokens below zero are reserved by waiting threads
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+        finally:
+            self.lock.release()
+
+        if wait > 0:
+            printdbg("Rate limit reached. Waiting %.2f seconds" % wait)
+            time.sleep(wait)
+
+    def pause_until(self, timestamp):
+        """
+        Do not allow new requests until the given Unix time.
+        """
+        self.lock.acquire()
+        try:
+            self.paused_until = max(self.paused_until, timestamp)
+        finally:
+            self.lock.release()
+
+    def update(self, headers):
+        """
+        Pause the requests when the headers of a response say so.
+
+        Supports I{Retry-After} and the I{X-RateLimit-Remaining} and
+        I{X-RateLimit-Reset} headers sent by GitHub, among others.
+        """
+        retry_after = headers.get('retry-after')
+        if retry_after and retry_after.isdigit():
+            self.pause_until(time.time() + int(retry_after))
+
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if remaining and reset and remaining.isdigit() and reset.isdigit() \
+                and int(remaining) == 0:
+            printout("Rate limit exhausted. Waiting until %s"
+                     % time.strftime("%d/%b/%Y-%X", time.localtime(int(reset))))
+            self.pause_until(int(reset) + 1)
+
+
+_rate_limiter = None
+
+def get_rate_limiter():
+    """
+    Return the rate limiter shared by all the requests of the run.
+
+    Its rate is set by X{rate} configuration parameter. When it is
+    not set, requests are not limited, but the pauses asked by the
+    servers are still honored; see L{wait_delay}.
+    """
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(getattr(Config, 'rate', None),
+                                    getattr(Config, 'burst', 1) or 1)
+    return _rate_limiter
+
+def wait_delay(limit_rate=False):
+    """
+    Pace the issues retrieved by the calling thread.
+
+    Unless the rate of the requests is limited with X{rate}, the
+    thread sleeps X{delay} seconds, so every worker retrieves issues
+    at the pace of a single-threaded run. Backends whose requests do
+    not go through L{HTTPSession} set C{limit_rate} to take a token
+    of the shared rate limiter instead.
+
+    @param limit_rate: take a token of the rate limiter when X{rate}
+      is set
+    @type limit_rate: C{bool}
+    """
+    if getattr(Config, 'rate', None):
+        if limit_rate:
+            get_rate_limiter().wait()
+    elif getattr(Config, 'delay', None):
+        time.sleep(Config.delay)
+
+HTTP_REDIRECT_CODES = (301, 302, 303, 307)
+HTTP_MAX_REDIRECTS = 5
+HTTP_TIMEOUT = 300
+HTTP_CHUNK_SIZE = 64 * 1024
+HTTP_USER_AGENT = "%s/%s" % (info.PACKAGE, info.VERSION)
+
+# Headers of the responses which are not stored in the cache
+HTTP_CACHE_SKIP_HEADERS = ('content-encoding', 'content-length',
+                           'transfer-encoding', 'connection', 'set-cookie')
+# When the cache is full, the least recently used entries are removed
+# until it takes up this ratio of its maximum size
+HTTP_CACHE_EVICTION_RATIO = 0.9
+
+
+class HTTPCache:
+    """
+    On-disk cache of the responses to GET requests.
+
+    Entries are addressed by the SHA-1 hash of the URL and the
+    credentials of the request. Each one is stored in a single file,
+    holding its metadata and its compressed body, so it is written
+    atomically. When the size of the cache goes beyond X{max_size}
+    bytes, the least recently used entries are removed.
+
+    Cached responses are revalidated against the server using their
+    I{ETag} and I{Last-Modified} headers. In X{replay} mode they are
+    returned straight away, which lets resume a crashed run without
+    downloading again the data.
+    """
+    def __init__(self, path, max_size, replay=False):
+        self.path = path
+        self.max_size = max_size
+        self.replay = replay
+        self.lock = threading.Lock()
+        # Access time and size of each entry, indexed by key
+        self.entries = {}
+        self.size = 0
+
+        create_dir(self.path)
+        self._load()
+
+    def get_key(self, url, credentials=None):
+        """
+        Return the key of the entry for the given URL and credentials,
+        i.e, the authorization and cookie headers sent with it.
+        """
+        return hashlib.sha1(url + '\0' + (credentials or '')).hexdigest()
+
+    def get(self, key):
+        """
+        Return the entry stored under C{key} as a tuple with its
+        metadata and its body, or C{None} when it is not cached.
+        """
+        self.lock.acquire()
+        try:
+            if key not in self.entries:
+                return None
+        finally:
+            self.lock.release()
+
+        filename = self._get_filename(key)
+        try:
+            f = open(filename, 'rb')
+            try:
+                metadata = json.loads(f.readline())
+                body = gzip.GzipFile(fileobj=f).read()
+            finally:
+                f.close()
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError), e:
+            printdbg("Removing invalid cache entry %s: %s" % (filename, e))
+            self.remove(key)
+            return None
+
+        self.lock.acquire()
+        try:
+            if key in self.entries:
+                self.entries[key] = (time.time(), self.entries[key][1])
+        finally:
+            self.lock.release()
+
+        return metadata, body
+
+    def store(self, key, url, headers, body):
+        """
+        Store a response under C{key}.
+
+        @param key: key of the entry
+        @type key: C{str}
+        @param url: URL of the response
+        @type url: C{str}
+        @param headers: headers of the response
+        @type headers: C{httplib.HTTPMessage}
+        @param body: decoded body of the response
+        @type body: C{str}
+        """
+        if len(body) > self.max_size:
+            return
+
+        writer = self.open_writer(key, url, headers)
+        if writer:
+            writer.write(body)
+            writer.commit()
+
+    def open_writer(self, key, url, headers):
+        """
+        Return a L{CacheWriter} to store a response under C{key} while
+        its body is downloaded, or C{None} when the entry cannot be
+        created.
+        """
+        raw_headers = [h for h in headers.headers
+                       if h.split(':', 1)[0].strip().lower()
+                       not in HTTP_CACHE_SKIP_HEADERS]
+        metadata = {'url': url,
+                    'headers': ''.join(raw_headers),
+                    'etag': headers.getheader('etag'),
+                    'last_modified': headers.getheader('last-modified'),
+                    'stored_on': time.time()}
+
+        try:
+            return CacheWriter(self, key, metadata)
+        except (IOError, OSError), e:
+            printdbg("Error storing %s in cache: %s" % (url, e))
+            return None
+
+    def _add_entry(self, key):
+        self.lock.acquire()
+        try:
+            if key in self.entries:
+                self.size -= self.entries[key][1]
+            size = os.path.getsize(self._get_filename(key))
+            self.entries[key] = (time.time(), size)
+            self.size += size
+            if self.size > self.max_size:
+                self._evict()
+        finally:
+            self.lock.release()
+
+    def remove(self, key):
+        """
+        Remove the entry stored under C{key}.
+        """
+        self.lock.acquire()
+        try:
+            self._remove(key)
+        finally:
+            self.lock.release()
+
+    def _remove(self, key):
+        if key not in self.entries:
+            return
+        try:
+            os.remove(self._get_filename(key))
+        except OSError:
+            pass
+        self.size -= self.entries.pop(key)[1]
+
+    def _evict(self):
+        limit = self.max_size * HTTP_CACHE_EVICTION_RATIO
+        lru = sorted(self.entries.items(), key=lambda e: e[1][0])
+
+        printdbg("HTTP cache full (%d bytes). Evicting entries" % self.size)
+        for key, entry in lru:
+            if self.size <= limit:
+                break
+            self._remove(key)
+
+    def _load(self):
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for name in filenames:
+                # Skip any file not created by the cache
+                if len(name) != 40 or name.strip('0123456789abcdef'):
+                    continue
+                st = os.stat(os.path.join(dirpath, name))
+                self.entries[name] = (st.st_mtime, st.st_size)
+                self.size += st.st_size
+
+        printdbg("HTTP cache at %s: %d entries, %d bytes"
+                 % (self.path, len(self.entries), self.size))
+
+    def _get_filename(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+class CacheWriter:
+    """
+    Writes an entry of a L{HTTPCache} as its body is received.
+
+    The entry is written to a temporary file, which replaces the old
+    entry, if any, only when it is committed.
+    """
+    def __init__(self, cache, key, metadata):
+        self.cache = cache
+        self.key = key
+        self.url = metadata['url']
+        self.size = 0
+        self.filename = cache._get_filename(key)
+
+        dirname = os.path.dirname(self.filename)
+        create_dir(dirname)
+        fd, self.tmp_filename = tempfile.mkstemp(dir=dirname)
+        self.f = os.fdopen(fd, 'wb')
+        self.f.write(json.dumps(metadata) + '\n')
+        self.gz = gzip.GzipFile(fileobj=self.f, mode='wb')
+
+    def write(self, data):
+        """
+        Append C{data} to the body of the entry. Bodies larger than
+        the cache are discarded.
+        """
+        if not self.gz:
+            return
+        self.size += len(data)
+        if self.size > self.cache.max_size:
+            self.abort()
+            return
+        try:
+            self.gz.write(data)
+        except (IOError, OSError), e:
+            printdbg("Error storing %s in cache: %s" % (self.url, e))
+            self.abort()
+
+    def commit(self):
+        """
+        Store the entry in the cache.
+        """
+        if not self.gz:
+            return
+        try:
+            self.gz.close()
+            self.f.close()
+            os.rename(self.tmp_filename, self.filename)
+        except (IOError, OSError), e:
+            printdbg("Error storing %s in cache: %s" % (self.url, e))
+            self.abort()
+            return
+        self.gz = None
+        self.cache._add_entry(self.key)
+
+    def abort(self):
+        """
+        Discard the entry.
+        """
+        self.gz = None
+        self.f.close()
+        if os.path.exists(self.tmp_filename):
+            os.remove(self.tmp_filename)
+
+
+class StreamedBody:
+    """
+    Body of a response which is read from the socket as it is
+    requested, decoding it on the fly.
+
+    The connection goes back to its pool once the whole body has
+    been read. When a L{CacheWriter} is given, the body is cached
+    at the same time.
+    """
+    def __init__(self, session, key, conn, response, writer=None):
+        self.session = session
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.writer = writer
+        self.buffer = ''
+        self.eof = False
+
+        encoding = response.getheader('content-encoding', '').lower()
+        self.deflate = encoding == 'deflate'
+        self.decoder = None
+        if encoding == 'gzip':
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size=-1):
+        if size < 0:
+            chunks = []
+            chunk = self.read(HTTP_CHUNK_SIZE)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self.read(HTTP_CHUNK_SIZE)
+            return ''.join(chunks)
+
+        while len(self.buffer) < size and not self.eof:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while '\n' not in self.buffer and not self.eof:
+            self._fill()
+        end = self.buffer.find('\n') + 1 or len(self.buffer)
+        if size >= 0:
+            end = min(end, size)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def close(self):
+        if self.eof:
+            return
+        # The connection can not be reused until the whole response
+        # is read, so it is dropped
+        self.eof = True
+        self.conn.close()
+        if self.writer:
+            self.writer.abort()
+
+    def _fill(self):
+        raw = self.response.read(HTTP_CHUNK_SIZE)
+        if not raw:
+            data = self.decoder and self.decoder.flush() or ''
+            self._finish()
+        elif self.deflate and not self.decoder:
+            # Raw deflate streams come without zlib header
+            if ord(raw[0]) & 0x0f == 8:
+                self.decoder = zlib.decompressobj()
+            else:
+                self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self.decoder.decompress(raw)
+        elif self.decoder:
+            data = self.decoder.decompress(raw)
+        else:
+            data = raw
+
+        if data and self.writer:
+            self.writer.write(data)
+        self.buffer += data
+
+    def _finish(self):
+        self.eof = True
+        if self.response.will_close:
+            self.conn.close()
+        else:
+            self.session._put_connection(self.key, self.conn)
+        if self.writer:
+            self.writer.commit()
+
+
+class HTTPSession:
+    """
+    Persistent HTTP client shared by the backends.
+
+    Connections are kept alive and reused for each host. They are
+    not shared between threads: each thread has its own pool.
+    Compressed responses (gzip or deflate) are requested and decoded
+    on the fly. Authentication and cookies are set once and sent on
+    every request. Proxies set in the environment (X{http_proxy},
+    X{https_proxy} and X{no_proxy}) are honored, as C{urllib2} does.
+    """
+    def __init__(self, cache=None):
+        self.headers = {'User-Agent': HTTP_USER_AGENT,
+                        'Accept-Encoding': 'gzip, deflate'}
+        self.cookies = cookielib.CookieJar()
+        self.pool = threading.local()
+        self.cache = cache
+        self.proxies = urllib.getproxies()
+
+    def set_auth(self, user, password):
+        """
+        Send HTTP basic authentication credentials on every request.
+        """
+        credentials = base64.b64encode('%s:%s' % (user, password))
+        self.headers['Authorization'] = 'Basic %s' % credentials
+
+    def open(self, url, data=None, headers=None, stream=False):
+        """
+        Run a request, once the shared rate limiter allows it, and
+        return a file-like object with the body of the response, like
+        C{urllib2.urlopen} does. Rate limit hints sent by the server
+        are honored.
+
+        @param url: URL or C{urllib2.Request} to open
+        @type url: C{str} or C{urllib2.Request}
+        @param data: body of the request; when it is given a POST
+          request is run
+        @type data: C{str}
+        @param headers: extra headers of the request
+        @type headers: C{dict}
+        @param stream: when it is set, the body of a successful
+          response is read from the socket as it is requested, instead
+          of reading it at once
+        @type stream: C{bool}
+
+        @return: response of the server
+        @rtype: C{urllib.addinfourl}
+
+        @raise urllib2.HTTPError: when the server returns an error
+        @raise urllib2.URLError: when the server could not be reached
+        """
+        req_headers = dict(self.headers)
+        if isinstance(url, urllib2.Request):
+            if data is None:
+                data = url.get_data()
+            req_headers.update(url.header_items())
+            url = url.get_full_url()
+        if headers:
+            req_headers.update(headers)
+
+        key = None
+        cached = None
+        if self.cache and data is None:
+            key = self.cache.get_key(url, self._get_credentials(url,
+                                                                req_headers))
+            cached = self.cache.get(key)
+        if cached:
+            metadata, cached_body = cached
+            if self.cache.replay:
+                printdbg("Replaying %s from cache" % url)
+                return self._cached_response(url, metadata, cached_body)
+            if metadata['etag']:
+                req_headers['If-None-Match'] = metadata['etag']
+            if metadata['last_modified']:
+                req_headers['If-Modified-Since'] = metadata['last_modified']
+
+        limiter = get_rate_limiter()
+        limiter.wait()
+
+        for i in range(HTTP_MAX_REDIRECTS + 1):
+            response, body = self._request(url, data, req_headers, stream)
+            location = response.getheader('location')
+            if response.status not in HTTP_REDIRECT_CODES or not location:
+                break
+            # Redirections are always followed using GET
+            url = urlparse.urljoin(url, location)
+            data = None
+
+        limiter.update(response.msg)
+
+        if response.status == 304 and cached:
+            printdbg("%s not modified. Using cached response" % url)
+            return self._cached_response(url, metadata, cached_body)
+
+        if isinstance(body, StreamedBody):
+            f = urllib.addinfourl(body, response.msg, url, response.status)
+        else:
+            f = urllib.addinfourl(StringIO.StringIO(body), response.msg,
+                                  url, response.status)
+        if response.status >= 400:
+            raise urllib2.HTTPError(url, response.status, response.reason,
+                                    response.msg, f)
+
+        cache_control = response.getheader('cache-control', '').lower()
+        if key and response.status == 200 and 'no-store' not in cache_control:
+            if isinstance(body, StreamedBody):
+                body.writer = self.cache.open_writer(key, url, response.msg)
+            else:
+                self.cache.store(key, url, response.msg, body)
+        return f
+
+    def _get_credentials(self, url, headers):
+        """
+        Return the authorization and cookie headers that would be sent
+        with a request to X{url}, so responses for different users are
+        not mixed up in the cache.
+        """
+        request = urllib2.Request(url)
+        self.cookies.add_cookie_header(request)
+        headers = dict([(k.lower(), v) for k, v in headers.items()])
+        values = [headers.get('authorization'), headers.get('cookie'),
+                  request.unredirected_hdrs.get('Cookie')]
+        return '\0'.join([v or '' for v in values])
+
+    def _cached_response(self, url, metadata, body):
+        headers = httplib.HTTPMessage(
+            StringIO.StringIO(metadata['headers'] + '\r\n'))
+        return urllib.addinfourl(StringIO.StringIO(body), headers, url, 200)
+
+    def _request(self, url, data, headers, stream=False):
+        scheme, netloc, path, params, query, fragment = urlparse.urlparse(url)
+        selector = urlparse.urlunparse(('', '', path or '/', params,
+                                        query, ''))
+        method = data is None and 'GET' or 'POST'
+
+        request = urllib2.Request(url, data)
+        self.cookies.add_cookie_header(request)
+        headers = dict(headers)
+        headers.update(request.unredirected_hdrs)
+        if data is not None and \
+                'content-type' not in [h.lower() for h in headers]:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        proxy = self._get_proxy(scheme, netloc)
+        if proxy and scheme == 'http':
+            # Plain HTTP requests are sent to the proxy using the
+            # absolute URL; HTTPS ones go through a tunnel
+            selector = urlparse.urlunparse((scheme, netloc, path or '/',
+                                            params, query, ''))
+            if proxy[1]:
+                headers['Proxy-Authorization'] = proxy[1]
+
+        # A kept alive connection may have been closed by the server
+        # while it was idle; in that case the request is run again
+        # using a new one.
+        for retry in (True, False):
+            conn, reused = self._get_connection(scheme, netloc, proxy)
+            try:
+                conn.request(method, selector, data, headers)
+                response = conn.getresponse()
+                body = None
+                if not (stream and response.status == 200):
+                    body = response.read()
+                break
+            except (httplib.HTTPException, socket.error), e:
+                self._close_connection(scheme, netloc)
+                if not (retry and reused):
+                    raise urllib2.URLError(e)
+
+        self.cookies.extract_cookies(_CookieResponse(response.msg), request)
+
+        if body is None:
+            # The connection is busy until the whole body is read, so
+            # it is taken out of the pool meanwhile
+            self.pool.connections.pop((scheme, netloc), None)
+            return response, StreamedBody(self, (scheme, netloc),
+                                          conn, response)
+
+        if response.will_close:
+            self._close_connection(scheme, netloc)
+
+        encoding = response.getheader('content-encoding', '').lower()
+        if encoding == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
+        elif encoding == 'deflate':
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                # Raw deflate streams, without zlib header
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        return response, body
+
+    def _get_proxy(self, scheme, netloc):
+        """
+        Return the address of the proxy used to reach X{netloc} and
+        the value of its X{Proxy-Authorization} header, if any.
+
+        @return: address and authorization header of the proxy or
+          C{None} when the host is reached directly
+        @rtype: C{tuple} of (C{str}, C{str})
+        """
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.proxy_bypass(netloc.split(':')[0]):
+            return None
+
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        proxy_netloc = urlparse.urlparse(proxy).netloc
+        auth = None
+        if '@' in proxy_netloc:
+            credentials, proxy_netloc = proxy_netloc.rsplit('@', 1)
+            auth = 'Basic %s' % base64.b64encode(urllib.unquote(credentials))
+        return proxy_netloc, auth
+
+    def _get_connection(self, scheme, netloc, proxy=None):
+        if not hasattr(self.pool, 'connections'):
+            self.pool.connections = {}
+        connections = self.pool.connections
+        key = (scheme, netloc)
+        if key in connections:
+            return connections[key], True
+
+        host = proxy and proxy[0] or netloc
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(host, timeout=HTTP_TIMEOUT)
+            if proxy:
+                tunnel_headers = {}
+                if proxy[1]:
+                    tunnel_headers['Proxy-Authorization'] = proxy[1]
+                conn.set_tunnel(netloc, headers=tunnel_headers)
+        elif scheme == 'http':
+            conn = httplib.HTTPConnection(host, timeout=HTTP_TIMEOUT)
+        else:
+            raise urllib2.URLError("unknown url type: %s" % scheme)
+        connections[key] = conn
+        return conn, False
+
+    def _put_connection(self, key, conn):
+        if not hasattr(self.pool, 'connections'):
+            self.pool.connections = {}
+        if key in self.pool.connections:
+            conn.close()
+        else:
+            self.pool.connections[key] = conn
+
+    def _close_connection(self, scheme, netloc):
+        connections = getattr(self.pool, 'connections', {})
+        conn = connections.pop((scheme, netloc), None)
+        if conn:
+            conn.close()
+
+
+class _CookieResponse:
+    """
+    Wraps the headers of a response to be read by C{cookielib}.
+    """
+    def __init__(self, headers):
+        self.headers = headers
+
+    def info(self):
+        return self.headers
+
+
+_http_session = None
+
+def get_http_session():
+    """
+    Return the HTTP session shared by all the requests of the run.
+
+    When X{cache_size} configuration parameter is set, responses are
+    cached in the directory set by X{path} parameter, or in
+    C{~/.bicho/cache} when it is not set, up to that number of
+    megabytes. The cache is disabled by default; backends may enable
+    it before the session is created.
+    """
+    global _http_session
+
+    if _http_session is None:
+        cache = None
+        cache_size = getattr(Config, 'cache_size', None)
+        if cache_size:
+            path = getattr(Config, 'path', None) or \
+                os.path.join(bicho_dot_dir(), 'cache')
+            cache = HTTPCache(path, cache_size * 1024 * 1024,
+                              getattr(Config, 'cache_replay', False))
+        _http_session = HTTPSession(cache)
+    return _http_session
+
+def urlopen(url, data=None, stream=False):
+    """
+    Open an URL, or a C{urllib2.Request}, using the shared HTTP session.
+    When X{stream} is set, the body of the response is read from the
+    socket as it is requested.
+    """
+    return get_http_session().open(url, data, stream=stream)
+
 _dirs = {}
 
 def create_dir(dir):
@@ -136,3 +893,16 @@ def valid_XML_char_ordinal(i):
             or 0xE000 <= i <= 0xFFFD
             or 0x10000 <= i <= 0x10FFFF
     )
+
+# Bytes not allowed in XML documents. The rest of invalid characters
+# are multibyte in UTF-8 and never found in practice.
+_INVALID_XML_BYTES = ''.join([chr(i) for i in range(256)
+                              if not valid_XML_char_ordinal(i)])
+
+def clean_xml(data):
+    """
+    Remove the bytes not allowed in XML documents from the string
+    C{data}. It works byte by byte, so the chunks of a document can
+    be cleaned as they are read.
+    """
+    return data.translate(None, _INVALID_XML_BYTES)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Compares the parsers of Bugzilla activity pages (show_activity.cgi)
+# using the pages recorded in data/bugzilla/. Both parsers must find
+# the same changes.
+#
+#   $ python bench_bg_activity.py [repetitions]
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, "..")
+from bicho.config import Config
+Config.debug = False
+from bicho.backends.bg import SoupHtmlParser, ActivityHtmlParser
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'data', 'bugzilla')
+
+
+def changes_to_tuples(changes):
+    return [(c.field, c.old_value, c.new_value, c.changed_by.user_id,
+             c.changed_by.email, c.changed_on) for c in changes]
+
+
+def bench(parser_class, html, repetitions):
+    start = time.time()
+    for i in range(repetitions):
+        parser_class(html, 1).parse_changes()
+    return (time.time() - start) / repetitions
+
+
+if __name__ == '__main__':
+    repetitions = 100
+    if len(sys.argv) > 1:
+        repetitions = int(sys.argv[1])
+
+    for filename in sorted(glob.glob(os.path.join(DATA_DIR, 'activity-*.html'))):
+        html = open(filename).read()
+
+        expected = changes_to_tuples(SoupHtmlParser(html, 1).parse_changes())
+        found = changes_to_tuples(ActivityHtmlParser(html, 1).parse_changes())
+        if found != expected:
+            print "%s: changes differ" % os.path.basename(filename)
+            sys.exit(1)
+
+        soup_time = bench(SoupHtmlParser, html, repetitions)
+        fast_time = bench(ActivityHtmlParser, html, repetitions)
+        print "%s: %d changes, soup %.2f ms, event-driven %.2f ms (%.1fx)" % \
+            (os.path.basename(filename), len(found), soup_time * 1000,
+             fast_time * 1000, soup_time / fast_time)
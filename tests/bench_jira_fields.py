@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Compares the size and the decoding time of a page of issues of a
+# Jira project when all the fields are requested and when only the
+# ones read by the atljira backend are.
+#
+#   $ python bench_jira_fields.py https://issues.apache.org/jira/browse/PROJ [issues]
+
+import json
+import sys
+import time
+import urllib
+import urllib2
+
+sys.path.insert(0, "..")
+from bicho.backends.atljira import ISSUE_FIELDS
+
+REPETITIONS = 10
+
+
+def fetch(server_url, project, nissues, fields):
+    params = {'jql': 'project=' + project + ' order by id asc',
+              'startAt': 0,
+              'maxResults': nissues,
+              'fields': fields,
+              'expand': 'changelog'}
+    url = server_url + '/rest/api/2/search?' + urllib.urlencode(params)
+
+    start = time.time()
+    data = urllib2.urlopen(url).read()
+    return data, time.time() - start
+
+
+def bench_decode(data):
+    start = time.time()
+    for i in range(REPETITIONS):
+        json.loads(data)
+    return (time.time() - start) / REPETITIONS
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print "Usage: %s <url of the project> [issues]" % sys.argv[0]
+        sys.exit(1)
+
+    server_url, project = sys.argv[1].split('/browse/')
+    nissues = 100
+    if len(sys.argv) > 2:
+        nissues = int(sys.argv[2])
+
+    for fields in ('*all', '*navigable', ','.join(ISSUE_FIELDS)):
+        data, download_time = fetch(server_url, project, nissues, fields)
+        decode_time = bench_decode(data)
+        name = fields.startswith('*') and fields or 'bicho fields'
+        print "%s: %d KB, download %.2f s, decode %.2f ms" % \
+            (name, len(data) / 1024, download_time, decode_time * 1000)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Tests of the paging, the key ranges and the fields requested by the Jira
+# backend.
+
+import re, sys, threading, unittest
+sys.path.insert(0, "..")
+from bicho.config import Config
+from bicho.backends.atljira import JiraBackend, ISSUE_FIELDS, \
+    KEYS_PER_RANGE, RANGE_CHECKPOINT, RANGE_DONE, START_CHECKPOINT
+
+
+class Fields:
+    def __init__(self, updated):
+        self.updated = updated
+
+
+class FakeIssue:
+    def __init__(self, number, updated):
+        self.key = 'PROJ-%d' % number
+        self.fields = Fields(updated)
+
+
+class FakeJira:
+    """
+    Jira server with C{nissues} issues, the last one updated on
+    C{updated}. It records the threads which searched it.
+    """
+    def __init__(self, nissues, updated):
+        self.nissues = nissues
+        self.updated = updated
+        self.threads = set()
+
+    def search_issues(self, jql, startAt=0, maxResults=50, fields=None,
+                      expand=None):
+        self.threads.add(threading.current_thread())
+        if 'key >=' in jql:
+            first, last = [int(n) for n in re.findall(r'PROJ-(\d+)', jql)]
+            numbers = range(first, min(last, self.nissues + 1))
+            return [FakeIssue(n, self.updated)
+                    for n in numbers[startAt:startAt + maxResults]]
+        if not self.nissues:
+            return []
+        return [FakeIssue(self.nissues, self.updated)]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.checkpoints = {}
+
+    def set_checkpoint(self, tracker_id, name, position):
+        self.checkpoints[name] = position
+
+    def set_checkpoints(self, tracker_id, positions):
+        self.checkpoints.update(positions)
+
+    def get_checkpoints(self, tracker_id, prefix):
+        return dict([(name, position)
+                     for name, position in self.checkpoints.items()
+                     if name.startswith(prefix)])
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FakeJiraBackend(JiraBackend):
+    """
+    Backend which does not need a connection to the server. It keeps
+    the keys of the issues stored and is interrupted after storing
+    C{stop_after} lists of issues.
+    """
+    def __init__(self, workers=1, stop_after=None):
+        self.projectName = 'PROJ'
+        self.fields = self.get_fields()
+        self.serverUrl = 'https://issues.example.com/jira'
+        self.workers = workers
+        self.stop_after = stop_after
+        self.stored = []
+
+    def analyze_bug_list(self, issues, url, bugsdb, dbtrk_id):
+        if self.stop_after is not None:
+            if self.stop_after == 0:
+                raise Interrupted()
+            self.stop_after -= 1
+        self.stored.extend([int(issue.key.split('-')[1]) for issue in issues])
+
+
+class JiraTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        self.backend = FakeJiraBackend()
+
+    def make_page(self, *dates):
+        return [FakeIssue(i, updated) for i, updated in enumerate(dates)]
+
+    def test_next_cursor(self):
+        issues = self.make_page('2013-01-01T10:00:12.000+0000',
+                                '2013-01-01T10:01:00.000+0000',
+                                '2013-01-01T10:01:45.000+0000')
+        self.assertEqual(self.backend.get_next_cursor(issues, None, 0),
+                         ('2013-01-01 10:01', 2))
+
+    def test_next_cursor_same_minute(self):
+        # The whole page was updated on the minute of the cursor, so
+        # the issues already retrieved are skipped too
+        issues = self.make_page('2013-01-01T10:01:00.000+0000',
+                                '2013-01-01T10:01:30.000+0000')
+        self.assertEqual(self.backend.get_next_cursor(issues,
+                                                      '2013-01-01 10:01', 4),
+                         ('2013-01-01 10:01', 6))
+
+    def test_jql(self):
+        self.assertEqual(self.backend.get_jql(),
+                         'project=PROJ order by updated asc, id asc')
+        self.assertEqual(self.backend.get_jql('2013-01-01 10:01'),
+                         'project=PROJ AND updated >= "2013-01-01 10:01" '
+                         'order by updated asc, id asc')
+
+
+    def test_fields(self):
+        self.assertEqual(self.backend.get_fields(),
+                         ','.join(ISSUE_FIELDS))
+        fields = self.backend.get_fields(' customfield_1, %s,'
+                                         % ISSUE_FIELDS[0])
+        self.assertEqual(fields.split(','),
+                         list(ISSUE_FIELDS) + ['customfield_1'])
+
+    def test_key_ranges(self):
+        nissues = KEYS_PER_RANGE * 2 + 10
+        jira = FakeJira(nissues, '2013-01-01T10:01:30.000+0000')
+        db = FakeDatabase()
+
+        ranges = self.backend.start_key_ranges(jira, db, 1)
+        self.assertEqual(ranges,
+                         [(1, KEYS_PER_RANGE + 1, False),
+                          (KEYS_PER_RANGE + 1, KEYS_PER_RANGE * 2 + 1, False),
+                          (KEYS_PER_RANGE * 2 + 1, nissues + 1, False)])
+        self.assertEqual(self.backend.get_stored_ranges(db, 1), ranges)
+        self.assertEqual(db.checkpoints[START_CHECKPOINT % 'PROJ'],
+                         '2013-01-01 10:01')
+
+    def test_no_key_ranges(self):
+        ranges = self.backend.start_key_ranges(FakeJira(0, None),
+                                               FakeDatabase(), 1)
+        self.assertEqual(ranges, [])
+
+    def test_resume_key_ranges(self):
+        nissues = KEYS_PER_RANGE * 5 + 10
+        jira = FakeJira(nissues, '2013-01-01T10:01:30.000+0000')
+        db = FakeDatabase()
+        backend = FakeJiraBackend(workers=4, stop_after=2)
+        ranges = backend.start_key_ranges(jira, db, 1)
+        pending = [(first, end) for first, end, done in ranges]
+        jira.threads.clear()
+        self.assertRaises(Interrupted, backend.analyze_key_ranges,
+                          jira, pending, 100, db, 1)
+
+        # Ranges are retrieved by the workers, but stored and
+        # checkpointed in order
+        self.assertTrue(threading.current_thread() not in jira.threads)
+        self.assertEqual(backend.stored, range(1, KEYS_PER_RANGE * 2 + 1))
+        self.assertEqual([done for first, end, done
+                          in backend.get_stored_ranges(db, 1)],
+                         [True, True, False, False, False, False])
+
+        # The next run retrieves only the ranges which were not stored
+        backend = FakeJiraBackend(workers=4)
+        pending = [(first, end) for first, end, done
+                   in backend.get_stored_ranges(db, 1) if not done]
+        nbugs = backend.analyze_key_ranges(jira, pending, 100, db, 1)
+        self.assertEqual(nbugs, nissues - KEYS_PER_RANGE * 2)
+        self.assertEqual(backend.stored,
+                         range(KEYS_PER_RANGE * 2 + 1, nissues + 1))
+        checkpoints = db.get_checkpoints(1, RANGE_CHECKPOINT % 'PROJ')
+        self.assertEqual(set(checkpoints.values()), set([RANGE_DONE]))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(JiraTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Tests of the Bugzilla backend, using the activity page and the history
+# of a bug recorded in the data/bugzilla/ directory, and of the walk over
+# the list of issues, alone and in concurrent shards, stored in a temporary
+# SQLite database. The size of the XML queries is tested too.
+
+import datetime, os, shutil, StringIO, sys, tempfile, threading, unittest
+import urlparse, xmlrpclib
+sys.path.insert(0, "..")
+from bicho.config import Config
+from bicho.backends.bg import LIST_CURSOR_CHECKPOINT, SHARD_CHECKPOINT, \
+    SHARD_DONE, VALUE_DESCS, \
+    ActivityHtmlParser, BGBackend, BugzillaIssue, DBBugzillaBackend, \
+    SoupHtmlParser, WebServiceActivityParser, XMLBatchSize, parse
+from bicho.common import People, Tracker
+from bicho.db.database import get_database
+from dateutil.tz import gettz
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'data', 'bugzilla')
+BUG_ID = '754321'
+TIMEZONE = 'America/New_York'
+
+# Names of the fields of the bug, as returned by Bug.fields
+FIELD_NAMES = {'assigned_to': u'Assignee',
+               'attachments.ispatch': u'Attachment is patch',
+               'blocked': u'Blocks',
+               'bug_status': u'Status',
+               'cc': u'CC',
+               'flagtypes.name': u'Flags',
+               'resolution': u'Resolution',
+               'status_whiteboard': u'Whiteboard',
+               'version': u'Version'}
+
+# Max number of results of a query, as set by some bugzillas
+MAX_SEARCH_RESULTS = 50
+
+
+def changes_to_tuples(changes):
+    return [(c.field, c.old_value, c.new_value, c.changed_by.user_id,
+             c.changed_by.email, c.changed_on) for c in changes]
+
+
+def read_activity():
+    return open(os.path.join(DATA_DIR, 'activity-4.2.html')).read()
+
+
+def read_history():
+    data = open(os.path.join(DATA_DIR, 'history-4.2.xml')).read()
+    response, method = xmlrpclib.loads(data, use_datetime=True)
+    return response[0]['bugs'][0]['history']
+
+
+class FakeBGBackend(BGBackend):
+    """
+    Backend which lists the issues of C{bugs}, a dict of modification
+    dates indexed by id, instead of querying a server. The issues
+    retrieved are stored in C{db}, when it is given.
+    """
+    def __init__(self, bugs, db=None, tracker=None):
+        self.url = 'http://bugzilla.example.com/buglist.cgi?product=test'
+        self.version = '4.2'
+        self.bugs = bugs
+        self.bugsdb = db
+        self.tracker = tracker
+        self.shards = 1
+        self.workers = 2
+        self.webservice = False
+        self.batch_size = XMLBatchSize(size=20)
+        self.retrieved = {}
+        # Id of the issue whose retrieval fails
+        self.broken = None
+        # Threads which stored issues
+        self.writers = set()
+
+    def _urlopen_auth(self, url, stream=False):
+        query = urlparse.parse_qs(urlparse.urlparse(url).query)
+        from_date = 'chfieldfrom' in query and parse(query['chfieldfrom'][0])
+        to_date = 'chfieldto' in query and parse(query['chfieldto'][0])
+
+        issues = sorted([(changed_on, bug_id)
+                         for bug_id, changed_on in self.bugs.items()
+                         if (not from_date or changed_on >= from_date) and
+                         (not to_date or changed_on <= to_date)])
+        lines = ['bug_id,...,changeddate']
+        for changed_on, bug_id in issues[:MAX_SEARCH_RESULTS]:
+            lines.append('%d,a,b,c,d,e,f,"%s"'
+                         % (bug_id, changed_on.strftime('%Y-%m-%d %H:%M:%S')))
+        return StringIO.StringIO('\n'.join(lines))
+
+    def _retrieve_issues_info(self, base_url, ids, callback=None):
+        for issue_id in ids:
+            if issue_id == self.broken:
+                raise IOError('Issue #%s not retrieved' % issue_id)
+            changed_on = self.bugs[int(issue_id)]
+            issue = BugzillaIssue(issue_id, 'bug', 'summary', 'description',
+                                  People('alice'), changed_on)
+            issue.set_delta_ts(changed_on)
+            callback(issue)
+
+    def _retrieve_issue_activity(self, base_url, id):
+        return []
+
+    def _store_retrieved_issues(self, issues, trk_id, checkpoints=None):
+        self.writers.add(threading.current_thread())
+        BGBackend._store_retrieved_issues(self, issues, trk_id, checkpoints)
+
+
+def make_bugs(nbugs=1000):
+    # Groups of bugs are modified on the same second, so results
+    # of a query are cut in the middle of them
+    start = datetime.datetime(2010, 1, 1)
+    bugs = {}
+    for i in range(1, nbugs + 1):
+        bugs[i] = start + datetime.timedelta(days=(i / 75) * 20,
+                                             minutes=i % 7)
+    return bugs
+
+
+class ActivityTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+
+    def test_webservice_parity(self):
+        html = read_activity()
+        expected = changes_to_tuples(
+            ActivityHtmlParser(html, BUG_ID).parse_changes())
+        self.assertEqual(len(expected), 10)
+        self.assertEqual(changes_to_tuples(
+            SoupHtmlParser(html, BUG_ID).parse_changes()), expected)
+
+        parser = WebServiceActivityParser(read_history(), BUG_ID,
+                                          FIELD_NAMES, gettz(TIMEZONE),
+                                          VALUE_DESCS)
+        self.assertEqual(changes_to_tuples(parser.parse_changes()), expected)
+
+    def test_activity_cells(self):
+        changes = ActivityHtmlParser(read_activity(), BUG_ID).parse_changes()
+        self.assertEqual(changes[2].old_value, u'&nbsp;')
+        self.assertEqual(changes[3].new_value, u'700001')
+        # Markup inside a value does not cut it
+        self.assertEqual(changes[4].new_value, u'[needs-info] &amp; triage')
+        # Neither the indentation of the page is kept in the fields
+        self.assertEqual(changes[5].field, u'Attachment #585858 Flags')
+        self.assertEqual(changes[6].field, u'Attachment #585858 is patch')
+        self.assertEqual(changes[9].old_value, u'---')
+
+    def test_daylight_saving_time(self):
+        history = [{'who': 'acs@example.org',
+                    'when': datetime.datetime(2013, month, 15, 15, 0),
+                    'changes': [{'field_name': 'version', 'removed': '6.2',
+                                 'added': '6.3'}]}
+                   for month in (1, 7)]
+        parser = WebServiceActivityParser(history, BUG_ID, FIELD_NAMES,
+                                          gettz(TIMEZONE))
+        winter, summer = parser.parse_changes()
+        self.assertEqual(winter.changed_on, datetime.datetime(2013, 1, 15, 10))
+        self.assertEqual(summer.changed_on, datetime.datetime(2013, 7, 15, 11))
+
+
+class WalkTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        self.bugs = make_bugs()
+
+    def walk(self, backend, from_date=None, until=None, cursor=None):
+        ids = []
+        for issues in backend._walk_issues_list(from_date, until, cursor):
+            ids.extend([str(issue_id) for changed_on, issue_id in issues])
+        return ids
+
+    def test_walk(self):
+        backend = FakeBGBackend(self.bugs)
+        ids = self.walk(backend)
+        self.assertEqual(sorted([int(i) for i in ids]),
+                         sorted(self.bugs.keys()))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_walk_until(self):
+        backend = FakeBGBackend(self.bugs)
+        until = datetime.datetime(2010, 6, 1)
+        ids = self.walk(backend, until=until)
+        self.assertEqual(sorted([int(i) for i in ids]),
+                         sorted([i for i, changed_on in self.bugs.items()
+                                 if changed_on < until]))
+
+    def test_walk_cursor(self):
+        backend = FakeBGBackend(self.bugs)
+        cursor = sorted([(d, i) for i, d in self.bugs.items()])[499]
+        ids = self.walk(backend, cursor[0], cursor=cursor)
+        self.assertEqual(len(ids), 500)
+        self.assertTrue(str(cursor[1]) not in ids)
+
+
+class CursorTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        Config.db_driver_out = 'sqlite'
+        self.tmp_dir = tempfile.mkdtemp()
+        Config.db_database_out = os.path.join(self.tmp_dir, 'bicho.db')
+
+        self.db = get_database(DBBugzillaBackend())
+        self.db.insert_supported_traker('bugzilla', '4.2')
+        self.tracker = self.db.insert_tracker(
+            Tracker('http://bugzilla.example.com', 'bugzilla', '4.2'))
+        self.bugs = make_bugs(300)
+        self.positions = sorted([(d, i) for i, d in self.bugs.items()])
+
+    def tearDown(self):
+        self.db.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_backend(self):
+        return FakeBGBackend(self.bugs, self.db, self.tracker)
+
+    def retrieve(self, backend):
+        cursor = backend._get_cursor()
+        from_date = cursor and cursor[0]
+        backend._retrieve_batches([backend._get_list_batches(from_date,
+                                                             cursor)],
+                                  backend.url, self.tracker.id)
+
+    def get_stored_ids(self):
+        result = self.db.store.execute('SELECT issue FROM issues')
+        return set([int(row[0]) for row in result])
+
+    def test_list_cursor(self):
+        backend = self.make_backend()
+        self.retrieve(backend)
+        self.assertEqual(self.get_stored_ids(), set(self.bugs.keys()))
+        checkpoints = self.db.get_checkpoints(self.tracker.id,
+                                              LIST_CURSOR_CHECKPOINT)
+        self.assertEqual(backend._str_to_cursor(
+            checkpoints[LIST_CURSOR_CHECKPOINT]), self.positions[-1])
+
+    def test_resume_list(self):
+        backend = self.make_backend()
+        backend.broken = str(self.positions[110][1])
+        self.assertRaises(IOError, self.retrieve, backend)
+
+        # Every issue up to the cursor was stored with it
+        cursor = backend._get_cursor()
+        nstored = self.positions.index(cursor) + 1
+        self.assertTrue(nstored <= 110)
+        self.assertTrue(set([i for d, i in self.positions[:nstored]])
+                        <= self.get_stored_ids())
+
+        # Issues stored after the cursor, like the ones retrieved by
+        # other means, are not taken as the position of the list
+        issue = BugzillaIssue('5000', 'bug', 'summary', 'description',
+                              People('alice'), datetime.datetime(2020, 1, 1))
+        issue.set_delta_ts(datetime.datetime(2020, 1, 1))
+        self.db.insert_issue(issue, self.tracker.id)
+        self.bugs[5000] = issue.delta_ts
+        self.assertEqual(backend._get_cursor(), cursor)
+
+        backend = self.make_backend()
+        self.retrieve(backend)
+        self.assertEqual(self.get_stored_ids(), set(self.bugs.keys()))
+
+    def spread_bugs(self):
+        # Bugs modified along the last years, so every shard has some
+        start = datetime.datetime.now().replace(microsecond=0) - \
+            datetime.timedelta(days=3100)
+        for i in self.bugs:
+            self.bugs[i] = start + datetime.timedelta(days=i * 10,
+                                                      minutes=i % 7)
+        self.positions = sorted([(d, i) for i, d in self.bugs.items()])
+
+    def test_shards(self):
+        self.spread_bugs()
+        backend = self.make_backend()
+        backend.shards = 4
+        backend._process_issues()
+
+        self.assertEqual(self.get_stored_ids(), set(self.bugs.keys()))
+        # Issues are only written by the calling thread
+        self.assertEqual(backend.writers, set([threading.current_thread()]))
+        self.assertEqual(self.db.get_checkpoints(self.tracker.id,
+                                                 SHARD_CHECKPOINT), {})
+        # The next runs go on from the end of the last shard
+        self.assertEqual(backend._get_cursor(), self.positions[-1])
+
+    def test_resume_shards(self):
+        self.spread_bugs()
+        backend = self.make_backend()
+        backend.shards = 4
+        backend.broken = str(self.positions[170][1])
+        self.assertRaises(IOError, backend._process_issues)
+
+        shards = backend._get_stored_shards()
+        self.assertEqual(len(shards), 4)
+        # The position of each shard was stored with its issues
+        stored = self.get_stored_ids()
+        for from_date, until, cursor in shards:
+            if cursor and cursor != SHARD_DONE:
+                self.assertTrue(cursor[1] in stored)
+
+        # A run which is not sharded resumes the interrupted shards
+        backend = self.make_backend()
+        backend._process_issues()
+        self.assertEqual(self.get_stored_ids(), set(self.bugs.keys()))
+        self.assertEqual(backend._get_stored_shards(), [])
+        self.assertEqual(backend._get_cursor(), self.positions[-1])
+
+
+class BatchSizeTest(unittest.TestCase):
+
+    def test_batch_size(self):
+        batch_size = XMLBatchSize(size=100, min_size=10, max_size=400,
+                                  target_time=10, max_bytes=1000000)
+        # Fast requests make it grow up to the max size
+        for i in range(10):
+            batch_size.update(batch_size.get(), 1.0, 1000)
+        self.assertEqual(batch_size.get(), 400)
+
+        # Requests which are too slow or too large are scaled down
+        batch_size.update(400, 20.0, 1000)
+        self.assertEqual(batch_size.get(), 200)
+        batch_size.update(200, 1.0, 4000000)
+        self.assertEqual(batch_size.get(), 50)
+
+        # Failed requests halve it, down to the min size
+        batch_size.shrink()
+        batch_size.shrink()
+        batch_size.shrink()
+        self.assertEqual(batch_size.get(), 10)
+        self.assertEqual(batch_size.requests, 12)
+        self.assertEqual(batch_size.errors, 3)
+
+
+if __name__ == '__main__':
+    for test in (ActivityTest, WalkTest, CursorTest, BatchSizeTest):
+        suite = unittest.TestLoader().loadTestsFromTestCase(test)
+        unittest.TextTestRunner(verbosity=2).run(suite)
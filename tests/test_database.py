@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Tests of the storage of issues, using a temporary SQLite database, and
+# of the statements run on PostgreSQL.
+
+import datetime, os, shutil, sys, tempfile, unittest
+sys.path.insert(0, "..")
+from bicho.config import Config
+from bicho.common import Tracker, Issue, People, Comment, Change
+from bicho.db.database import PeopleCache, content_hash, get_database
+from bicho.db.postgresql import DBPostgreSQL
+
+
+class DatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        Config.db_driver_out = 'sqlite'
+        self.tmp_dir = tempfile.mkdtemp()
+        Config.db_database_out = os.path.join(self.tmp_dir, 'bicho.db')
+
+        self.db = get_database()
+        self.db.insert_supported_traker('bg', '4.0')
+        self.tracker_id = self.db.insert_tracker(
+            Tracker('http://example.com', 'bg', '4.0')).id
+
+    def tearDown(self):
+        self.db.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_issue(self, issue_id='1'):
+        date = datetime.datetime(2013, 1, 1, 10, 30)
+        issue = Issue(issue_id, 'bug', 'summary', 'description',
+                      People('alice'), date)
+        issue.add_watcher(People('bob'))
+        issue.add_watcher(People('carol'))
+        issue.add_watcher(People('bob'))
+        issue.add_comment(Comment('a comment', People('bob'), date))
+        issue.add_change(Change('status', 'NEW', 'ASSIGNED',
+                                People('carol'), date))
+        return issue
+
+    def count(self, table):
+        return self.db.store.execute('SELECT COUNT(*) FROM %s'
+                                     % table).get_one()[0]
+
+    def check_counts(self):
+        self.assertEqual(self.count('issues'), 1)
+        self.assertEqual(self.count('people'), 3)
+        self.assertEqual(self.count('issues_watchers'), 2)
+        self.assertEqual(self.count('comments'), 1)
+        self.assertEqual(self.count('changes'), 1)
+
+    def test_bulk_issues(self):
+        self.db.bulk_insert = True
+        self.db.insert_issues([self.make_issue(str(i)) for i in range(3)],
+                              self.tracker_id)
+        self.assertEqual(self.count('issues'), 3)
+        self.assertEqual(self.count('people'), 3)
+        self.assertEqual(self.count('issues_watchers'), 6)
+        self.assertEqual(self.count('comments'), 3)
+        self.assertEqual(self.count('changes'), 3)
+
+    def test_reimport_bulk_issues(self):
+        self.db.insert_issue(self.make_issue(), self.tracker_id)
+        self.db.bulk_insert = True
+        self.db.insert_issues([self.make_issue()], self.tracker_id)
+        self.db.insert_issues([self.make_issue()], self.tracker_id)
+        self.check_counts()
+
+    def test_people_ids(self):
+        ids = self.db._get_people_ids([People('alice'), People('bob'),
+                                       People('alice')])
+        self.assertEqual(sorted(ids.keys()), [u'alice', u'bob'])
+        self.assertEqual(self.count('people'), 2)
+
+        # Cached and stored identities are not inserted again
+        self.db.people_cache.clear()
+        self.assertEqual(self.db._get_people_ids([People('bob')]),
+                         {u'bob': ids[u'bob']})
+        self.assertEqual(self.db.people_cache.get(u'bob'), ids[u'bob'])
+        self.assertEqual(self.count('people'), 2)
+
+    def test_people_cache(self):
+        cache = PeopleCache(2)
+        cache.set(u'alice', 1)
+        cache.set(u'bob', 2)
+        self.assertEqual(cache.get(u'alice'), 1)
+        # bob is the least recently used entry
+        cache.set(u'carol', 3)
+        self.assertEqual(cache.get(u'bob'), None)
+        self.assertEqual(cache.get(u'alice'), 1)
+        self.assertEqual(cache.get(u'carol'), 3)
+        cache.clear()
+        self.assertEqual(cache.get(u'alice'), None)
+
+    def test_backfill_hashes(self):
+        self.db.insert_issue(self.make_issue(), self.tracker_id)
+        self.db.store.execute('DROP INDEX comments_hash_idx')
+        self.db.store.execute('UPDATE comments SET hash = NULL')
+        self.db.store.commit()
+
+        self.db.upgrade_tables()
+        text, submitted_on, hash = self.db.store.execute(
+            'SELECT text, submitted_on, hash FROM comments').get_one()
+        self.assertEqual(hash, content_hash(text, submitted_on))
+
+        # Re-imported comments are found by their hash
+        self.db.insert_issue(self.make_issue(), self.tracker_id)
+        self.assertEqual(self.count('comments'), 1)
+
+    def test_reimport_issue(self):
+        self.db.insert_issue(self.make_issue(), self.tracker_id)
+        self.db.insert_issue(self.make_issue(), self.tracker_id)
+        self.check_counts()
+
+    def test_new_children_are_added(self):
+        self.db.insert_issue(self.make_issue(), self.tracker_id)
+        issue = self.make_issue()
+        issue.add_comment(Comment('another comment', People('dave'),
+                                  datetime.datetime(2013, 1, 2)))
+        self.db.insert_issue(issue, self.tracker_id)
+        self.assertEqual(self.count('comments'), 2)
+        self.assertEqual(self.count('people'), 4)
+
+    def test_checkpoints(self):
+        self.db.set_checkpoints(self.tracker_id, {u'test a': None,
+                                                  u'test b': u'1'})
+        self.db.set_checkpoint(self.tracker_id, u'test a', u'2')
+        self.db.set_checkpoint(self.tracker_id, u'other', u'3')
+        self.assertEqual(self.db.get_checkpoints(self.tracker_id, u'test '),
+                         {u'test a': u'2', u'test b': u'1'})
+        self.db.delete_checkpoints(self.tracker_id, u'test ')
+        self.assertEqual(self.db.get_checkpoints(self.tracker_id, u'test '),
+                         {})
+        self.assertEqual(self.db.get_checkpoints(self.tracker_id, u'other'),
+                         {u'other': u'3'})
+
+    def test_issues_checkpoints(self):
+        for bulk_insert in (False, True):
+            self.db.bulk_insert = bulk_insert
+            self.db.insert_issues([self.make_issue('1'), self.make_issue('2')],
+                                  self.tracker_id, {u'list': str(bulk_insert)})
+            self.assertEqual(self.db.get_checkpoints(self.tracker_id, u'list'),
+                             {u'list': unicode(bulk_insert)})
+        # Checkpoints are stored even when there are no issues
+        self.db.insert_issues([], self.tracker_id, {u'list': u'end'})
+        self.assertEqual(self.db.get_checkpoints(self.tracker_id, u'list'),
+                         {u'list': u'end'})
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get_all(self):
+        return self.rows
+
+
+class FakeStore:
+    """
+    Store which records the statements run and takes the identifiers
+    of the rows from C{sequence}
+    """
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.statements = []
+
+    def execute(self, sql, params=None, noresult=False):
+        self.statements.append((' '.join(sql.split()), params))
+        if sql.strip().startswith('SELECT nextval'):
+            return FakeResult([(i,) for i in self.sequence[:params[1]]])
+
+
+class FakePostgreSQL(DBPostgreSQL):
+    def __init__(self, store):
+        self.store = store
+
+
+class PostgreSQLTest(unittest.TestCase):
+
+    def test_insert_ids(self):
+        # Identifiers are not returned in order
+        store = FakeStore([12, 10, 11])
+        db = FakePostgreSQL(store)
+        rows = [(1, u'first'), (1, u'second'), (2, u'third')]
+        ids = db._execute_insert('comments', ('issue_id', 'text'), rows)
+
+        self.assertEqual(ids, [12, 10, 11])
+        sql, params = store.statements[-1]
+        self.assertEqual(sql, 'INSERT INTO comments (id, issue_id, text) '
+                         'VALUES (?, ?, ?), (?, ?, ?), (?, ?, ?)')
+        self.assertEqual(params, [12, 1, u'first', 10, 1, u'second',
+                                  11, 2, u'third'])
+
+
+if __name__ == '__main__':
+    for test in (DatabaseTest, PostgreSQLTest):
+        suite = unittest.TestLoader().loadTestsFromTestCase(test)
+        unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Tests of the helpers used by the Github backend and of the walk over its
+# listings, served by a server which listens on the loopback interface.
+
+import BaseHTTPServer, json, shutil, sys, tempfile, threading, unittest
+import urlparse
+sys.path.insert(0, "..")
+from bicho.config import Config
+import bicho.utils
+from bicho.backends.github import GithubBackend, GroupedItems
+
+API_URL = 'https://api.github.com/repos/owner/project/issues'
+PROJECT_PATH = '/repos/owner/project/issues'
+# Pages of the listing of comments and number of comments of each one
+NPAGES = 3
+PAGE_SIZE = 2
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the comments of the project in pages linked with the Link
+    header. Each page has its own ETag.
+    """
+
+    requests = []
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        page = int(urlparse.parse_qs(url.query).get('page', ['1'])[0])
+        etag = '"page%d"' % page
+        Handler.requests.append((page, self.headers.get('if-none-match')))
+
+        if self.headers.get('if-none-match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        comments = []
+        for i in range(PAGE_SIZE):
+            number = (page - 1) * PAGE_SIZE + i + 1
+            comments.append({'id': number,
+                             'issue_url': 'https://api.github.com%s/%d'
+                             % (PROJECT_PATH, number % 2 + 1)})
+        body = json.dumps(comments)
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if page < NPAGES:
+            next_url = 'http://%s:%d%s?per_page=%d&page=%d' \
+                % (self.server.server_address + (url.path, PAGE_SIZE,
+                                                 page + 1))
+            self.send_header('Link', '<%s>; rel="next"' % next_url)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGithubBackend(GithubBackend):
+    """
+    Backend which does not need credentials nor a connection
+    """
+    def __init__(self):
+        pass
+
+    def get_next_url(self, headers):
+        return self._GithubBackend__get_next_url(headers)
+
+
+class GithubTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        self.backend = FakeGithubBackend()
+
+    def test_next_url(self):
+        link = '<%s?page=2>; rel="next", <%s?page=5>; rel="last"' \
+            % (API_URL, API_URL)
+        self.assertEqual(self.backend.get_next_url({'link': link}),
+                         API_URL + '?page=2')
+
+        link = '<%s?page=4>; rel="prev", <%s?page=6>; rel="next"' \
+            % (API_URL, API_URL)
+        self.assertEqual(self.backend.get_next_url({'link': link}),
+                         API_URL + '?page=6')
+
+    def test_last_page(self):
+        link = '<%s?page=1>; rel="first", <%s?page=4>; rel="prev"' \
+            % (API_URL, API_URL)
+        self.assertEqual(self.backend.get_next_url({'link': link}), None)
+        self.assertEqual(self.backend.get_next_url({}), None)
+
+    def test_grouped_items(self):
+        grouped = GroupedItems()
+        grouped.add(1, {'id': 1, 'body': u'first'})
+        grouped.add(2, {'id': 2, 'body': u'other issue'})
+        grouped.add(1, {'id': 3, 'body': u'second ñ'})
+
+        self.assertEqual(len(grouped), 2)
+        self.assertEqual([item['id'] for item in grouped.get(1)], [1, 3])
+        self.assertEqual(grouped.get(1)[1]['body'], u'second ñ')
+        self.assertEqual(grouped.get(3), [])
+        grouped.close()
+
+
+class ListingTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        Handler.requests = []
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        # --cache-size is not given
+        if hasattr(Config, 'cache_size'):
+            del Config.cache_size
+        self.cache_dir = tempfile.mkdtemp()
+        Config.path = self.cache_dir
+        Config.url = 'http://127.0.0.1:%d%s' % (self.server.server_port,
+                                                PROJECT_PATH)
+        Config.delay = 0
+        Config.backend_user = 'alice'
+        Config.backend_password = 'secret'
+        bicho.utils._http_session = None
+        bicho.utils._rate_limiter = None
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        bicho.utils._http_session = None
+        del Config.cache_size
+        del Config.path
+        shutil.rmtree(self.cache_dir)
+
+    def get_comments(self, backend):
+        grouped = backend._GithubBackend__get_bulk_comments()
+        comments = [(number, [c['id'] for c in grouped.get(number)])
+                    for number in (1, 2)]
+        grouped.close()
+        return comments
+
+    def make_backend(self):
+        backend = GithubBackend()
+        bicho.utils.get_http_session().proxies = {}
+        return backend
+
+    def test_pages(self):
+        comments = self.get_comments(self.make_backend())
+        self.assertEqual(comments, [(1, [2, 4, 6]), (2, [1, 3, 5])])
+        self.assertEqual([page for page, etag in Handler.requests],
+                         range(1, NPAGES + 1))
+
+    def test_not_modified(self):
+        backend = self.make_backend()
+        expected = self.get_comments(backend)
+        Handler.requests = []
+
+        # Pages already seen are not downloaded again, not even by the
+        # next run
+        bicho.utils._http_session = None
+        self.assertEqual(self.get_comments(self.make_backend()), expected)
+        self.assertEqual(Handler.requests,
+                         [(page, '"page%d"' % page)
+                          for page in range(1, NPAGES + 1)])
+
+
+if __name__ == '__main__':
+    for test in (GithubTest, ListingTest):
+        suite = unittest.TestLoader().loadTestsFromTestCase(test)
+        unittest.TextTestRunner(verbosity=2).run(suite)
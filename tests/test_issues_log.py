@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Tests of the tables of the issues log under the InnoDB engine, which
+# enforces their foreign keys.
+#
+# The tables are also created on a MySQL server when one is available.
+# Change "root" and "" below to your database username and password.
+
+import re, sys, unittest
+sys.path.insert(0, "..")
+from bicho.config import Config
+from bicho.db import mysql
+from bicho.post_processing import issues_log_bg, issues_log_gerrit, \
+    issues_log_jira, issues_log_lp, issues_log_redmine
+
+DB_USER = 'root'
+DB_PASSWORD = ''
+DB_NAME = 'bicho_test_issues_log'
+
+LOG_MODULES = (issues_log_bg, issues_log_gerrit, issues_log_jira,
+               issues_log_lp, issues_log_redmine)
+
+PARENT_TABLES = {'people': mysql.DBPeopleMySQL,
+                 'trackers': mysql.DBTrackerMySQL,
+                 'changes': mysql.DBChangeMySQL}
+
+
+def get_sql(cls_or_module):
+    return ' '.join(cls_or_module.__sql_table__.split())
+
+
+def get_column(sql, name):
+    """
+    Return the type of the given column and whether it is nullable
+    """
+    match = re.search(r'[(,] %s (INTEGER(?: UNSIGNED)?)( NOT NULL)?' % name,
+                      sql)
+    return match.group(1), match.group(2) is None
+
+
+def get_foreign_keys(sql):
+    """
+    Return the column, the referenced table and column and the actions
+    of each foreign key
+    """
+    return re.findall(r'FOREIGN KEY\((\w+)\) REFERENCES (\w+)\((\w+)\)'
+                      r'((?: ON (?:DELETE|UPDATE) (?:SET NULL|CASCADE))*)',
+                      sql)
+
+
+class IssuesLogTest(unittest.TestCase):
+
+    def test_foreign_keys(self):
+        for module in LOG_MODULES:
+            sql = get_sql(module)
+            foreign_keys = get_foreign_keys(sql)
+            self.assertTrue(foreign_keys)
+
+            for column, table, parent_column, actions in foreign_keys:
+                col_type, nullable = get_column(sql, column)
+                parent_type, parent_nullable = \
+                    get_column(get_sql(PARENT_TABLES[table]), parent_column)
+                self.assertEqual(col_type, parent_type,
+                                 '%s.%s' % (module.__name__, column))
+                if 'SET NULL' in actions:
+                    self.assertTrue(nullable,
+                                    '%s.%s' % (module.__name__, column))
+
+    def test_create_tables_innodb(self):
+        try:
+            import MySQLdb
+            conn = MySQLdb.connect(user=DB_USER, passwd=DB_PASSWORD)
+        except Exception, e:
+            self.skipTest('MySQL server not available: %s' % e)
+        conn.cursor().execute('CREATE DATABASE IF NOT EXISTS %s' % DB_NAME)
+
+        Config.db_driver_out = 'mysql'
+        Config.db_user_out = DB_USER
+        Config.db_password_out = DB_PASSWORD
+        Config.db_hostname_out = 'localhost'
+        Config.db_port_out = None
+        Config.db_database_out = DB_NAME
+        Config.db_engine_out = 'InnoDB'
+        try:
+            from bicho.db.database import get_database
+            db = get_database()
+            for module in LOG_MODULES:
+                db.store.execute(module.__sql_table__ % {'engine': 'InnoDB'})
+            db.store.commit()
+            db.store.close()
+        finally:
+            conn.cursor().execute('DROP DATABASE %s' % DB_NAME)
+            conn.close()
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(IssuesLogTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
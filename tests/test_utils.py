@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2013 GSyC/LibreSoft, Universidad Rey Juan Carlos
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Tests of the helpers of bicho.utils. The HTTP session and its cache are
+# tested using a server which listens on the loopback interface.
+
+import BaseHTTPServer, gzip, httplib, shutil, SocketServer, StringIO, sys
+import tempfile, threading, time, unittest
+sys.path.insert(0, "..")
+from bicho.config import Config
+import bicho.utils
+from bicho.utils import HTTPCache, HTTPSession, RateLimiter, \
+    get_rate_limiter, wait_delay
+
+ETAG = '"v1"'
+BODY = 'issues' * 100
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        Handler.requests.append((self.path, dict(self.headers),
+                                 self.client_address))
+        if self.path.endswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/issues')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('if-none-match') == ETAG:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = BODY
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        if self.path.endswith('/login'):
+            self.send_header('Set-Cookie', 'session=1; Path=/')
+        if 'gzip' in self.headers.get('accept-encoding', ''):
+            buf = StringIO.StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_headers(raw):
+    return httplib.HTTPMessage(StringIO.StringIO(raw + '\r\n'))
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+
+    def tearDown(self):
+        Config.rate = None
+        Config.delay = None
+        bicho.utils._rate_limiter = None
+
+    def test_burst(self):
+        limiter = RateLimiter(5, burst=3)
+        start = time.time()
+        for i in range(3):
+            limiter.wait()
+        self.assertTrue(time.time() - start < 0.1)
+        limiter.wait()
+        self.assertTrue(time.time() - start >= 0.15)
+
+    def test_no_limit(self):
+        limiter = RateLimiter(None)
+        start = time.time()
+        for i in range(100):
+            limiter.wait()
+        self.assertTrue(time.time() - start < 0.1)
+
+    def test_retry_after(self):
+        limiter = RateLimiter(None)
+        limiter.update({'retry-after': '10'})
+        self.assertTrue(limiter.paused_until >= time.time() + 9)
+
+    def test_quota_exhausted(self):
+        limiter = RateLimiter(None)
+        reset = int(time.time()) + 60
+        limiter.update({'x-ratelimit-remaining': '10',
+                        'x-ratelimit-reset': str(reset)})
+        self.assertEqual(limiter.paused_until, 0)
+        limiter.update({'x-ratelimit-remaining': '0',
+                        'x-ratelimit-reset': str(reset)})
+        self.assertEqual(limiter.paused_until, reset + 1)
+
+    def test_default_rate(self):
+        # Requests are not limited by --delay
+        Config.rate = None
+        Config.delay = 5
+        bicho.utils._rate_limiter = None
+        self.assertEqual(get_rate_limiter().rate, None)
+
+    def test_wait_delay(self):
+        Config.rate = None
+        Config.delay = 1
+        start = time.time()
+        wait_delay()
+        self.assertTrue(time.time() - start >= 1)
+
+    def test_wait_delay_rate(self):
+        # The delay is not waited when the rate is limited
+        Config.rate = 100.0
+        Config.burst = 2
+        Config.delay = 5
+        bicho.utils._rate_limiter = None
+        start = time.time()
+        wait_delay()
+        wait_delay(limit_rate=True)
+        self.assertTrue(time.time() - start < 0.1)
+        self.assertTrue(get_rate_limiter().tokens < 1.1)
+
+
+class HTTPCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_store(self):
+        cache = HTTPCache(self.cache_dir, 1024 * 1024)
+        key = cache.get_key('http://example.com/a')
+        self.assertEqual(cache.get(key), None)
+
+        cache.store(key, 'http://example.com/a',
+                    make_headers('ETag: "x"\r\nSet-Cookie: a=b\r\n'), BODY)
+        metadata, body = cache.get(key)
+        self.assertEqual(body, BODY)
+        self.assertEqual(metadata['etag'], '"x"')
+        self.assertTrue('Set-Cookie' not in metadata['headers'])
+
+        # Entries are loaded again from disk
+        cache = HTTPCache(self.cache_dir, 1024 * 1024)
+        self.assertEqual(cache.get(key)[1], BODY)
+
+    def test_keys(self):
+        cache = HTTPCache(self.cache_dir, 1024 * 1024)
+        url = 'http://example.com/a'
+        self.assertNotEqual(cache.get_key(url), cache.get_key(url, 'a=b'))
+        self.assertNotEqual(cache.get_key(url, 'a=b'),
+                            cache.get_key(url, 'a=c'))
+
+    def test_evict(self):
+        cache = HTTPCache(self.cache_dir, 1024 * 1024)
+        key = cache.get_key('http://example.com/0')
+        cache.store(key, 'http://example.com/0', make_headers(''), 'x')
+        entry_size = cache.size
+
+        # Room for three entries and a half
+        cache = HTTPCache(self.cache_dir, entry_size * 7 / 2)
+        keys = [key]
+        for i in range(1, 4):
+            url = 'http://example.com/%d' % i
+            keys.append(cache.get_key(url))
+            cache.store(keys[-1], url, make_headers(''), 'x')
+            if i == 2:
+                cache.get(keys[0])
+
+        # The cache is full after the fourth entry, so the least
+        # recently used one is removed
+        self.assertEqual(len(cache.entries), 3)
+        self.assertNotEqual(cache.get(keys[0]), None)
+        self.assertEqual(cache.get(keys[1]), None)
+        self.assertNotEqual(cache.get(keys[2]), None)
+        self.assertNotEqual(cache.get(keys[3]), None)
+
+
+class HTTPSessionTest(unittest.TestCase):
+
+    @staticmethod
+    def setUpServer():
+        server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def setUp(self):
+        Config.debug = False
+        Config.quiet = True
+        bicho.utils._rate_limiter = RateLimiter(None)
+        Handler.requests = []
+        self.server = HTTPSessionTest.setUpServer()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.url = self.base_url + '/issues'
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        bicho.utils._rate_limiter = None
+        shutil.rmtree(self.cache_dir)
+
+    def open_session(self, cache_size=None):
+        cache = None
+        if cache_size:
+            cache = HTTPCache(self.cache_dir, cache_size)
+        session = HTTPSession(cache)
+        session.proxies = {}
+        return session
+
+    def test_keep_alive(self):
+        session = self.open_session()
+        for i in range(3):
+            self.assertEqual(session.open(self.url).read(), BODY)
+        # The three requests are sent over the same connection
+        clients = set([client for path, headers, client in Handler.requests])
+        self.assertEqual(len(Handler.requests), 3)
+        self.assertEqual(len(clients), 1)
+
+    def test_gzip(self):
+        session = self.open_session()
+        f = session.open(self.url)
+        self.assertEqual(f.read(), BODY)
+        self.assertEqual(f.info().getheader('content-encoding'), 'gzip')
+
+    def test_redirect(self):
+        session = self.open_session()
+        f = session.open(self.base_url + '/redirect')
+        self.assertEqual(f.read(), BODY)
+        self.assertEqual(f.geturl(), self.url)
+
+    def test_auth_and_cookies(self):
+        session = self.open_session()
+        session.set_auth('alice', 'secret')
+        session.open(self.base_url + '/login').read()
+        session.open(self.url).read()
+        headers = Handler.requests[1][1]
+        self.assertEqual(headers['authorization'], 'Basic YWxpY2U6c2VjcmV0')
+        self.assertEqual(headers['cookie'], 'session=1')
+
+    def test_proxy(self):
+        session = self.open_session()
+        session.proxies = {'http': self.base_url}
+        url = 'http://tracker.example.com/issues'
+        self.assertEqual(session.open(url).read(), BODY)
+        # Plain HTTP requests are sent to the proxy with the absolute URL
+        self.assertEqual(Handler.requests[0][0], url)
+
+    def test_revalidate(self):
+        session = self.open_session(1024 * 1024)
+        self.assertEqual(session.open(self.url).read(), BODY)
+        f = session.open(self.url)
+        self.assertEqual(f.read(), BODY)
+        self.assertEqual(f.info().getheader('etag'), ETAG)
+
+        self.assertEqual(len(Handler.requests), 2)
+        self.assertTrue('if-none-match' not in Handler.requests[0][1])
+        self.assertEqual(Handler.requests[1][1]['if-none-match'], ETAG)
+
+    def test_stream(self):
+        session = self.open_session(1024 * 1024)
+        f = session.open(self.url, stream=True)
+        self.assertEqual(f.read(), BODY)
+        f.close()
+        # The streamed body was stored in the cache while it was read
+        f = session.open(self.url, stream=True)
+        self.assertEqual(f.read(), BODY)
+        self.assertEqual(Handler.requests[1][1]['if-none-match'], ETAG)
+
+    def test_replay(self):
+        session = self.open_session(1024 * 1024)
+        session.open(self.url).read()
+        session.cache.replay = True
+        self.assertEqual(session.open(self.url).read(), BODY)
+        self.assertEqual(len(Handler.requests), 1)
+
+    def test_cookies(self):
+        session = self.open_session(1024 * 1024)
+        session.open(self.url).read()
+        session.open(self.url, headers={'Cookie': 'user=a'}).read()
+        # Responses for other users are not revalidated
+        self.assertTrue('if-none-match' not in Handler.requests[1][1])
+
+
+if __name__ == '__main__':
+    for test in (RateLimiterTest, HTTPCacheTest, HTTPSessionTest):
+        suite = unittest.TestLoader().loadTestsFromTestCase(test)
+        unittest.TextTestRunner(verbosity=2).run(suite)